@@ -4,7 +4,6 @@
 # Attribution: https://github.com/rogerdahl/ssd1306/blob/master/examples/bounce.py
 
 # Stdlib.
-import time
 import random
 
 from demo_opts import device
@@ -46,26 +45,15 @@ def main():
     colors = ["red", "orange", "yellow", "green", "blue", "magenta"]
     balls = [Ball(device.width, device.height, i * 1.5, colors[i % 6]) for i in range(10)]
 
-    frame_count = 0
-    fps = ""
-    canvas = oled.render.canvas(device)
+    def render(draw, t):
+        draw.rectangle(device.bounding_box, outline="white", fill="black")
+        for b in balls:
+            b.update_pos()
+            b.draw(draw)
+        draw.text((2, 0), "FPS: {0:0.3f}".format(loop.fps), fill="white")
 
-    start_time = time.time()
-    last_time = time.time()
-
-    while True:
-        frame_count += 1
-        with canvas as c:
-            c.rectangle(device.bounding_box, outline="white", fill="black")
-            for b in balls:
-                b.update_pos()
-                b.draw(c)
-                c.text((2, 0), fps, fill="white")
-
-                now = time.time()
-                if now - last_time > 1:
-                    last_time = now
-                    fps = "FPS: {0:0.3f}".format(frame_count / (now - start_time))
+    loop = oled.render.frame_loop(device, render, fps=30)
+    loop.run()
 
 
 if __name__ == '__main__':
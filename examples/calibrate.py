@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+
+# Finds the fastest SPI clock rate at which the display works, and saves it
+# so that the other examples use it. Run with --interface spi.
+
+from demo_opts import device
+from oled import calibration
+
+
+def looks_right(device, speed_hz):
+    answer = input("At %d Hz, did the patterns look right? [Y/n] " % speed_hz)
+    return not answer.strip().lower().startswith("n")
+
+
+report = calibration.calibrate(device, validator=looks_right,
+                               settings=calibration.settings())
+for result in report.results:
+    print("%9d Hz: %s, %d bytes/s" % (result.speed_hz,
+                                      "stable" if result.stable else "failed",
+                                      result.throughput))
+print("Using %s Hz" % report.speed_hz)
@@ -1,4 +1,5 @@
 import argparse
+import oled.calibration
 import oled.device
 import oled.emulator
 import oled.serial
@@ -13,7 +14,7 @@ parser.add_argument('--i2c-port', type=int, default=1, help='I2C bus number')
 parser.add_argument('--i2c-address', type=str, default='0x3C', help='I2C display address')
 parser.add_argument('--spi-port', type=int, default=0, help='SPI port number')
 parser.add_argument('--spi-device', type=int, default=0, help='SPI device')
-parser.add_argument('--spi-bus-speed', type=int, default=8000000, help='SPI max bus speed (Hz)')
+parser.add_argument('--spi-bus-speed', type=int, help='SPI max bus speed (Hz), defaults to the calibrated speed or 8000000')
 parser.add_argument('--bcm-data-command', type=int, default=24, help='BCM pin for D/C RESET (SPI devices only)')
 parser.add_argument('--bcm-reset', type=int, default=25, help='BCM pin for RESET (SPI devices only)')
 parser.add_argument('--transform', type=str, default="scale2x", help='Scaling transform to apply, one of: none, identity, scale2x, smoothscale (emulator only)')
@@ -37,6 +38,9 @@ if args.display in ('ssd1306', 'sh1106'):
     if (args.interface == 'i2c'):
         serial = oled.serial.i2c(port=args.i2c_port, address=args.i2c_address)
     elif (args.interface == 'spi'):
+        if args.spi_bus_speed is None:
+            key = 'spi:%d:%d' % (args.spi_port, args.spi_device)
+            args.spi_bus_speed = oled.calibration.settings().get(key, 8000000)
         serial = oled.serial.spi(port=args.spi_port,
                                  device=args.spi_device,
                                  bus_speed_hz=args.spi_bus_speed,
@@ -7,7 +7,7 @@
 
 import time
 from demo_opts import device
-from oled.render import canvas
+from oled.render import persistent_canvas
 from random import randrange
 
 NORTH = 1
@@ -138,10 +138,11 @@ class Maze(object):
 
 def demo(iterations):
     screen = (128, 64)
+    frame = persistent_canvas(device)
     for loop in range(iterations):
         for scale in [2, 3, 4, 3]:
             sz = list(map(lambda z: z // scale - 1, screen))
-            with canvas(device) as draw:
+            with frame as draw:
                 Maze(sz).render(draw, lambda z: int(z * scale))
                 time.sleep(1)
 
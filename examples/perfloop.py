@@ -7,16 +7,17 @@ import time
 from PIL import Image, ImageDraw
 
 from demo_opts import device
+from oled.render import clock
 import demo
 
 
 class Timer:
     def __enter__(self):
-        self.start = time.clock()
+        self.start = clock()
         return self
 
     def __exit__(self, *args):
-        self.end = time.clock()
+        self.end = clock()
         self.interval = self.end - self.start
 
 
@@ -37,6 +38,9 @@ def main():
 
     try:
         while True:
+            # the same frame would otherwise be skipped, so have it sent
+            # in full every time
+            device.invalidate()
             with Timer() as t:
                 device.display(image)
 
@@ -16,7 +16,7 @@ if os.name != 'posix':
 import psutil
 
 from demo_opts import device
-from oled.render import canvas
+from oled.render import persistent_canvas
 from PIL import ImageFont
 
 # TODO: custom font bitmaps for up/down arrows
@@ -67,13 +67,13 @@ def network(iface):
            (iface, bytes2human(stat.bytes_sent), bytes2human(stat.bytes_recv))
 
 
-def stats(oled):
+def stats(frame):
     # use custom font
     font_path = os.path.abspath(os.path.join(os.path.dirname(__file__),
         'fonts', 'C&C Red Alert [INET].ttf'))
     font2 = ImageFont.truetype(font_path, 12)
 
-    with canvas(oled) as draw:
+    with frame as draw:
         draw.text((0, 0), cpu_usage(), font=font2, fill="white")
         draw.text((0, 14), mem_usage(), font=font2, fill="white")
         draw.text((0, 26), disk_usage('/'), font=font2, fill="white")
@@ -85,8 +85,9 @@ def stats(oled):
 
 
 def main():
+    frame = persistent_canvas(device)
     while True:
-        stats(device)
+        stats(frame)
         time.sleep(5)
 
 
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Richard Hull
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Example usage (Python 3.5+):
+#
+#   from oled import aio
+#
+#   device = aio.device(ssd1306(serial))
+#
+#   async def update(text):
+#       async with aio.canvas(device) as draw:
+#           draw.text((0, 0), text, fill="white")
+#
+# The bus transfers are run on an executor, so they don't hold up the event
+# loop. This module avoids the async/await syntax so that it can still be
+# byte-compiled by older versions of python, where it is simply not used.
+
+import asyncio
+import collections
+import functools
+
+import oled.emulator
+import oled.render
+
+
+class device(object):
+    """
+    Wraps a device so that its methods can be awaited from an asyncio event
+    loop: each method call returns a future, and the call itself is run on
+    an executor (the event loop's default executor if none is given).
+
+    Calls are run in order, one at a time. A frame passed to
+    :func:`display` while another is in flight waits its turn; if a newer
+    frame then arrives, the waiting frame is dropped in its favour, and
+    the futures of both are completed once the newer frame has been sent.
+    The number of frames sent and dropped are counted in the ``sent`` and
+    ``dropped`` attributes.
+    """
+    def __init__(self, device, executor=None):
+        self._device = device
+        self._executor = executor
+        self._queue = collections.deque()
+        self._busy = False
+        self.sent = 0
+        self.dropped = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._device, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            # run_in_executor only passes on positional arguments
+            fn = functools.partial(attr, **kwargs) if kwargs else attr
+            return self._submit(fn, args)
+
+        return call
+
+    @property
+    def device(self):
+        """
+        The wrapped device.
+        """
+        return self._device
+
+    def display(self, image):
+        """
+        Displays a copy of the image (or numpy array), replacing any frame
+        which is still waiting to be sent. Returns a future which completes
+        once the frame, or the one which replaced it, has been sent.
+        """
+        return self._submit(self._device.display, (image.copy(),), True)
+
+    def display_raw(self, buf):
+        """
+        As :func:`display`, but for a frame which is already packed.
+        """
+        return self._submit(self._device.display_raw, (bytearray(buf),), True)
+
+    def display_region(self, image, box):
+        """
+        Displays a copy of the image at the given box. Returns a future.
+        """
+        return self._submit(self._device.display_region, (image.copy(), box))
+
+    def _submit(self, fn, args, frame=False):
+        loop = asyncio.get_event_loop()
+        waiter = asyncio.Future(loop=loop)
+        if frame and self._queue and self._queue[-1][3]:
+            # a newer frame supersedes the one still waiting to be sent
+            pending = self._queue[-1]
+            pending[0], pending[1] = fn, args
+            pending[2].append(waiter)
+            self.dropped += 1
+        else:
+            self._queue.append([fn, args, [waiter], frame])
+
+        if not self._busy:
+            self._next(loop)
+        return waiter
+
+    def _next(self, loop):
+        if not self._queue:
+            self._busy = False
+            return
+
+        self._busy = True
+        fn, args, waiters, frame = self._queue.popleft()
+        future = loop.run_in_executor(self._executor, fn, *args)
+        future.add_done_callback(functools.partial(self._done, loop, waiters, frame))
+
+    def _done(self, loop, waiters, frame, future):
+        if future.cancelled():
+            error = asyncio.CancelledError()
+        else:
+            error = future.exception()
+
+        for waiter in waiters:
+            if waiter.cancelled():
+                continue
+            if error is None:
+                waiter.set_result(future.result())
+            else:
+                waiter.set_exception(error)
+
+        if frame and error is None:
+            self.sent += 1
+        self._next(loop)
+
+
+class canvas(oled.render.canvas):
+    """
+    An asynchronous canvas, for use with an :class:`oled.aio.device`::
+
+        async with canvas(device) as draw:
+            draw.text((0, 0), "Hello World", fill="white")
+
+    The with-block completes once the frame has been sent to the device,
+    without blocking the event loop in the meantime.
+    """
+    def __aenter__(self):
+        return _completed(self.__enter__())
+
+    def __aexit__(self, type, value, traceback):
+        if type is None:
+            future = self.device.display(self.image)
+        else:
+            future = _completed(False)
+
+        del self.draw   # Tidy up the resources
+        return future
+
+
+class capture(device):
+    """
+    An asynchronous :class:`oled.emulator.capture` device.
+    """
+    def __init__(self, executor=None, **kwargs):
+        super(capture, self).__init__(oled.emulator.capture(**kwargs), executor)
+
+
+class gifanim(device):
+    """
+    An asynchronous :class:`oled.emulator.gifanim` device.
+    """
+    def __init__(self, executor=None, **kwargs):
+        super(gifanim, self).__init__(oled.emulator.gifanim(**kwargs), executor)
+
+
+class pygame(device):
+    """
+    An asynchronous :class:`oled.emulator.pygame` device.
+    """
+    def __init__(self, executor=None, **kwargs):
+        super(pygame, self).__init__(oled.emulator.pygame(**kwargs), executor)
+
+
+def _completed(result):
+    future = asyncio.Future(loop=asyncio.get_event_loop())
+    future.set_result(result)
+    return future
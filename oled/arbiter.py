@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Richard Hull
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Example usage:
+#
+#   from oled.arbiter import arbiter
+#
+#   bus = arbiter(port=1)
+#   device = ssd1306(i2c(bus=bus.client("oled", priority=10, chunk=1),
+#                        max_message_size=256))
+#   imu = bus.client("imu", priority=0, max_wait=0.005)
+#   imu.read_i2c_block_data(0x68, 0x3B, 14)
+#
+# Each method call made through a client is a transaction which has the bus
+# to itself. When several clients are waiting for the bus, it goes to the
+# most urgent (lowest priority number) first, unless a client has waited
+# longer than its latency bound. Splitting a frame into several messages,
+# each a transaction of its own, lets sensor reads in between them.
+
+import itertools
+import threading
+import time
+
+clock = getattr(time, "monotonic", time.time)
+
+
+class arbiter(object):
+    """
+    Shares an I2C bus between several clients, such as a display and some
+    sensors, each of which gets its own bus-like object from
+    :func:`client`.
+    """
+    def __init__(self, bus=None, port=1):
+        if bus is None:
+            import smbus2
+            bus = smbus2.SMBus(port)
+        self._bus = bus
+        self._condition = threading.Condition()
+        self._counter = itertools.count()
+        self._waiting = []
+        self._owner = None
+        self.clients = {}
+
+    def client(self, name, priority=0, max_wait=None, chunk=None):
+        """
+        Returns a bus-like object for a named client, which may be passed
+        as the ``bus`` of an :class:`oled.serial.i2c` interface, or used
+        for direct SMBus calls. Clients with a lower ``priority`` number get
+        the bus first, but a client which has waited for more than
+        ``max_wait`` seconds goes ahead of them. If ``chunk`` is given, the
+        messages of each ``i2c_rdwr`` call are sent as separate
+        transactions of at most that many messages.
+        """
+        assert(name not in self.clients)
+        self.clients[name] = client(self, name, priority, max_wait, chunk)
+        return self.clients[name]
+
+    def statistics(self):
+        """
+        Returns the statistics for each client, by name.
+        """
+        return dict((name, c.stats) for name, c in self.clients.items())
+
+    def close(self):
+        """
+        Closes the underlying bus.
+        """
+        self._bus.close()
+
+    def _transaction(self, client, fn, args):
+        requested = clock()
+        ticket = (client, next(self._counter), requested)
+        with self._condition:
+            self._waiting.append(ticket)
+            if self._owner is None:
+                self._next()
+            while self._owner is not ticket:
+                self._condition.wait()
+
+        started = clock()
+        try:
+            return fn(*args)
+        finally:
+            finished = clock()
+            with self._condition:
+                client.stats.record(started - requested, finished - started)
+                self._owner = None
+                self._next()
+
+    def _next(self):
+        """
+        Hands the bus to the next waiting transaction: the one furthest past
+        its client's latency bound or, if none are, the most urgent.
+        """
+        if not self._waiting:
+            return
+
+        now = clock()
+        overdue = [t for t in self._waiting
+                   if t[0].max_wait is not None and now - t[2] > t[0].max_wait]
+        if overdue:
+            ticket = min(overdue, key=lambda t: t[2] + t[0].max_wait)
+        else:
+            ticket = min(self._waiting, key=lambda t: (t[0].priority, t[1]))
+
+        self._waiting.remove(ticket)
+        self._owner = ticket
+        self._condition.notify_all()
+
+
+class client(object):
+    """
+    A bus-like object through which a client of an :class:`arbiter` makes
+    its transactions. Any SMBus method may be called on it.
+    """
+    def __init__(self, arbiter, name, priority=0, max_wait=None, chunk=None):
+        self._arbiter = arbiter
+        self.name = name
+        self.priority = priority
+        self.max_wait = max_wait
+        self.chunk = chunk
+        self.stats = statistics()
+
+    def __getattr__(self, name):
+        fn = getattr(self._arbiter._bus, name)
+
+        def transaction(*args):
+            return self._arbiter._transaction(self, fn, args)
+
+        return transaction
+
+    @property
+    def max_messages(self):
+        """
+        The most messages sent in one transaction (``None`` if there is no
+        limit), by which an :class:`oled.serial.i2c` interface splits up
+        its writes.
+        """
+        return self.chunk
+
+    def i2c_rdwr(self, *msgs):
+        """
+        Sends the messages as one transaction or, if the client has a
+        ``chunk`` size, as several.
+        """
+        fn = self._arbiter._bus.i2c_rdwr
+        size = self.chunk or len(msgs)
+        for i in range(0, len(msgs), size):
+            self._arbiter._transaction(self, fn, msgs[i:i + size])
+
+    def close(self):
+        """
+        Does nothing: the bus is shared, so is closed by the arbiter.
+        """
+        pass
+
+
+class statistics(object):
+    """
+    Counts the transactions made by a client, the time spent waiting for
+    the bus, and the time spent using it (all in seconds).
+    """
+    def __init__(self):
+        self.transactions = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.busy_time = 0.0
+
+    def record(self, wait, busy):
+        self.transactions += 1
+        self.wait_time += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.busy_time += busy
+
+    @property
+    def mean_wait(self):
+        return self.wait_time / self.transactions if self.transactions else 0.0
+
+    def __repr__(self):
+        return "statistics(transactions={0}, mean_wait={1:.6f}, max_wait={2:.6f}, busy_time={3:.6f})".format(
+            self.transactions, self.mean_wait, self.max_wait, self.busy_time)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Richard Hull
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Example usage:
+#
+#   from oled import calibration
+#
+#   report = calibration.calibrate(device, validator=looks_right,
+#                                  settings=calibration.settings())
+#   print(report.speed_hz)
+#
+#   # and then at startup
+#   speed = calibration.settings().get("spi:0:0", 8000000)
+#   serial = spi(port=0, device=0, bus_speed_hz=speed)
+#
+# Finds the fastest SPI clock rate at which a display works reliably. The
+# clock is swept upwards, writing full-frame test patterns at each rate and
+# timing them. As an SPI display can't be read back, a rate is taken to be
+# stable unless the transfers fail, or a validator (which might ask the
+# user whether the patterns look right) rejects it; the sweep stops at the
+# first unstable rate. Without a validator, nothing shows that the panel
+# received the patterns intact, so a rate is only saved once one has
+# approved it. Faster rates are only chosen if they actually move
+# data faster, since the SPI controller can only divide its clock down to
+# certain rates, and there's no point in running the wires faster than
+# necessary.
+
+import collections
+import json
+import os
+import time
+
+clock = getattr(time, "monotonic", time.time)
+
+# the default rates to try, in Hz
+speeds = (500000, 1000000, 2000000, 4000000, 8000000, 16000000, 24000000,
+          32000000)
+
+result = collections.namedtuple("result", "speed_hz stable throughput")
+result.__doc__ = """
+The outcome of testing one clock rate: whether it was ``stable``, and the
+``throughput`` achieved (in bytes per second).
+"""
+
+report = collections.namedtuple("report", "speed_hz results")
+report.__doc__ = """
+The chosen clock rate (``None`` if none was stable), along with the
+:class:`result` for each rate which was tried.
+"""
+
+
+def patterns(size):
+    """
+    Yields the test patterns, as packed frames of ``size`` bytes: blank,
+    fully lit, a checkerboard and its inverse (so every line toggles on
+    every clock), and a pseudo-random frame.
+    """
+    yield bytes(bytearray(size))
+    yield bytes(bytearray([0xFF]) * size)
+    yield bytes(bytearray([0x55, 0xAA]) * (size // 2))
+    yield bytes(bytearray([0xAA, 0x55]) * (size // 2))
+    yield bytes(bytearray((n * 193 + 71) & 0xFF for n in range(size)))
+
+
+def calibrate(device, speeds=speeds, validator=None, repeats=2, min_gain=1.05,
+              settings=None, key=None):
+    """
+    Sweeps the SPI clock rate of the device's serial interface through
+    ``speeds`` (slowest first), sending each test pattern ``repeats``
+    times at each rate. The serial interface is left running at the
+    fastest stable rate which gave at least ``min_gain`` times the
+    throughput of the previous choice, and the screen is restored.
+
+    If given, ``validator(device, speed_hz)`` is called after the patterns
+    have been sent at each rate, and should return whether it looked
+    right. The chosen rate is stored in ``settings`` (if given, in which
+    case so must the validator be) under ``key``, which defaults to the
+    name given by :func:`default_key`.
+    """
+    assert(repeats > 0)
+    if settings is not None and validator is None:
+        raise ValueError("A validator is needed to save a calibrated rate")
+    serial = device._serial_interface
+    original = serial.bus_speed_hz
+    screen = device._shadow and bytes(device._shadow)
+    size = device.width * device._pages
+
+    results = []
+    best = None
+    for speed_hz in sorted(speeds):
+        serial.bus_speed_hz = speed_hz
+        try:
+            sent, elapsed = _exercise(device, size, repeats)
+            stable = validator is None or bool(validator(device, speed_hz))
+        except (IOError, OSError):
+            sent, elapsed, stable = 0, None, False
+
+        throughput = sent / elapsed if elapsed else 0.0
+        results.append(result(speed_hz, stable, throughput))
+        if not stable:
+            break
+        if best is None or throughput >= best.throughput * min_gain:
+            best = results[-1]
+
+    serial.bus_speed_hz = best.speed_hz if best else original
+    device.invalidate()
+    device.display_raw(screen or bytes(bytearray(size)))
+
+    if settings is not None and best is not None:
+        settings.set(key or default_key(serial), best.speed_hz)
+
+    return report(best and best.speed_hz, results)
+
+
+def default_key(serial):
+    """
+    Returns the name under which the calibrated rate of the serial
+    interface is stored, such as ``spi:0:1`` for chip select 1 of SPI port
+    0.
+    """
+    parts = getattr(serial, "device_id", None) or serial.bus_id
+    return ":".join(str(part) for part in parts)
+
+
+def _exercise(device, size, repeats):
+    sent, elapsed = 0, 0.0
+    for frame in patterns(size):
+        for _ in range(repeats):
+            # without the shadow copy, each frame is sent in full
+            device.invalidate()
+            start = clock()
+            device.display_raw(frame)
+            elapsed += clock() - start
+            sent += size
+    return sent, elapsed
+
+
+class settings(object):
+    """
+    Calibrated clock rates, keyed by device, persisted as a JSON file
+    (by default ``~/.oled-calibration.json``).
+    """
+    def __init__(self, path=None):
+        self.path = path or os.path.expanduser("~/.oled-calibration.json")
+
+    def load(self):
+        """
+        Returns all the stored rates, as a dictionary.
+        """
+        try:
+            with open(self.path) as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def get(self, key, default=None):
+        """
+        Returns the rate stored for ``key``, or ``default`` if there isn't
+        one.
+        """
+        return self.load().get(key, default)
+
+    def set(self, key, speed_hz):
+        """
+        Stores the rate for ``key``. The file is replaced as a whole, so is
+        never left half-written.
+        """
+        values = self.load()
+        values[key] = speed_hz
+        temp = self.path + ".tmp"
+        with open(temp, "w") as fp:
+            json.dump(values, fp, indent=2, sort_keys=True)
+        os.rename(temp, self.path)
@@ -51,19 +51,42 @@
 # to the device
 
 import atexit
+import threading
 from PIL import Image
 from oled.serial import i2c
+from oled.pack import pack, pack_array
+import oled.diff as diff
+import oled.effects as effects
+import oled.metrics as metrics
 import oled.mixin as mixin
 
 
-class device(object):
+class device(mixin.batching):
     """
-    Base class for OLED driver classes
+    Base class for OLED driver classes. Within a :func:`batch`, the
+    commands issued (by :func:`contrast`, :func:`scroll`, etc.) are queued
+    up and sent together, for example::
+
+        with device.batch():
+            device.contrast(0x20)
+            device.invert(True)
     """
+    _effect = None
+    # the number of frames not sent, as they matched the display RAM
+    frames_skipped = 0
+
     def __init__(self, serial_interface=None):
         self._serial_interface = serial_interface or i2c()
+        self._shadow = None
+        watch = getattr(self._serial_interface, "_watch", None)
+        if watch is not None:
+            watch(self.invalidate)
+        self._batch = threading.local()
+        # effects send commands from a background thread
+        self._lock = threading.RLock()
 
         def cleanup():
+            self.cancel_effect()
             self.hide()
             self.clear()
             self._serial_interface.cleanup()
@@ -73,17 +96,54 @@ class device(object):
     def command(self, *cmd):
         """
         Sends a command or sequence of commands through to the delegated
-        serial interface.
+        serial interface. Within a :func:`batch`, commands are queued up
+        instead, and sent together when the batch ends.
         """
-        assert(len(cmd) <= 32)
-        self._serial_interface.command(*cmd)
+        if self._batching():
+            self._queue(*cmd)
+        else:
+            with self._lock:
+                self._send_commands(cmd)
 
     def data(self, data):
         """
         Sends a data byte or sequence of data bytes through to the delegated
-        serial interface.
+        serial interface. Any queued commands are sent first.
+        """
+        with self._lock:
+            self.flush()
+            self._serial_interface.data(data)
+
+    def flush(self):
+        """
+        Sends any commands queued by this thread through to the serial
+        interface, in as few transactions as it allows.
         """
-        self._serial_interface.data(data)
+        cmds = self._take()
+        if cmds:
+            with self._lock:
+                self._send_commands(cmds)
+
+    def _send_commands(self, cmds):
+        # only interfaces whose class declares a limit are asked for it,
+        # so that stand-in serial interfaces (mocks, etc.) get the
+        # conservative default
+        size = 32
+        if hasattr(type(self._serial_interface), "max_command_length"):
+            size = self._serial_interface.max_command_length
+        for i in range(0, len(cmds), size):
+            self._serial_interface.command(*cmds[i:i + size])
+
+    def serial_metrics(self):
+        """
+        Returns a :class:`oled.metrics.snapshot` of the metrics recorded by
+        the serial interface, or ``None`` if it is not instrumented (see
+        :func:`oled.metrics.instrumented.instrument`).
+        """
+        serial = getattr(self, "_serial_interface", None)
+        recorded = getattr(serial, "metrics", None)
+        if isinstance(recorded, metrics.metrics):
+            return recorded.snapshot()
 
     def show(self):
         """
@@ -99,12 +159,201 @@ class device(object):
         """
         self.command(const.DISPLAYOFF)
 
+    def contrast(self, level):
+        """
+        Sets the contrast (brightness) of the display, from 0 to 255.
+        """
+        assert(0 <= level <= 255)
+        self.command(const.SETCONTRAST, level)
+
+    def invert(self, flag):
+        """
+        Inverts the display when set, so that lit pixels go dark and vice
+        versa, without changing the contents of the display RAM.
+        """
+        self.command(const.INVERTDISPLAY if flag else const.NORMALDISPLAY)
+
+    def fade(self, start, end, duration=1.0, steps=16):
+        """
+        Fades the contrast from ``start`` to ``end`` over ``duration``
+        seconds in the background, replacing any effect already running on
+        the device. Returns the running :class:`oled.effects.effect`.
+        """
+        self.cancel_effect()
+        self._effect = effects.fade(self, start, end, duration, steps)
+        return self._effect
+
+    def blink(self, interval=0.5, count=3, invert=False):
+        """
+        Blinks the display ``count`` times (or until cancelled, if ``None``)
+        in the background, replacing any effect already running on the
+        device. Returns the running :class:`oled.effects.effect`.
+        """
+        self.cancel_effect()
+        self._effect = effects.blink(self, interval, count, invert)
+        return self._effect
+
+    def cancel_effect(self):
+        """
+        Stops any effect that is running on the device.
+        """
+        if self._effect is not None:
+            self._effect.cancel()
+            self._effect = None
+
     def clear(self):
         """
         Initializes the device memory with an empty (blank) image.
         """
         self.display(Image.new(self.mode, (self.width, self.height)))
 
+    def display(self, image):
+        """
+        Takes a 1-bit image, or a 2-D numpy array of pixels (rows by
+        columns, where any non-zero value is lit), and dumps it to the
+        display.
+        """
+        if isinstance(image, Image.Image):
+            assert(image.mode == self.mode)
+            assert(image.size[0] == self.width)
+            assert(image.size[1] == self.height)
+            packed = pack(image, self._mirror)
+        else:
+            assert(image.shape == (self.height, self.width))
+            packed = pack_array(image, self._mirror)
+
+        self._display_packed(packed)
+
+    def display_raw(self, buf):
+        """
+        Takes a frame which is already packed into display RAM order (any
+        bytes-like object, as produced by :func:`oled.pack.pack` with the
+        device's column order) and dumps it to the display without
+        repacking it.
+        """
+        assert(len(buf) == self.width * self._pages)
+        self._display_packed(buf)
+
+    def _display_packed(self, packed):
+        self._buffer[:] = packed
+        if not self._unchanged():
+            self._display_buffer()
+
+    def _unchanged(self):
+        """
+        Whether the packed frame in ``_buffer`` matches the shadow copy of
+        the display RAM, in which case it is counted as skipped. Comparing
+        against the shadow is exact, and as quick as hashing the frame.
+        """
+        if self._buffer == self._shadow:
+            self.frames_skipped += 1
+            return True
+        return False
+
+    def display_region(self, image, box):
+        """
+        Updates just part of the display with a 1-bit image, leaving the
+        rest of the screen as it was. The box is either a 2-tuple giving the
+        upper left corner at which to place the image, or a 4-tuple of
+        (left, top, right, bottom) whose size must match the image. Only the
+        pages and columns covering the box are packed and sent.
+        """
+        box = self._region(image, box)
+        if self._shadow is None:
+            # the rest of the display RAM is unknown, so send a full frame
+            frame = Image.new(self.mode, (self.width, self.height))
+            frame.paste(image, box[:2])
+            return self.display(frame)
+
+        window = self._merge_region(image, box)
+        self._write_box(memoryview(self._buffer), window)
+        self._shadow, self._buffer = self._buffer, self._shadow
+
+    def _region(self, image, box):
+        """
+        Checks that the image fits within the display at the given box, and
+        returns the full (left, top, right, bottom) box that it covers.
+        """
+        assert(image.mode == self.mode)
+        left, top = box[:2]
+        right, bottom = left + image.size[0], top + image.size[1]
+        assert(len(box) == 2 or tuple(box[2:]) == (right, bottom))
+        assert(0 <= left < right <= self.width)
+        assert(0 <= top < bottom <= self.height)
+        return (left, top, right, bottom)
+
+    def _merge_region(self, image, box):
+        """
+        Fills ``_buffer`` with the shadow of the display RAM, overlaid with
+        the packed image at the given box. Returns the window of columns and
+        pages which is affected.
+        """
+        left, top, right, bottom = box
+        first, last = top // 8, (bottom + 7) // 8
+        if self._mirror:
+            columns = (self.width - right, self.width - left)
+        else:
+            columns = (left, right)
+
+        offset = top - first * 8
+        if offset == 0 and bottom % 8 == 0:
+            packed = pack(image, self._mirror)
+            mask = None
+        else:
+            # pixels outside the box but within the same pages are kept
+            size = (right - left, (last - first) * 8)
+            region = Image.new(self.mode, size)
+            region.paste(image, (0, offset))
+            cover = Image.new(self.mode, size)
+            cover.paste(255, (0, offset, size[0], offset + image.size[1]))
+            packed = pack(region, self._mirror)
+            mask = pack(cover, self._mirror)
+
+        buf = self._buffer
+        buf[:] = self._shadow
+        span = columns[1] - columns[0]
+        for i, page in enumerate(range(first, last)):
+            start = page * self.width + columns[0]
+            new = packed[i * span:(i + 1) * span]
+            if mask is None:
+                buf[start:start + span] = new
+            else:
+                keep = mask[i * span:(i + 1) * span]
+                old = buf[start:start + span]
+                buf[start:start + span] = bytearray(
+                    (o & ~m) | (n & m) for o, n, m in zip(bytearray(old), bytearray(new), bytearray(keep)))
+
+        return (columns[0], first, columns[1], last)
+
+    def invalidate(self):
+        """
+        Discards the host-side shadow copy of the display RAM, so that the
+        next call to :func:`display` sends the whole frame. This should be
+        called if the display RAM has been altered behind the driver's back.
+        """
+        self._shadow = None
+
+    def _display_buffer(self):
+        """
+        Sends only those parts of the packed frame held in ``_buffer`` which
+        differ from the shadow copy of the display RAM, and then retains the
+        frame as the new shadow. The previous shadow's storage is recycled
+        as the buffer for the next frame.
+        """
+        boxes = diff.plan(self._shadow, self._buffer, self.width, self._pages,
+                          self._window_overhead, self._multipage)
+        buf = memoryview(self._buffer)
+        try:
+            for box in boxes:
+                self._write_box(buf, box)
+        except Exception:
+            # the display RAM now holds part of the frame
+            self.invalidate()
+            raise
+
+        shadow = self._shadow or bytearray(len(self._buffer))
+        self._shadow, self._buffer = self._buffer, shadow
+
 
 class sh1106(device, mixin.capabilities):
     """
@@ -114,6 +363,10 @@ class sh1106(device, mixin.capabilities):
     called to affect the brightness. Direct use of the command() and
     data() methods are discouraged.
     """
+    # page & column nibbles, plus bus overhead of an extra transaction
+    _window_overhead = 13
+    _multipage = False
+    _mirror = False
 
     def __init__(self, serial_interface=None, width=128, height=64):
         try:
@@ -123,6 +376,7 @@ class sh1106(device, mixin.capabilities):
             self.width = width
             self.height = height
             self._pages = self.height // 8
+            self._buffer = bytearray(self.width * self._pages)
 
             self.command(
                 const.DISPLAYOFF,
@@ -148,33 +402,15 @@ class sh1106(device, mixin.capabilities):
             raise IOError(e.errno,
                           "Failed to initialize SH1106 display driver")
 
-    def display(self, image):
-        """
-        Takes a 1-bit image and dumps it to the SH1106 OLED display.
-        """
-        assert(image.mode == self.mode)
-        assert(image.size[0] == self.width)
-        assert(image.size[1] == self.height)
-
-        page = 0xB0
-        pix = list(image.getdata())
-        step = self.width * 8
-        for y in range(0, self._pages * step, step):
-
-            # move to given page, then reset the column address
-            self.command(page, 0x02, 0x10)
-            page += 1
-
-            buf = []
-            for x in range(self.width):
-                byte = 0
-                for n in range(0, step, self.width):
-                    byte |= (pix[x + y + n] & 0x01) << 8
-                    byte >>= 1
-
-                buf.append(byte)
-
-            self.data(buf)
+    def _write_box(self, buf, box):
+        left, top, right, bottom = box
+        width = self.width
+        # SH1106 RAM is 132 columns wide, with the panel centred within it
+        column = left + 2
+        for page in range(top, bottom):
+            # move to given page, then set the column address
+            self.command(0xB0 + page, column & 0x0F, 0x10 | (column >> 4))
+            self.data(buf[page * width + left:page * width + right])
 
 
 class ssd1306(device, mixin.capabilities):
@@ -185,25 +421,44 @@ class ssd1306(device, mixin.capabilities):
     called to affect the brightness. Direct use of the command() and
     data() methods are discouraged.
     """
-    def __init__(self, serial_interface=None, width=128, height=64):
+    # column & page address windows, plus bus overhead of an extra transaction
+    _window_overhead = 16
+    _multipage = True
+    # columns are addressed right-to-left, given the segment mapping below
+    _mirror = True
+    # number of frames between each scroll step, and its encoding
+    _scroll_intervals = {5: 0x00, 64: 0x01, 128: 0x02, 256: 0x03,
+                         3: 0x04, 4: 0x05, 25: 0x06, 2: 0x07}
+
+    _page_offset = 0
+
+    def __init__(self, serial_interface=None, width=128, height=64,
+                 double_buffer=False):
+        # the display RAM holds 64 rows, so shorter panels can use the rows
+        # that are not displayed as a second frame buffer
+        assert(not double_buffer or height * 2 <= 64)
         try:
             super(ssd1306, self).__init__(serial_interface)
             self.capabilities(width, height)
             self._pages = self.height // 8
-            self._buffer = [0] * self.width * self._pages
-            self._offsets = [n * self.width for n in range(8)]
+            self._buffer = bytearray(self.width * self._pages)
+            self._scroll = None
+            self._double_buffer = double_buffer
+            self._hidden = None
+            self._front = 0
+            compins = 0x02 if (width, height) in ((128, 32), (96, 16)) else 0x12
 
             self.command(
                 const.DISPLAYOFF,
                 const.SETDISPLAYCLOCKDIV, 0x80,
-                const.SETMULTIPLEX,       0x3F,
+                const.SETMULTIPLEX,       self.height - 1,
                 const.SETDISPLAYOFFSET,   0x00,
                 const.SETSTARTLINE,
                 const.CHARGEPUMP,         0x14,
                 const.MEMORYMODE,         0x00,
                 const.SEGREMAP,
                 const.COMSCANDEC,
-                const.SETCOMPINS,         0x12,
+                const.SETCOMPINS,         compins,
                 const.SETCONTRAST,        0xCF,
                 const.SETPRECHARGE,       0xF1,
                 const.SETVCOMDETECT,      0x40,
@@ -217,58 +472,174 @@ class ssd1306(device, mixin.capabilities):
             raise IOError(e.errno,
                           "Failed to initialize SSD1306 display driver")
 
-    def display(self, image):
+    def _display_packed(self, packed):
+        if self._scroll is not None:
+            self.stop_scroll()
+
+        self._buffer[:] = packed
+        if self._unchanged():
+            return
+        if self._double_buffer:
+            self._flip_buffer()
+        else:
+            self._display_buffer()
+
+    def display_region(self, image, box):
+        if self._scroll is not None:
+            self.stop_scroll()
+
+        if self._double_buffer and self._shadow is not None:
+            self._merge_region(image, self._region(image, box))
+            if not self._unchanged():
+                self._flip_buffer()
+        else:
+            super(ssd1306, self).display_region(image, box)
+
+    def invalidate(self):
+        super(ssd1306, self).invalidate()
+        self._hidden = None
+
+    def flip(self):
         """
-        Takes a 1-bit image and dumps it to the SSD1306 OLED display.
+        When double-buffering, swaps over the visible and hidden halves of
+        the display RAM: this re-displays the previous frame with just a
+        single command. The hidden half must hold a frame displayed since the
+        device was initialized or last invalidated.
         """
-        assert(image.mode == self.mode)
-        assert(image.size[0] == self.width)
-        assert(image.size[1] == self.height)
+        assert(self._double_buffer)
+        assert(self._hidden is not None)
+        if self._scroll is not None:
+            self.stop_scroll()
+
+        self._shadow, self._hidden = self._hidden, self._shadow
+        self._front = self._page_offset = self._pages - self._front
+        self.command(const.SETSTARTLINE | self._front * 8)
+
+    def _flip_buffer(self):
+        """
+        Writes the packed frame into the hidden half of the display RAM,
+        and then flips the display over to show it. Where the hidden half
+        already holds the same frame (when alternating between two frames,
+        say), only the flip is needed.
+        """
+        self._shadow, self._hidden = self._hidden, self._shadow
+        self._page_offset = self._pages - self._front
+        try:
+            self._display_buffer()
+        except Exception:
+            # still showing the front half, but neither half is known now
+            self._page_offset = self._front
+            self.invalidate()
+            raise
+        self._front = self._page_offset
+        self.command(const.SETSTARTLINE | self._front * 8)
+
+    def scroll(self, direction="left", start_page=0, end_page=None,
+               interval=2, vertical_offset=0):
+        """
+        Starts the display controller continuously scrolling the pages
+        from ``start_page`` to ``end_page`` (inclusive) horizontally, one
+        column every ``interval`` frames, where the interval is one of 2, 3,
+        4, 5, 25, 64, 128 or 256. If a ``vertical_offset`` is given, the
+        whole display additionally scrolls up by that many rows per step.
+
+        No further data is sent while scrolling, but displaying a new frame
+        stops it.
+        """
+        if direction not in ("left", "right"):
+            raise ValueError("Unsupported scroll direction: {0}".format(direction))
+        if interval not in self._scroll_intervals:
+            raise ValueError("Unsupported scroll interval: {0}".format(interval))
 
+        if vertical_offset and self._double_buffer:
+            raise ValueError("Vertical scrolling is not supported when double-buffering")
+
+        end_page = self._pages - 1 if end_page is None else end_page
+        assert(0 <= start_page <= end_page < self._pages)
+        assert(0 <= vertical_offset < self.height)
+
+        if self._scroll is not None:
+            self.stop_scroll()
+
+        # the columns are mirrored, so the hardware directions are swapped
+        right = (direction == "right") != self._mirror
+        speed = self._scroll_intervals[interval]
+        if vertical_offset:
+            self.command(
+                const.SET_VERTICAL_SCROLL_AREA, 0x00, self.height,
+                const.VERTICAL_AND_RIGHT_HORIZONTAL_SCROLL if right else
+                const.VERTICAL_AND_LEFT_HORIZONTAL_SCROLL,
+                0x00, start_page, speed, end_page, vertical_offset,
+                const.ACTIVATE_SCROLL)
+        else:
+            self.command(
+                const.RIGHT_HORIZONTAL_SCROLL if right else
+                const.LEFT_HORIZONTAL_SCROLL,
+                0x00, start_page + self._front, speed, end_page + self._front,
+                0x00, 0xFF,
+                const.ACTIVATE_SCROLL)
+
+        self._scroll = (start_page, end_page, vertical_offset)
+
+    def stop_scroll(self):
+        """
+        Stops any scrolling, and restores the display RAM to the last frame
+        that was displayed (horizontal scrolling shifts the contents of the
+        display RAM).
+        """
+        if self._scroll is None:
+            self.command(const.DEACTIVATE_SCROLL)
+            return
+
+        start_page, end_page, vertical_offset = self._scroll
+        self._scroll = None
+        if vertical_offset:
+            # vertical scrolling moves the start line, so put it back
+            self.command(const.DEACTIVATE_SCROLL, const.SETSTARTLINE)
+            start_page, end_page = 0, self._pages - 1
+        else:
+            self.command(const.DEACTIVATE_SCROLL)
+
+        if self._shadow is not None:
+            self._write_box(memoryview(self._shadow),
+                            (0, start_page, self.width, end_page + 1))
+
+    def _write_box(self, buf, box):
+        left, top, right, bottom = box
+        width = self.width
         self.command(
             # Column start/end address
-            const.COLUMNADDR, 0x00, self.width - 1,
+            const.COLUMNADDR, left, right - 1,
             # Page start/end address
-            const.PAGEADDR, 0x00, self._pages - 1)
+            const.PAGEADDR, top + self._page_offset, bottom - 1 + self._page_offset)
 
-        pix = list(image.getdata())
-        step = self.width * 8
-        buf = self._buffer
-        offsets = self._offsets
-        w = self.width
-        j = 0
-        for y in range(0, self._pages * step, step):
-            i = y + w - 1
-            while i >= y:
-                buf[j] = (pix[i] & 0x01) | \
-                         (pix[i + offsets[1]] & 0x01) << 1 | \
-                         (pix[i + offsets[2]] & 0x01) << 2 | \
-                         (pix[i + offsets[3]] & 0x01) << 3 | \
-                         (pix[i + offsets[4]] & 0x01) << 4 | \
-                         (pix[i + offsets[5]] & 0x01) << 5 | \
-                         (pix[i + offsets[6]] & 0x01) << 6 | \
-                         (pix[i + offsets[7]] & 0x01) << 7
-
-                i -= 1
-                j += 1
-
-        self.data(buf)
+        if left == 0 and right == width:
+            self.data(buf[top * width:bottom * width])
+        elif bottom - top == 1:
+            self.data(buf[top * width + left:top * width + right])
+        else:
+            self.data(bytearray().join(buf[page * width + left:page * width + right]
+                                       for page in range(top, bottom)))
 
 
 class const:
+    ACTIVATE_SCROLL = 0x2F
     CHARGEPUMP = 0x8D
     COLUMNADDR = 0x21
     COMSCANDEC = 0xC8
     COMSCANINC = 0xC0
+    DEACTIVATE_SCROLL = 0x2E
     DISPLAYALLON = 0xA5
     DISPLAYALLON_RESUME = 0xA4
     DISPLAYOFF = 0xAE
     DISPLAYON = 0xAF
     EXTERNALVCC = 0x1
     INVERTDISPLAY = 0xA7
+    LEFT_HORIZONTAL_SCROLL = 0x27
     MEMORYMODE = 0x20
     NORMALDISPLAY = 0xA6
     PAGEADDR = 0x22
+    RIGHT_HORIZONTAL_SCROLL = 0x26
     SEGREMAP = 0xA0
     SETCOMPINS = 0xDA
     SETCONTRAST = 0x81
@@ -281,4 +652,7 @@ class const:
     SETSEGMENTREMAP = 0xA1
     SETSTARTLINE = 0x40
     SETVCOMDETECT = 0xDB
+    SET_VERTICAL_SCROLL_AREA = 0xA3
     SWITCHCAPVCC = 0x2
+    VERTICAL_AND_LEFT_HORIZONTAL_SCROLL = 0x2A
+    VERTICAL_AND_RIGHT_HORIZONTAL_SCROLL = 0x29
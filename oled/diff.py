@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Richard Hull
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Works out which parts of a packed frame need sending to the display, by
+# comparing it against a shadow copy of what is already in display RAM.
+#
+# Regions are expressed as boxes of (left, top, right, bottom) where the
+# horizontal axis is in columns and the vertical axis is in pages, with the
+# right and bottom edges being exclusive (in the same way as PIL boxes).
+#
+# The cost of sending a box is modelled as the number of bytes of data it
+# covers plus a fixed overhead for setting the address window and starting a
+# new bus transaction.
+
+
+def area(box):
+    """
+    The number of data bytes needed to fill the given box.
+    """
+    left, top, right, bottom = box
+    return (right - left) * (bottom - top)
+
+
+def cost(boxes, overhead, multipage=True):
+    """
+    The modelled cost of sending all the given boxes. If the device is not
+    able to auto-increment across pages (``multipage=False``), each page
+    within a box is charged the overhead separately.
+    """
+    total = 0
+    for box in boxes:
+        total += area(box)
+        total += overhead if multipage else overhead * (box[3] - box[1])
+    return total
+
+
+def bounds(boxes):
+    """
+    The smallest single box that encloses all of the given boxes.
+    """
+    lefts, tops, rights, bottoms = zip(*boxes)
+    return (min(lefts), min(tops), max(rights), max(bottoms))
+
+
+def windows(old, new, width, pages, gap):
+    """
+    Compares the two packed buffers page by page, returning a box for each
+    changed run of columns. Runs within a page are merged together whenever
+    the unchanged columns between them number no more than ``gap``.
+    """
+    boxes = []
+    for page in range(pages):
+        lo = page * width
+        hi = lo + width
+        if old[lo:hi] == new[lo:hi]:
+            continue
+
+        start = last = None
+        for i in range(lo, hi):
+            if old[i] != new[i]:
+                if start is None:
+                    start = i
+                elif i - last - 1 > gap:
+                    boxes.append((start - lo, page, last + 1 - lo, page + 1))
+                    start = i
+                last = i
+
+        boxes.append((start - lo, page, last + 1 - lo, page + 1))
+
+    return boxes
+
+
+def plan(old, new, width, pages, overhead, multipage=True):
+    """
+    Decides on the cheapest set of boxes to send to bring the display RAM
+    (``old``) up to date with the new frame (``new``). If there is no shadow
+    of the display RAM, the whole frame is sent, and an empty list means
+    there is nothing to do.
+    """
+    if old is None:
+        return [(0, 0, width, pages)]
+
+    boxes = windows(old, new, width, pages, overhead)
+    if len(boxes) > 1:
+        outer = bounds(boxes)
+        if cost([outer], overhead, multipage) <= cost(boxes, overhead, multipage):
+            return [outer]
+
+    return boxes
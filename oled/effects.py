@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Richard Hull
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Visual effects which are achieved purely by sending a few command bytes to
+# the display (rather than redrawing frames), such as fading the contrast or
+# blinking the display. Effects are run in the background by a scheduler, so
+# the caller doesn't block while they play out.
+
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+clock = getattr(time, "monotonic", time.time)
+
+
+class scheduler(object):
+    """
+    A small scheduler which calls functions at some later time on a single
+    background (daemon) thread. The thread is only started when something
+    is first scheduled. An error raised by a function is reported, and
+    doesn't stop the others from running.
+    """
+    def __init__(self):
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def schedule(self, delay, fn):
+        """
+        Arranges for ``fn`` to be called after ``delay`` seconds.
+        """
+        with self._condition:
+            heapq.heappush(self._queue, (clock() + delay, next(self._counter), fn))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="oled-effects")
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+
+                when, _, fn = self._queue[0]
+                delay = when - clock()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+
+                heapq.heappop(self._queue)
+
+            try:
+                fn()
+            except Exception:
+                traceback.print_exc()
+
+
+_default = None
+
+
+def default_scheduler():
+    """
+    The scheduler shared by effects when no other is specified.
+    """
+    global _default
+    if _default is None:
+        _default = scheduler()
+    return _default
+
+
+class effect(object):
+    """
+    A running effect, made up of a sequence of ``(delay, fn)`` steps, where
+    each function is called once its delay (in seconds, after the previous
+    step) has elapsed. An effect can be cancelled part way through, in
+    which case ``restore`` (if given) is called to undo it. If a step
+    raises an error, the effect stops, and the error is kept as ``error``.
+    """
+    def __init__(self, steps, scheduler=None, restore=None):
+        self._steps = iter(steps)
+        self._scheduler = scheduler or default_scheduler()
+        self._restore = restore
+        self._done = threading.Event()
+        self._cancelled = False
+        self._lock = threading.RLock()
+        self.error = None
+        self._next()
+
+    def _next(self):
+        try:
+            delay, fn = next(self._steps)
+        except StopIteration:
+            self._done.set()
+            return
+
+        def step():
+            # a step can't run at the same time as it is being cancelled
+            with self._lock:
+                if self._cancelled:
+                    return
+                try:
+                    fn()
+                except Exception as e:
+                    self.error = e
+                    self._done.set()
+                    return
+                self._next()
+
+        self._scheduler.schedule(delay, step)
+
+    def cancel(self):
+        """
+        Stops the effect before any further steps are run, restoring the
+        display if it hadn't already finished.
+        """
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            if not self._done.is_set() and self._restore is not None:
+                self._restore()
+            self._done.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the effect has finished (or been cancelled), returning
+        ``False`` if it had not done so within the timeout. If a step failed,
+        its error is raised.
+        """
+        done = self._done.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return done
+
+
+def fade(device, start, end, duration=1.0, steps=16, scheduler=None):
+    """
+    Fades the contrast of the device from ``start`` to ``end`` (0-255) in
+    equal steps over ``duration`` seconds.
+    """
+    assert(steps > 0)
+    interval = float(duration) / steps
+
+    def levels():
+        yield 0, lambda: device.contrast(start)
+        for n in range(1, steps + 1):
+            level = int(round(start + (end - start) * float(n) / steps))
+            yield interval, lambda level=level: device.contrast(level)
+
+    return effect(levels(), scheduler)
+
+
+def blink(device, interval=0.5, count=3, invert=False, scheduler=None):
+    """
+    Blinks the display ``count`` times (or until cancelled, if ``None``),
+    switching it off - or, with ``invert`` set, inverting it - for
+    ``interval`` seconds at a time, and leaving it on afterwards (even if
+    it is cancelled part way through).
+    """
+    if invert:
+        off, on = lambda: device.invert(True), lambda: device.invert(False)
+    else:
+        off, on = device.hide, device.show
+    phase = {"off": False}
+
+    def switch(fn, state):
+        def step():
+            fn()
+            phase["off"] = state
+        return step
+
+    def toggles():
+        n = 0
+        while count is None or n < count:
+            yield (interval if n else 0), switch(off, True)
+            yield interval, switch(on, False)
+            n += 1
+
+    def restore():
+        if phase["off"]:
+            on()
+
+    return effect(toggles(), scheduler, restore)
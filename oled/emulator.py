@@ -25,8 +25,10 @@
 import os
 import sys
 import atexit
-from oled.device import device
-from PIL import Image
+import threading
+from oled.device import device, ssd1306
+from oled.pack import unpack
+from PIL import Image, ImageChops
 import oled.mixin as mixin
 
 
@@ -41,6 +43,110 @@ class emulator(mixin.noop, mixin.capabilities, device):
         self.scale = 1 if transform == "none" else scale
         self._transform = getattr(transformer(pygame, width, height, scale),
                                   "none" if scale == 1 else transform)
+        self._last_image = Image.new(mode, (width, height))
+        self._last_shown = None
+        self._scroll = None
+        # as set up by device.__init__, which has no serial interface to
+        # open here
+        self._batch = threading.local()
+        self._lock = threading.RLock()
+
+    def _remember(self, image):
+        """
+        Keeps a copy of the frame being displayed; as with the hardware,
+        displaying a new frame stops any scrolling.
+        """
+        self._last_image = image.copy()
+        self._scroll = None
+
+    def _unchanged(self, image):
+        """
+        Whether the image is the same as the frame last shown (which may
+        differ from the one remembered, while scrolling), in which case it
+        is counted as skipped.
+        """
+        data = image.tobytes()
+        if data == self._last_shown:
+            self.frames_skipped += 1
+            return True
+        self._last_shown = data
+        return False
+
+    def invalidate(self):
+        """
+        Forgets the frame last shown, so that the next one isn't skipped
+        even if it is the same.
+        """
+        self._last_shown = None
+
+    def display_raw(self, buf):
+        """
+        Takes a frame which is already packed into display RAM order (as
+        produced by :func:`oled.pack.pack`, with the columns running from
+        left to right), unpacks it and displays the image.
+        """
+        assert(len(buf) == self.width * self.height // 8)
+        image = unpack(buf, self.width, self.height)
+        self.display(image if self.mode == "1" else image.convert(self.mode))
+
+    def display_region(self, image, box):
+        """
+        Composites the image onto the last frame that was displayed, at the
+        position given by the box, and then displays the result.
+        """
+        self._last_image.paste(image, box)
+        self.display(self._last_image)
+
+    def scroll(self, direction="left", start_page=0, end_page=None,
+               interval=2, vertical_offset=0):
+        """
+        Simulates the hardware scrolling of the SSD1306: rather than being
+        driven by the display refresh, the scroll advances by one column
+        (and ``vertical_offset`` rows) each time :func:`scroll_step` is
+        called.
+        """
+        if direction not in ("left", "right"):
+            raise ValueError("Unsupported scroll direction: {0}".format(direction))
+
+        if interval not in ssd1306._scroll_intervals:
+            raise ValueError("Unsupported scroll interval: {0}".format(interval))
+
+        end_page = self.height // 8 - 1 if end_page is None else end_page
+        assert(0 <= start_page <= end_page < self.height // 8)
+        assert(0 <= vertical_offset < self.height)
+        self._scroll = (direction, start_page, end_page, vertical_offset)
+        self._scroll_steps = 0
+
+    def scroll_step(self, steps=1):
+        """
+        Advances a simulated scroll by the given number of steps, and
+        displays the result.
+        """
+        if self._scroll is None:
+            return
+
+        direction, start_page, end_page, vertical_offset = self._scroll
+        scroll, frame = self._scroll, self._last_image
+        n = self._scroll_steps + steps
+
+        # horizontal scrolling shifts the contents of the pages, whereas
+        # vertical scrolling moves the start line of the whole display
+        image = frame.copy()
+        band = (0, start_page * 8, self.width, (end_page + 1) * 8)
+        shifted = ImageChops.offset(image.crop(band), n if direction == "right" else -n, 0)
+        image.paste(shifted, band[:2])
+        if vertical_offset:
+            image = ImageChops.offset(image, 0, -n * vertical_offset)
+
+        self.display(image)
+        self._last_image, self._scroll, self._scroll_steps = frame, scroll, n
+
+    def stop_scroll(self):
+        """
+        Stops any simulated scrolling, and restores the last frame displayed.
+        """
+        if self._scroll is not None:
+            self.display(self._last_image)
 
     def to_surface(self, im):
         im = im.convert("RGB")
@@ -70,11 +176,16 @@ class capture(emulator):
 
     def display(self, image):
         """
-        Takes an image and dumps it to a numbered PNG file.
+        Takes an image and dumps it to a numbered PNG file, unless it is
+        the same as the last frame.
         """
         assert(image.size[0] == self.width)
         assert(image.size[1] == self.height)
 
+        self._remember(image)
+        if self._unchanged(image):
+            return
+
         self._count += 1
         filename = self._file_template.format(self._count)
         surface = self.to_surface(image)
@@ -97,6 +208,7 @@ class gifanim(emulator):
                  max_frames=None, **kwargs):
         super(gifanim, self).__init__(width, height, mode, transform, scale)
         self._images = []
+        self._durations = []
         self._count = 0
         self._max_frames = max_frames
         self._filename = filename
@@ -107,15 +219,22 @@ class gifanim(emulator):
     def display(self, image):
         """
         Takes an image, scales it according to the nominated transform, and
-        stores it for later building into an animated GIF.
+        stores it for later building into an animated GIF. A frame which
+        is the same as the last isn't stored again: the last one is shown
+        for longer instead.
         """
         assert(image.size[0] == self.width)
         assert(image.size[1] == self.height)
 
-        surface = self.to_surface(image)
-        rawbytes = self._pygame.image.tostring(surface, "RGB", False)
-        im = Image.frombytes(self.mode, (self.width * self.scale, self.height * self.scale), rawbytes)
-        self._images.append(im)
+        self._remember(image)
+        if self._unchanged(image):
+            self._durations[-1] += self._duration
+        else:
+            surface = self.to_surface(image)
+            rawbytes = self._pygame.image.tostring(surface, "RGB", False)
+            im = Image.frombytes(self.mode, (self.width * self.scale, self.height * self.scale), rawbytes)
+            self._images.append(im)
+            self._durations.append(self._duration)
 
         self._count += 1
         sys.stdout.write("Recording frame: {0}\r".format(self._count))
@@ -129,7 +248,7 @@ class gifanim(emulator):
         sys.stdout.flush()
         with open(self._filename, "w+b") as fp:
             self._images[0].save(fp, save_all=True, loop=self._loop,
-                                 duration=int(self._duration * 1000),
+                                 duration=[int(round(d * 1000)) for d in self._durations],
                                  append_images=self._images[1:])
 
         print("Wrote {0} frames to file: {1} ({2} bytes)".format(
@@ -172,6 +291,7 @@ class pygame(emulator):
         assert(image.size[0] == self.width)
         assert(image.size[1] == self.height)
 
+        self._remember(image)
         self._clock.tick(self._fps)
         self._pygame.event.pump()
 
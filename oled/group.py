@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Richard Hull
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Example usage:
+#
+#   from oled.group import group
+#
+#   displays = group([ssd1306(i2c(port=1, address=0x3C)),
+#                     ssd1306(i2c(port=1, address=0x3D)),
+#                     sh1106(i2c(port=3)),
+#                     ssd1306(spi())])
+#
+#   displays.display_all([frame1, frame2, frame3, frame4])
+#
+# Devices on different buses are updated at the same time, each bus by its
+# own worker thread, whereas devices which share a bus are updated one
+# after another. Where the devices on a bus share an oled.serial.i2c_bus,
+# their writes are batched together into as few system calls as possible;
+# similarly, devices behind an oled.serial.tca9548a multiplexer are batched
+# so that each channel is only selected once.
+
+import threading
+from collections import OrderedDict
+
+from oled.serial import i2c_bus, mux_channel, tca9548a
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue
+
+
+def bus_id(device):
+    """
+    Returns a key identifying the bus which the device is attached to:
+    either the ``bus_id`` of its serial interface or, for devices without
+    one (such as the emulators), a key unique to the device.
+    """
+    serial = getattr(device, "_serial_interface", None)
+    key = getattr(serial, "bus_id", None)
+    return ("device", id(device)) if key is None else key
+
+
+class group(object):
+    """
+    A group of devices which are updated together with :func:`display_all`.
+    Devices are grouped by the bus they are attached to, which is worked
+    out from their serial interfaces unless a list of bus keys (one per
+    device) is given.
+    """
+    def __init__(self, devices, buses=None):
+        self.devices = list(devices)
+        if buses is None:
+            buses = [bus_id(device) for device in self.devices]
+        assert(len(buses) == len(self.devices))
+
+        # indexes of the devices on each bus, in the order given
+        self._buses = OrderedDict()
+        for index, bus in enumerate(buses):
+            self._buses.setdefault(bus, []).append(index)
+        self._workers = {}
+
+    def __len__(self):
+        return len(self.devices)
+
+    def display_all(self, frames):
+        """
+        Displays each frame on the corresponding device (a frame of
+        ``None`` leaves that device as it is), returning once all of them
+        have been sent. If any devices fail, the first error is raised
+        after the rest have been updated.
+        """
+        frames = list(frames)
+        assert(len(frames) == len(self.devices))
+
+        jobs = []
+        for bus, indexes in self._buses.items():
+            work = [(self.devices[i], frames[i]) for i in indexes if frames[i] is not None]
+            if work:
+                jobs.append((bus, _job(work, _shared_bus(work))))
+
+        if len(jobs) == 1:
+            # there's nothing to overlap with, so save the thread hand-off
+            jobs[0][1].run()
+        else:
+            for bus, job in jobs:
+                self._worker(bus).put(job)
+
+        for bus, job in jobs:
+            job.wait()
+        for bus, job in jobs:
+            if job.error is not None:
+                raise job.error
+
+    def close(self):
+        """
+        Stops the worker threads.
+        """
+        workers, self._workers = self._workers, {}
+        for jobs, thread in workers.values():
+            jobs.put(None)
+        for jobs, thread in workers.values():
+            thread.join()
+
+    def _worker(self, bus):
+        if bus not in self._workers:
+            jobs = queue.Queue()
+            thread = threading.Thread(target=_run, args=(jobs,), name="oled-group")
+            thread.daemon = True
+            thread.start()
+            self._workers[bus] = (jobs, thread)
+        return self._workers[bus][0]
+
+
+def _shared_bus(work):
+    """
+    Returns the i2c_bus or multiplexer shared by all the devices, if there
+    is one.
+    """
+    buses = set()
+    for device, frame in work:
+        bus = getattr(getattr(device, "_serial_interface", None), "_bus", None)
+        buses.add(bus.mux if isinstance(bus, mux_channel) else bus)
+
+    bus = buses.pop()
+    return bus if not buses and isinstance(bus, (i2c_bus, tca9548a)) else None
+
+
+class _job(object):
+    """
+    The frames to send to the devices on one bus.
+    """
+    def __init__(self, work, bus=None):
+        self.work = work
+        self.error = None
+        self._bus = bus
+        self._done = threading.Event()
+
+    def run(self):
+        try:
+            if self._bus is None:
+                self._display()
+            else:
+                with self._bus.batch():
+                    self._display()
+        except Exception as e:
+            self.error = self.error or e
+        self._done.set()
+
+    def _display(self):
+        for device, frame in self.work:
+            try:
+                device.display(frame)
+            except Exception as e:
+                self.error = self.error or e
+
+    def wait(self):
+        self._done.wait()
+
+
+def _run(jobs):
+    for job in iter(jobs.get, None):
+        job.run()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Richard Hull
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Instrumentation for the serial interfaces: when enabled (with
+# ``serial.instrument()``), every command() and data() call is counted and
+# timed, as is every transaction that they make on the underlying bus. The
+# difference between the two shows how much time goes on chunking and
+# other overheads, rather than on the bus itself.
+
+import collections
+import threading
+import time
+
+clock = getattr(time, "monotonic", time.time)
+
+# latency histogram bucket n counts calls taking under 2**n microseconds
+# (and at least 2**(n-1)), with the last bucket counting anything longer
+buckets = 25
+
+call_stats = collections.namedtuple("call_stats", "count bytes errors time histogram")
+
+
+class snapshot(collections.namedtuple("snapshot", "calls transactions transaction_errors transaction_time")):
+    """
+    The metrics recorded by a serial interface at some point in time:
+    ``calls`` maps each kind of call (``command`` and ``data``) to its
+    :class:`call_stats` (count, bytes sent, errors, total time in seconds
+    and latency histogram), and the other fields count and time the
+    transactions made on the bus.
+    """
+    def __repr__(self):
+        lines = ["transactions: {0} ({1} errors) in {2:.6f}s".format(
+            self.transactions, self.transaction_errors, self.transaction_time)]
+        for kind, stats in sorted(self.calls.items()):
+            lines.append("{0}: {1} calls, {2} bytes ({3} errors) in {4:.6f}s".format(
+                kind, stats.count, stats.bytes, stats.errors, stats.time))
+        return "\n".join(lines)
+
+
+class metrics(object):
+    """
+    Collects the counts, sizes and latencies of the calls made on a serial
+    interface, and the transactions that they make on the bus.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Sets all the counts back to zero.
+        """
+        with self._lock:
+            self._calls = {}
+            self._transactions = [0, 0, 0.0]
+
+    def snapshot(self):
+        """
+        Returns a :class:`snapshot` of the metrics recorded so far.
+        """
+        with self._lock:
+            calls = dict((kind, call_stats(c[0], c[1], c[2], c[3], tuple(c[4])))
+                         for kind, c in self._calls.items())
+            return snapshot(calls, *self._transactions)
+
+    def wrap_call(self, kind, fn, size):
+        """
+        Returns a function which calls ``fn``, recording it against the
+        given kind of call, with ``size`` giving the number of bytes sent
+        for its arguments.
+        """
+        def call(*args):
+            start = clock()
+            error = True
+            try:
+                result = fn(*args)
+                error = False
+                return result
+            finally:
+                self._record_call(kind, size(args), error, clock() - start)
+
+        return call
+
+    def wrap_transaction(self, fn):
+        """
+        Returns a function which calls ``fn``, recording it as a transaction
+        on the bus.
+        """
+        def transaction(*args):
+            start = clock()
+            error = True
+            try:
+                result = fn(*args)
+                error = False
+                return result
+            finally:
+                elapsed = clock() - start
+                with self._lock:
+                    self._transactions[0] += 1
+                    self._transactions[1] += error
+                    self._transactions[2] += elapsed
+
+        return transaction
+
+    def _record_call(self, kind, size, error, elapsed):
+        bucket = min(int(elapsed * 1e6).bit_length(), buckets - 1)
+        with self._lock:
+            stats = self._calls.get(kind)
+            if stats is None:
+                stats = self._calls[kind] = [0, 0, 0, 0.0, [0] * buckets]
+            stats[0] += 1
+            stats[1] += size
+            stats[2] += error
+            stats[3] += elapsed
+            stats[4][bucket] += 1
+
+
+class instrumented(object):
+    """
+    Mixin for serial interfaces, which records the metrics of the calls
+    made on them once :func:`instrument` is called. Implementing classes
+    wrap their underlying bus in ``_instrument_bus()``.
+    """
+    metrics = None
+
+    def instrument(self, enabled=True):
+        """
+        Starts (or stops) recording the counts, sizes and latencies of the
+        calls made on the interface, and of the transactions made on the
+        bus, in ``metrics``. When not enabled, there is no overhead.
+        """
+        if enabled and self.metrics is None:
+            self.metrics = metrics()
+            # instance attributes take precedence over the class methods
+            self.command = self.metrics.wrap_call("command", self.command, len)
+            self.data = self.metrics.wrap_call("data", self.data, lambda args: len(args[0]))
+            self._instrument_bus(self.metrics)
+        elif not enabled and self.metrics is not None:
+            del self.command
+            del self.data
+            self._instrument_bus(None)
+            del self.metrics
+
+
+class bus(object):
+    """
+    Wraps a bus (an SMBus, SpiDev, etc.) so that each method called on it
+    is recorded as a transaction.
+    """
+    def __init__(self, target, metrics, exclude=("close",)):
+        self._target = target
+        self._metrics = metrics
+        self._exclude = exclude
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or name in self._exclude:
+            return attr
+        return self._metrics.wrap_transaction(attr)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._target, name, value)
@@ -22,6 +22,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import contextlib
+
 
 class noop(object):
     def data(self, data):
@@ -38,3 +40,50 @@ class capabilities(object):
         self.height = height
         self.mode = mode
         self.bounding_box = (0, 0, self.width - 1, self.height - 1)
+
+
+class batching(object):
+    """
+    Mixin for objects which queue up work within a :func:`batch`, and
+    send it in ``flush()``. Batches belong to the thread which started
+    them, so that work from other threads (such as effects) isn't held up
+    by them: implementing classes set ``_batch`` to a ``threading.local()``.
+    """
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Context manager which queues up the work done within it, sending it
+        together at the end. Batches may be nested, and are sent when the
+        outermost one ends. A batch only holds back the work done by the
+        thread which started it.
+        """
+        batch = self._batch
+        if not getattr(batch, "depth", 0):
+            batch.depth = 0
+            batch.pending = []
+
+        batch.depth += 1
+        try:
+            yield self
+        finally:
+            batch.depth -= 1
+            if not batch.depth:
+                self.flush()
+
+    def _batching(self):
+        """
+        Whether this thread is within a batch.
+        """
+        return getattr(self._batch, "depth", 0) > 0
+
+    def _queue(self, *items):
+        self._batch.pending.extend(items)
+
+    def _take(self):
+        """
+        Returns (and forgets) the work queued by this thread.
+        """
+        pending = getattr(self._batch, "pending", None) or []
+        if pending:
+            self._batch.pending = []
+        return pending
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Richard Hull
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Converts 1-bit images into the page-ordered byte layout used by the display
+# RAM of both the SSD1306 and SH1106: each byte holds a vertical strip of 8
+# pixels (LSB uppermost), and bytes run column-by-column across each page in
+# turn, from the top page downwards.
+#
+# There are several interchangeable backends which produce byte-identical
+# output; the fastest one available (timed on a blank frame) is selected at
+# import time, but a different backend may be chosen with the select()
+# function.
+
+import time
+from collections import OrderedDict
+from PIL import Image
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+def pack_python(image, mirror=False):
+    """
+    Reference implementation, written in pure python. This is slow, but
+    serves as a baseline against which the other backends are checked.
+    When ``mirror`` is set, the columns within each page are emitted from
+    right to left.
+    """
+    width, height = image.size
+    pix = list(image.getdata())
+    offsets = [n * width for n in range(8)]
+    buf = bytearray(width * (height // 8))
+    j = 0
+    for y in range(0, height * width, width * 8):
+        if mirror:
+            columns = range(y + width - 1, y - 1, -1)
+        else:
+            columns = range(y, y + width)
+
+        for i in columns:
+            buf[j] = (pix[i] & 0x01) | \
+                     (pix[i + offsets[1]] & 0x01) << 1 | \
+                     (pix[i + offsets[2]] & 0x01) << 2 | \
+                     (pix[i + offsets[3]] & 0x01) << 3 | \
+                     (pix[i + offsets[4]] & 0x01) << 4 | \
+                     (pix[i + offsets[5]] & 0x01) << 5 | \
+                     (pix[i + offsets[6]] & 0x01) << 6 | \
+                     (pix[i + offsets[7]] & 0x01) << 7
+            j += 1
+
+    return bytes(buf)
+
+
+def pack_pil(image, mirror=False):
+    """
+    Uses nothing more than Pillow's C-level transpose operations: rotating
+    the image a quarter turn means that each packed byte of a scanline is
+    a vertical strip of 8 pixels, which then just need re-ordering into
+    pages by treating them as an 8-bit greyscale image.
+    """
+    width, height = image.size
+    strips = image.transpose(Image.ROTATE_270).tobytes()
+    pages = Image.frombytes("L", (height // 8, width), strips)
+    return pages.transpose(Image.TRANSVERSE if mirror else Image.ROTATE_90).tobytes()
+
+
+def pack_numpy(image, mirror=False):
+    """
+    Unpacks the image into a bit array, reshapes it into pages of 8 rows
+    and then uses :func:`numpy.packbits` down each column.
+    """
+    width, height = image.size
+    bits = numpy.unpackbits(numpy.frombuffer(image.tobytes(), dtype=numpy.uint8))
+    bits = bits.reshape(height, -1)[:, :width]
+    return _packbits(bits, mirror)
+
+
+def pack_array(array, mirror=False):
+    """
+    Packs a 2-D numpy array of pixels (rows by columns, where any non-zero
+    value is lit) straight into display RAM order, without going through
+    an image.
+    """
+    return _packbits(numpy.asarray(array), mirror)
+
+
+def _packbits(bits, mirror):
+    height, width = bits.shape
+    # (page, row, column) -> (page, column, row), with rows reversed so that
+    # the uppermost pixel of each strip ends up as the least-significant bit
+    strips = bits.reshape(height // 8, 8, width)[:, ::-1, :].transpose(0, 2, 1)
+    if mirror:
+        strips = strips[:, ::-1, :]
+    return numpy.packbits(strips, axis=-1).tobytes()
+
+
+backends = OrderedDict()
+if numpy is not None:
+    backends["numpy"] = pack_numpy
+backends["pil"] = pack_pil
+backends["python"] = pack_python
+
+backend = None
+_pack = None
+
+clock = getattr(time, "perf_counter", time.time)
+
+
+def _timing(fn, image, repeats=5):
+    """
+    Returns the quickest of several runs of the backend, in seconds.
+    """
+    best = None
+    for _ in range(repeats):
+        start = clock()
+        fn(image, True)
+        elapsed = clock() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def fastest(size=(128, 64)):
+    """
+    Returns the name of the backend which packs a blank frame of the given
+    size quickest. The pure python reference is never the fastest, so
+    isn't timed.
+    """
+    image = Image.new("1", size)
+    names = [name for name in backends if name != "python"] or ["python"]
+    return min(names, key=lambda name: _timing(backends[name], image))
+
+
+def select(name=None):
+    """
+    Selects the named packing backend, one of: ``numpy``, ``pil`` or
+    ``python``. If no name is given, the available backends are timed, and
+    the fastest is chosen.
+    """
+    global backend, _pack
+    if name is None:
+        name = fastest()
+
+    if name not in backends:
+        raise ValueError("Unsupported packing backend: {0}".format(name))
+
+    backend = name
+    _pack = backends[name]
+
+
+def pack(image, mirror=False):
+    """
+    Packs a 1-bit image, whose height must be a multiple of 8, into display
+    RAM order using the currently selected backend.
+    """
+    return _pack(image, mirror)
+
+
+def unpack(buf, width, height, mirror=False):
+    """
+    The reverse of :func:`pack`: turns a frame in display RAM order back
+    into a 1-bit image of the given size.
+    """
+    pages = Image.frombytes("L", (width, height // 8), bytes(buf))
+    strips = pages.transpose(Image.TRANSVERSE if mirror else Image.ROTATE_270).tobytes()
+    return Image.frombytes("1", (height, width), strips).transpose(Image.ROTATE_90)
+
+
+select()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Richard Hull
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Example usage:
+#
+#   from oled.record import recorder, replay
+#
+#   serial = recorder(i2c(port=1, address=0x3C), "display.log")
+#   device = ssd1306(serial)
+#   ...
+#
+#   # later on, replay the traffic to another display at the original speed
+#   replay("display.log", i2c(port=1, address=0x3C))
+#
+#   # or watch it on an emulator
+#   replay("display.log", pygame(), speed=None)
+#
+# The log starts with a magic number and the wall-clock time at which
+# recording started, followed by a record for each call: the kind of call
+# (command or data), the time in seconds since recording started, and the
+# length of the bytes which follow.
+
+import struct
+import threading
+import time
+
+import oled.emulator
+import oled.virtual
+
+clock = getattr(time, "monotonic", time.time)
+
+MAGIC = b"OLEDLOG1"
+COMMAND = 0
+DATA = 1
+
+_started = struct.Struct("<d")
+_header = struct.Struct("<BdI")
+
+
+class recorder(object):
+    """
+    Wraps a serial interface, recording each command and data call made
+    through it to a binary log file (given as a filename or a file opened
+    in binary mode) before passing it on. If no serial interface is given,
+    the calls are just recorded. The log is flushed to disk at least once
+    every ``flush_interval`` seconds, and when the interface is cleaned up.
+    """
+    def __init__(self, serial_interface, file, flush_interval=1.0):
+        self._serial = serial_interface
+        self._fp = file if hasattr(file, "write") else open(file, "wb")
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._start = self._flushed = clock()
+        self._fp.write(MAGIC)
+        self._fp.write(_started.pack(time.time()))
+
+    def __getattr__(self, name):
+        return getattr(self._serial, name)
+
+    @property
+    def max_command_length(self):
+        return getattr(self._serial, "max_command_length", 32)
+
+    def command(self, *cmd):
+        """
+        Records and sends a command or sequence of commands.
+        """
+        self._record(COMMAND, bytearray(cmd))
+        if self._serial is not None:
+            self._serial.command(*cmd)
+
+    def data(self, data):
+        """
+        Records and sends a sequence of data bytes.
+        """
+        self._record(DATA, bytearray(data))
+        if self._serial is not None:
+            self._serial.data(data)
+
+    def cleanup(self):
+        """
+        Closes the log, and cleans up the serial interface.
+        """
+        with self._lock:
+            self._fp.close()
+        if self._serial is not None:
+            self._serial.cleanup()
+
+    def _record(self, kind, payload):
+        with self._lock:
+            if self._fp.closed:
+                return
+            now = clock()
+            self._fp.write(_header.pack(kind, now - self._start, len(payload)))
+            self._fp.write(payload)
+            if now - self._flushed >= self._flush_interval:
+                self._fp.flush()
+                self._flushed = now
+
+
+def read(file):
+    """
+    Reads a log written by a :class:`recorder` (given as a filename or a
+    file opened in binary mode), yielding a tuple of (time, kind, payload)
+    for each call, where kind is :data:`COMMAND` or :data:`DATA`.
+    """
+    fp = file if hasattr(file, "read") else open(file, "rb")
+    try:
+        _read_start(fp)
+        while True:
+            header = fp.read(_header.size)
+            if len(header) < _header.size:
+                # the end of the log (or a record cut short by a crash)
+                return
+            kind, timestamp, size = _header.unpack(header)
+            payload = fp.read(size)
+            if len(payload) < size:
+                return
+            yield timestamp, kind, bytearray(payload)
+    finally:
+        if fp is not file:
+            fp.close()
+
+
+def started(file):
+    """
+    Returns the wall-clock time (in seconds since the epoch) at which a log
+    was recorded.
+    """
+    fp = file if hasattr(file, "read") else open(file, "rb")
+    try:
+        return _read_start(fp)
+    finally:
+        if fp is not file:
+            fp.close()
+
+
+def _read_start(fp):
+    if fp.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a recorded serial log")
+    start = fp.read(_started.size)
+    if len(start) < _started.size:
+        raise ValueError("Not a recorded serial log")
+    return _started.unpack(start)[0]
+
+
+def replay(file, target, speed=1.0, sleep=time.sleep, chip="ssd1306"):
+    """
+    Replays a recorded log to a target with ``command()`` and ``data()``
+    methods: a serial interface, or a device. The calls are spaced out as
+    they were recorded, sped up by the given factor; if ``speed`` is
+    ``None``, they are replayed as fast as possible. Returns the number of
+    calls replayed.
+
+    As an emulator only takes whole images, the calls to one are run
+    through a virtual controller for the given ``chip`` (see
+    :mod:`oled.virtual`), and what it shows is displayed on the emulator.
+    A target which keeps a shadow of the display RAM (a device) is
+    invalidated afterwards, as the replayed calls went behind its back.
+    """
+    invalidate = getattr(target, "invalidate", None)
+    if isinstance(target, oled.emulator.emulator):
+        target = _screen(target, chip)
+    elif not all(callable(getattr(target, name, None)) for name in ("command", "data")):
+        raise ValueError("Can't replay a log to {0!r}".format(target))
+
+    count = 0
+    start = clock()
+    try:
+        for timestamp, kind, payload in read(file):
+            if speed is not None:
+                delay = timestamp / speed - (clock() - start)
+                if delay > 0:
+                    sleep(delay)
+
+            if kind == COMMAND:
+                target.command(*payload)
+            else:
+                target.data(payload)
+            count += 1
+    finally:
+        if callable(invalidate):
+            invalidate()
+    return count
+
+
+class _screen(object):
+    """
+    Runs the calls replayed to an emulator through a virtual controller,
+    displaying on the emulator whatever the panel would have shown.
+    """
+    def __init__(self, emulator, chip):
+        self._emulator = emulator
+        self._controller = getattr(oled.virtual, chip)(emulator.width, emulator.height)
+        self._shown = None
+
+    def command(self, *cmd):
+        self._controller.command(*cmd)
+        self._update()
+
+    def data(self, data):
+        self._controller.data(data)
+        self._update()
+
+    def _update(self):
+        image = self._controller.image()
+        contents = image.tobytes()
+        if contents != self._shown:
+            self._shown = contents
+            self._emulator.display(image.convert(self._emulator.mode))
@@ -22,8 +22,12 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import time
+
 from PIL import Image, ImageDraw
 
+clock = getattr(time, "monotonic", time.time)
+
 
 class canvas(object):
     """
@@ -47,3 +51,159 @@ class canvas(object):
 
         del self.draw   # Tidy up the resources
         return False    # Never suppress exceptions
+
+
+class persistent_canvas(object):
+    """
+    A canvas to be used again for frame after frame, without allocating
+    anything per frame. It owns a pair of images, each with its own
+    `ImageDraw` object, and takes turns to draw onto them: entering the
+    with-block clears the back image (or, if ``keep`` is set, copies the
+    previous frame into it, so drawing carries on from there), and leaving
+    it displays the back image, which then becomes the front one.
+    """
+    def __init__(self, device, keep=False):
+        size = (device.width, device.height)
+        self._images = [Image.new(device.mode, size), Image.new(device.mode, size)]
+        self._draws = [ImageDraw.Draw(image) for image in self._images]
+        self._box = (0, 0) + size
+        self._back = 0
+        self.device = device
+        self.keep = keep
+
+    @property
+    def image(self):
+        """
+        The back image, which is being drawn onto.
+        """
+        return self._images[self._back]
+
+    @property
+    def front(self):
+        """
+        The image which was last displayed.
+        """
+        return self._images[1 - self._back]
+
+    def __enter__(self):
+        # both are done in place, without allocating another image
+        if self.keep:
+            self.image.paste(self.front, self._box)
+        else:
+            self.image.paste(0, self._box)
+        return self._draws[self._back]
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.device.display(self.image)
+            self._back = 1 - self._back
+        return False    # Never suppress exceptions
+
+
+class frame_loop(object):
+    """
+    Runs an animation, calling ``render(draw, t)`` to draw each frame onto
+    a :class:`persistent_canvas`, where ``t`` is the time (in seconds,
+    from the start) at which the frame is due. Frames are paced to ``fps``
+    on a fixed timetable, so that timing errors don't build up, and if a
+    frame overruns by more than a whole interval, the frames which are
+    then too late are dropped. With ``adaptive`` set, the rate is lowered
+    to what the device can keep up with, judging by how long recent frames
+    have taken, so that animations slow down evenly instead of stuttering.
+    """
+    # the weight given to each new measurement in the running averages
+    smoothing = 0.2
+
+    def __init__(self, device, render, fps=30, adaptive=True, keep=False,
+                 sleep=time.sleep):
+        assert(fps > 0)
+        self.canvas = persistent_canvas(device, keep)
+        self.target_fps = fps
+        self.adaptive = adaptive
+        self._render = render
+        self._sleep = sleep
+        self._running = False
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Sets the frame counts and timings back to zero.
+        """
+        self.frames = 0
+        self.frames_dropped = 0
+        # running averages, in seconds
+        self.render_time = 0.0
+        self.transfer_time = 0.0
+        self._period = 0.0
+        self._last = None
+
+    @property
+    def interval(self):
+        """
+        The time between frames (in seconds) currently being aimed for.
+        """
+        interval = 1.0 / self.target_fps
+        if self.adaptive:
+            interval = max(interval, self.render_time + self.transfer_time)
+        return interval
+
+    @property
+    def fps(self):
+        """
+        The measured frame rate.
+        """
+        return 1.0 / self._period if self._period else 0.0
+
+    def run(self, frames=None):
+        """
+        Shows frames until :func:`stop` is called, or ``frames`` frames
+        have been shown.
+        """
+        self._running = True
+        start = deadline = clock()
+        count = 0
+        while self._running and (frames is None or count < frames):
+            delay = deadline - clock()
+            if delay > 0:
+                self._sleep(delay)
+
+            self.step(deadline - start)
+            count += 1
+
+            interval = self.interval
+            deadline += interval
+            late = clock() - deadline
+            if late >= interval:
+                missed = int(late / interval)
+                deadline += missed * interval
+                self.frames_dropped += missed
+
+    def stop(self):
+        """
+        Stops :func:`run` once the current frame has been shown.
+        """
+        self._running = False
+
+    def step(self, t):
+        """
+        Draws and shows a single frame, for time ``t``.
+        """
+        started = clock()
+        with self.canvas as draw:
+            self._render(draw, t)
+            drawn = clock()
+        done = clock()
+
+        # the first measurement of each starts its average off, as a
+        # genuine average of zero can't be told apart from no samples
+        first = not self.frames
+        self.render_time = self._average(self.render_time, drawn - started, first)
+        self.transfer_time = self._average(self.transfer_time, done - drawn, first)
+        if self._last is not None:
+            self._period = self._average(self._period, started - self._last,
+                                         self.frames == 1)
+        self._last = started
+        self.frames += 1
+
+    def _average(self, mean, value, first):
+        return value if first else mean + self.smoothing * (value - mean)
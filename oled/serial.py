@@ -22,8 +22,21 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import errno
+import threading
 
-class i2c(object):
+import oled.metrics
+import oled.mixin
+
+
+# errors with which I2C adapters reject unsupported message sizes
+_unsupported = (errno.EINVAL, errno.EOPNOTSUPP, errno.EMSGSIZE)
+
+# the flag marking an I2C message as a read
+_I2C_M_RD = 0x0001
+
+
+class i2c(oled.metrics.instrumented):
     """
     Wrap an I2C interface to provide data and command methods
 
@@ -32,63 +45,480 @@ class i2c(object):
         if both are, then bus takes precedence.
      2. If bus is provided, there is an implicit expectation
         that it has already been opened.
+     3. Devices sharing the same ``bus_id`` are on the same physical
+        bus, so cannot be written to at the same time.
+     4. In bulk mode (the default), each transfer is sent as combined
+        I2C messages through a single ``i2c_rdwr`` ioctl, rather than
+        as a series of 32-byte SMBus block writes. Each message holds
+        the control byte plus up to ``max_message_size - 1`` bytes of
+        payload. Adapters that reject such messages cause a permanent
+        fall back to SMBus block writes.
     """
-    def __init__(self, bus=None, port=1, address=0x3C):
+    # an SMBus block write carries at most 32 bytes
+    max_command_length = 32
+
+    # the kernel limit on the number of messages in one i2c_rdwr ioctl
+    max_messages = 42
+
+    def __init__(self, bus=None, port=1, address=0x3C, bulk=True, max_message_size=4096):
         import smbus2
+        assert(max_message_size > 1)
         self._cmd_mode = 0x00
         self._data_mode = 0x40
         self._bus = bus or smbus2.SMBus(port)
         self._addr = address
+        if isinstance(self._bus, (i2c_bus, mux_channel)):
+            # shared with other interfaces, which are on the same bus
+            self._bus._attach()
+            self.bus_id = self._bus.bus_id
+        else:
+            self.bus_id = ("i2c", port if bus is None else id(bus))
+        self._i2c_msg = smbus2.i2c_msg
+        self._max_message_size = max_message_size
+        self.bulk = bulk and hasattr(self._bus, "i2c_rdwr")
+        # a bus may take fewer messages in each transaction (see
+        # oled.arbiter): splitting them up here means that falling back to
+        # block writes can't repeat messages that were already sent
+        if hasattr(type(self._bus), "max_messages") and self._bus.max_messages:
+            self.max_messages = min(self._bus.max_messages, self.max_messages)
+
+    @property
+    def bulk(self):
+        """
+        Whether transfers are sent as combined I2C messages.
+        """
+        return self._bulk
+
+    @bulk.setter
+    def bulk(self, value):
+        self._bulk = bool(value)
+        self.max_command_length = self._max_message_size - 1 if value else 32
 
     def command(self, *cmd):
         """
         Sends a command or sequence of commands through to the I2C address
-        - maximum allowed is 32 bytes in one go.
+        - maximum allowed is 32 bytes in one go (or one less than the
+        maximum message size in bulk mode).
         """
-        assert(len(cmd) <= 32)
-        self._bus.write_i2c_block_data(self._addr, self._cmd_mode, list(cmd))
+        assert(len(cmd) <= self.max_command_length)
+        if not (self._bulk and self._write_messages(self._cmd_mode, cmd)):
+            # having fallen back from bulk mode, a longer command needs
+            # splitting into block writes
+            self._write_blocks(self._cmd_mode, cmd)
 
     def data(self, data):
         """
         Sends a data byte or sequence of data bytes through to the I2C
         address - maximum allowed in one transaction is 32 bytes, so if
-        data is larger than this, it is sent in chunks.
+        data is larger than this, it is sent in chunks. In bulk mode, the
+        data is sent in as few combined messages as possible.
         """
+        if not (self._bulk and self._write_messages(self._data_mode, data)):
+            self._write_blocks(self._data_mode, data)
+
+    def _write_blocks(self, mode, data):
         i = 0
         n = len(data)
         write = self._bus.write_i2c_block_data
+        # a memoryview iterates as characters on Python 2
+        view = isinstance(data, memoryview)
         while i < n:
-            write(self._addr, self._data_mode, list(data[i:i + 32]))
+            block = data[i:i + 32]
+            write(self._addr, mode, list(bytearray(block) if view else block))
             i += 32
 
+    def _write_messages(self, mode, data):
+        """
+        Writes the data as a sequence of control-byte prefixed messages,
+        returning False if the adapter rejected them before anything was
+        transferred (in which case bulk mode is switched off).
+        """
+        size = self._max_message_size - 1
+        msgs = []
+        for i in range(0, len(data), size):
+            buf = bytearray([mode])
+            buf.extend(data[i:i + size])
+            msgs.append(self._i2c_msg.write(self._addr, buf))
+
+        sent = 0
+        try:
+            while sent < len(msgs):
+                batch = msgs[sent:sent + self.max_messages]
+                self._bus.i2c_rdwr(*batch)
+                sent += len(batch)
+        except (IOError, OSError) as e:
+            # only errors raised when the adapter refuses the request
+            # outright are safe to retry: anything else may have left a
+            # partial transfer on the wire
+            if sent > 0 or e.errno not in _unsupported:
+                raise
+            self.bulk = False
+            return False
+        return True
+
     def cleanup(self):
         """
         Clean up I2C resources
         """
         self._bus.close()
 
+    def _watch(self, invalidate):
+        # a shared bus sends queued writes later on, so has to tell the
+        # device if they fail
+        if isinstance(self._bus, (i2c_bus, mux_channel)):
+            self._bus._watch(invalidate)
+
+    def _instrument_bus(self, metrics):
+        if isinstance(self._bus, (i2c_bus, mux_channel)):
+            # a shared bus may hold writes back, so records them itself
+            # once they are actually sent
+            self._bus._instrument(self._addr, metrics)
+        elif metrics is None:
+            self._bus = self._bus._target
+        else:
+            self._bus = oled.metrics.bus(self._bus, metrics)
+
+
+class _shared(oled.mixin.batching):
+    """
+    Base class for buses shared by several :class:`i2c` interfaces, which
+    queue up writes within a :func:`batch`. If sending queued writes fails,
+    the devices using the bus are invalidated, and the underlying bus is
+    closed once every interface using it has been cleaned up.
+    """
+    def __init__(self, bus, port):
+        import smbus2
+        self._i2c_msg = smbus2.i2c_msg
+        self._bus = bus or smbus2.SMBus(port)
+        self.bus_id = ("i2c", port if bus is None else id(bus))
+        # cleared once the adapter has refused combined messages
+        self.bulk = True
+        self._batch = threading.local()
+        self._users = 0
+        self._watchers = []
+        self._lock = threading.RLock()
+
+    def close(self):
+        """
+        Sends any queued writes and, once every interface using the bus
+        has been cleaned up, closes it.
+        """
+        with self._lock:
+            self.flush()
+            self._users -= 1
+            if self._users <= 0:
+                self._bus.close()
+
+    def _attach(self):
+        with self._lock:
+            self._users += 1
+
+    def _watch(self, invalidate):
+        with self._lock:
+            self._watchers.append(invalidate)
+
+    def _failed(self):
+        """
+        Called when queued writes have failed, by which time the devices
+        will have updated their shadow copies of the display RAM to frames
+        that were never (fully) sent.
+        """
+        for invalidate in self._watchers:
+            invalidate()
+
+    def _rdwr(self, msgs, recorders):
+        """
+        Sends write messages with an ``i2c_rdwr`` ioctl, falling back for
+        good to SMBus block writes (of each message in turn) if the adapter
+        refuses them before anything is transferred.
+        """
+        if self.bulk:
+            try:
+                return _recorded(self._bus.i2c_rdwr, recorders)(*msgs)
+            except (IOError, OSError) as e:
+                if e.errno not in _unsupported:
+                    raise
+                self.bulk = False
+
+        write = _recorded(self._bus.write_i2c_block_data, recorders)
+        for msg in msgs:
+            buf = bytearray(list(msg))
+            for i in range(1, len(buf), 32):
+                write(msg.addr, buf[0], list(buf[i:i + 32]))
+
+
+class i2c_bus(_shared):
+    """
+    An I2C bus which is shared by the :class:`i2c` interfaces of several
+    devices (at different addresses), for example::
+
+        bus = i2c_bus(port=1)
+        left = ssd1306(i2c(bus=bus, address=0x3C))
+        right = ssd1306(i2c(bus=bus, address=0x3D))
+
+        with bus.batch():
+            left.display(image1)
+            right.display(image2)
+
+    Within a batch, the writes to all the devices are queued up, and are
+    then sent together as the messages of a single ``i2c_rdwr`` ioctl
+    (or as few as the kernel allows), rather than one (or more) system
+    calls per write. Adapters which can't take combined messages get
+    block writes instead. If sending them fails, the devices on the bus
+    are invalidated, so that their next frames are sent in full. The
+    underlying bus is closed once every interface sharing it has been
+    cleaned up.
+    """
+    def __init__(self, bus=None, port=1):
+        super(i2c_bus, self).__init__(bus, port)
+        # the metrics of instrumented interfaces, by address
+        self._metrics = {}
+
+    def flush(self):
+        """
+        Sends any writes queued by this thread.
+        """
+        msgs = self._take()
+        if not msgs:
+            return
+
+        with self._lock:
+            try:
+                for i in range(0, len(msgs), i2c.max_messages):
+                    self._send(msgs[i:i + i2c.max_messages])
+            except Exception:
+                self._failed()
+                raise
+
+    def i2c_rdwr(self, *msgs):
+        """
+        Sends (or within a batch, queues) a sequence of write messages.
+        """
+        if self._batching():
+            self._queue(*msgs)
+        else:
+            with self._lock:
+                self._send(msgs)
+
+    def write_i2c_block_data(self, address, register, data):
+        """
+        Sends (or within a batch, queues) an SMBus block write.
+        """
+        if self._batching():
+            buf = bytearray([register])
+            buf.extend(data)
+            self._queue(self._i2c_msg.write(address, buf))
+        else:
+            with self._lock:
+                write = _recorded(self._bus.write_i2c_block_data,
+                                  [self._metrics.get(address)])
+                write(address, register, data)
+
+    def _send(self, msgs):
+        self._rdwr(msgs, set(self._metrics.get(msg.addr) for msg in msgs))
+
+    def _instrument(self, address, metrics):
+        with self._lock:
+            if metrics is None:
+                self._metrics.pop(address, None)
+            else:
+                self._metrics[address] = metrics
 
-class spi(object):
+
+def _recorded(fn, recorders):
+    """
+    Wraps a bus method so that calling it is recorded as a transaction by
+    each of the given metrics (any ``None`` amongst them are ignored).
+    """
+    for recorder in recorders:
+        if recorder is not None:
+            fn = recorder.wrap_transaction(fn)
+    return fn
+
+
+class tca9548a(_shared):
+    """
+    A TCA9548A (or compatible) I2C multiplexer, which connects one of its
+    eight downstream channels at a time to the bus. This allows several
+    devices with the same address to be used, for example::
+
+        mux = tca9548a(port=1, address=0x70)
+        devices = [ssd1306(i2c(bus=mux.channel(n))) for n in range(8)]
+
+    The channel last selected is remembered, so that it is only selected
+    again when a different one is needed. Within a :func:`batch`, writes
+    are queued up, and when the batch ends they are sent grouped by
+    channel (keeping the order of the writes on each channel), so each
+    channel is selected at most once. If sending them fails, the devices
+    behind the multiplexer are invalidated, so that their next frames are
+    sent in full.
+    """
+    def __init__(self, bus=None, port=1, address=0x70):
+        super(tca9548a, self).__init__(bus, port)
+        self._addr = address
+        self.selected = None
+
+    def channel(self, channel):
+        """
+        Returns a bus-like object for the given channel (0 to 7), which may
+        be passed as the ``bus`` of an :class:`i2c` interface.
+        """
+        assert(0 <= channel < 8)
+        return mux_channel(self, channel)
+
+    def select(self, channel):
+        """
+        Selects the given channel, unless it is already selected.
+        """
+        with self._lock:
+            if channel != self.selected:
+                self._bus.write_byte(self._addr, 1 << channel)
+                self.selected = channel
+
+    def invalidate(self):
+        """
+        Forgets which channel is selected, so that it is selected again
+        before the next transfer. This should be called if the multiplexer
+        may have been switched by other means.
+        """
+        self.selected = None
+
+    def flush(self):
+        """
+        Sends any writes queued by this thread, starting with the channel
+        that is already selected.
+        """
+        pending = self._take()
+        if not pending:
+            return
+
+        with self._lock:
+            selected = self.selected
+            pending.sort(key=lambda write: (write[0] != selected, write[0]))
+            try:
+                for channel, name, args, recorders in pending:
+                    self.select(channel)
+                    if name == "i2c_rdwr":
+                        self._rdwr(args, recorders)
+                    else:
+                        _recorded(getattr(self._bus, name), recorders)(*args)
+            except Exception:
+                # the multiplexer may or may not have switched channel
+                self.selected = None
+                self._failed()
+                raise
+
+    def _call(self, channel, name, args, write=False, recorders=()):
+        if write and self._batching():
+            self._queue((channel, name, args, recorders))
+            return
+
+        # anything else has to wait for the queued writes
+        self.flush()
+        with self._lock:
+            self.select(channel)
+            return _recorded(getattr(self._bus, name), recorders)(*args)
+
+
+class mux_channel(object):
+    """
+    A bus-like object for one channel of a :class:`tca9548a` multiplexer.
+    Any SMBus method may be called on it, with the channel being selected
+    first if need be.
+    """
+    def __init__(self, mux, channel):
+        self.mux = mux
+        self.channel = channel
+        self.bus_id = mux.bus_id
+        # the metrics of instrumented interfaces, by address
+        self._metrics = {}
+
+    def __getattr__(self, name):
+        def call(*args):
+            return self.mux._call(self.channel, name, args)
+
+        return call
+
+    def i2c_rdwr(self, *msgs):
+        # messages which read from the device can't be held back
+        write = not any(msg.flags & _I2C_M_RD for msg in msgs)
+        recorders = set(self._metrics.get(msg.addr) for msg in msgs)
+        return self.mux._call(self.channel, "i2c_rdwr", msgs, write, recorders)
+
+    def write_i2c_block_data(self, address, register, data):
+        args = (address, register, data)
+        recorders = [self._metrics.get(address)]
+        return self.mux._call(self.channel, "write_i2c_block_data", args, True, recorders)
+
+    def batch(self):
+        return self.mux.batch()
+
+    def close(self):
+        self.mux.close()
+
+    def _attach(self):
+        self.mux._attach()
+
+    def _watch(self, invalidate):
+        self.mux._watch(invalidate)
+
+    def _instrument(self, address, metrics):
+        if metrics is None:
+            self._metrics.pop(address, None)
+        else:
+            self._metrics[address] = metrics
+
+
+class spi(oled.metrics.instrumented):
     """
     Wraps an SPI interface to provide data and command methods.
     The DC pin (Data/Command select) defaults to GPIO 24 (BCM).
     The RST pin (Reset) defaults to GPIO 25 (BCM).
+
+    Transfers are split into chunks of at most ``transfer_size`` bytes,
+    which defaults to the spidev kernel buffer size. Devices sharing the
+    same ``bus_id`` are on the same SPI controller, so cannot be written
+    to at the same time.
     """
-    def __init__(self, spi=None, gpio=None, port=0, device=0, bus_speed_hz=8000000, bcm_DC=24, bcm_RST=25):
+    # the default size of the spidev transfer buffer
+    max_command_length = 4096
+
+    def __init__(self, spi=None, gpio=None, port=0, device=0, bus_speed_hz=8000000, bcm_DC=24, bcm_RST=25, transfer_size=None):
         self._gpio = gpio or self.__rpi_gpio__()
         self._spi = spi or self.__spidev__()
         self._spi.open(port, device)
         self._spi.max_speed_hz = bus_speed_hz
         self._bcm_DC = bcm_DC
         self._bcm_RST = bcm_RST
+        self.bus_id = ("spi", port)
+        # identifies this device, by chip select, among those on the bus
+        self.device_id = ("spi", port, device)
         self._cmd_mode = self._gpio.LOW    # Command mode = Hold low
         self._data_mode = self._gpio.HIGH  # Data mode = Pull high
+        self._dc = None
+        self._transfer_size = transfer_size or _spidev_bufsiz()
+        self.max_command_length = self._transfer_size
+
+        # spidev 3.3+ can write any buffer without first converting it
+        # to a list; older versions only have xfer2
+        self._writebytes2 = getattr(self._spi, "writebytes2", None)
 
         self._gpio.setmode(self._gpio.BCM)
         self._gpio.setup(self._bcm_DC, self._gpio.OUT)
         self._gpio.setup(self._bcm_RST, self._gpio.OUT)
         self._gpio.output(self._bcm_RST, self._gpio.HIGH)  # Keep RESET pulled high
 
+    @property
+    def bus_speed_hz(self):
+        """
+        The SPI clock rate, which can be changed between transfers.
+        """
+        return self._spi.max_speed_hz
+
+    @bus_speed_hz.setter
+    def bus_speed_hz(self, value):
+        self._spi.max_speed_hz = value
+
     def __rpi_gpio__(self):
         # RPi.GPIO _really_ doesn't like being run on anything other than
         # a Raspberry Pi... this is imported here so we can swap out the
@@ -106,15 +536,37 @@ class spi(object):
         """
         Sends a command or sequence of commands through to the SPI device.
         """
-        self._gpio.output(self._bcm_DC, self._cmd_mode)
-        self._spi.xfer2(list(cmd))
+        self._set_mode(self._cmd_mode)
+        self._write(bytearray(cmd))
 
     def data(self, data):
         """
         Sends a data byte or sequence of data bytes through to the SPI device.
+        Any object supporting the buffer protocol (bytes, bytearray,
+        memoryview) is sent without being copied.
         """
-        self._gpio.output(self._bcm_DC, self._data_mode)
-        self._spi.xfer2(list(data))
+        self._set_mode(self._data_mode)
+        try:
+            view = memoryview(data)
+        except TypeError:
+            view = memoryview(bytearray(data))
+        self._write(view)
+
+    def _set_mode(self, mode):
+        # the DC line only needs changing when switching between
+        # commands and data
+        if self._dc != mode:
+            self._gpio.output(self._bcm_DC, mode)
+            self._dc = mode
+
+    def _write(self, buf):
+        size = self._transfer_size
+        for i in range(0, len(buf), size):
+            chunk = buf[i:i + size]
+            if self._writebytes2:
+                self._writebytes2(chunk)
+            else:
+                self._spi.xfer2(list(bytearray(chunk)))
 
     def cleanup(self):
         """
@@ -122,3 +574,23 @@ class spi(object):
         """
         self._spi.close()
         self._gpio.cleanup()
+
+    def _instrument_bus(self, metrics):
+        if metrics is None:
+            self._spi = self._spi._target
+            self._writebytes2 = getattr(self._spi, "writebytes2", None)
+        else:
+            self._spi = oled.metrics.bus(self._spi, metrics)
+            if self._writebytes2:
+                self._writebytes2 = metrics.wrap_transaction(self._writebytes2)
+
+
+def _spidev_bufsiz(default=4096):
+    """
+    Returns the size of the spidev kernel transfer buffer.
+    """
+    try:
+        with open("/sys/module/spidev/parameters/bufsiz") as fp:
+            return int(fp.read())
+    except (IOError, OSError, ValueError):
+        return default
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Richard Hull
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Example usage:
+#
+#   from oled.threaded import threaded
+#
+#   device = threaded(ssd1306(serial))
+#
+#   with canvas(device) as draw:
+#      ...
+#
+# Frames are handed over to a background thread which sends them to the
+# display, so that the next frame can be drawn while the previous one is
+# still being transferred over the bus.
+
+import atexit
+import threading
+
+
+class threaded(object):
+    """
+    Wraps a device so that :func:`display` returns straight away, with the
+    frame being sent to the device on a background thread. Only the most
+    recent frame is kept: if a new frame arrives before the previous one
+    has been sent, the previous one is dropped. The number of frames sent
+    and dropped are counted in the ``sent`` and ``dropped`` attributes.
+
+    Any other method called on the wrapper waits for the pending frame to
+    be sent, and is then passed through to the device, so that calls are
+    applied in order. Pending frames are flushed at exit, before the
+    device is cleaned up.
+    """
+    def __init__(self, device):
+        self._device = device
+        self._condition = threading.Condition()
+        # held while the device is in use by either thread
+        self._lock = threading.Lock()
+        self._pending = None
+        self._busy = False
+        self._closed = False
+        self._error = None
+        self.sent = 0
+        self.dropped = 0
+
+        self._thread = threading.Thread(target=self._run, name="oled-display")
+        self._thread.daemon = True
+        self._thread.start()
+
+        # atexit handlers run in reverse order, so this happens before the
+        # device's own cleanup
+        atexit.register(self.close)
+
+    def __getattr__(self, name):
+        attr = getattr(self._device, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self.flush()
+            with self._lock:
+                return attr(*args, **kwargs)
+
+        return call
+
+    @property
+    def device(self):
+        """
+        The wrapped device.
+        """
+        return self._device
+
+    def display(self, image):
+        """
+        Queues a copy of the image (or numpy array) to be displayed,
+        replacing any frame which has not been sent yet.
+        """
+        self._post(self._device.display, image.copy())
+
+    def display_raw(self, buf):
+        """
+        Queues a copy of a packed frame to be displayed, replacing any frame
+        which has not been sent yet.
+        """
+        self._post(self._device.display_raw, bytearray(buf))
+
+    def flush(self):
+        """
+        Waits until the pending frame (if any) has been sent. Any error
+        raised while sending a frame is re-raised here.
+        """
+        with self._condition:
+            while self._pending is not None or self._busy:
+                self._condition.wait()
+            self._raise_error()
+
+    def close(self):
+        """
+        Sends the pending frame (if any), and then stops the background
+        thread. Further frames may not be displayed afterwards.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _post(self, fn, frame):
+        with self._condition:
+            self._raise_error()
+            assert(not self._closed)
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = (fn, frame)
+            self._condition.notify_all()
+
+    def _raise_error(self):
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                (fn, frame), self._pending = self._pending, None
+                self._busy = True
+
+            error = None
+            try:
+                with self._lock:
+                    fn(frame)
+            except Exception as e:
+                error = e
+
+            with self._condition:
+                self._busy = False
+                if error is None:
+                    self.sent += 1
+                else:
+                    self._error = error
+                self._condition.notify_all()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Richard Hull
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Example usage:
+#
+#   from oled import timing
+#   from oled.emulator import pygame
+#
+#   device = timing.create("ssd1306", transport="i2c", speed_hz=400000,
+#                          emulator=pygame(), throttle=True)
+#   ...
+#   print(device.predicted_fps, device.utilization)
+#
+# Simulated SMBus and SPI buses, which charge the time that each transfer
+# would take on the wire (plus an overhead for each transaction) and pass
+# what is sent on to a virtual display controller. The real serial
+# interfaces and device drivers run on top of them, so the frame rate they
+# predict accounts for the packing, chunking and dirty-region tracking
+# which would happen on the hardware. The timings are estimates: the
+# overheads in particular depend on the host and its kernel drivers.
+
+import time
+
+import oled.device
+import oled.serial
+import oled.virtual
+
+clock = getattr(time, "monotonic", time.time)
+
+
+class bus(object):
+    """
+    Base class for simulated buses, which accumulates the time that they
+    have been busy for.
+    """
+    def __init__(self, controller, overhead):
+        self.controller = controller
+        self.overhead = overhead
+        self.reset_counts()
+
+    def reset_counts(self):
+        """
+        Sets the busy time (in seconds), and the counts of transactions and
+        bytes sent, back to zero.
+        """
+        self.busy_time = 0.0
+        self.transactions = 0
+        self.bytes = 0
+        # the wall-clock time at which the bus will next be free
+        self.free_at = 0.0
+
+    def charge(self, duration, size=0, transaction=True):
+        """
+        Accounts for the bus being busy for ``duration`` seconds.
+        """
+        self.free_at = max(self.free_at, clock()) + duration
+        self.busy_time += duration
+        self.bytes += size
+        if transaction:
+            self.transactions += 1
+
+    def close(self):
+        pass
+
+
+class smbus(bus):
+    """
+    A simulated SMBus, for use as the ``bus`` of an :class:`oled.serial.i2c`
+    interface. Each byte takes 9 clock cycles (8 bits and an acknowledge),
+    with an extra cycle each for the start and stop conditions, and each
+    transaction (system call) has a fixed ``overhead`` in seconds.
+    """
+    def __init__(self, controller, speed_hz=400000, overhead=60e-6):
+        super(smbus, self).__init__(controller, overhead)
+        self.speed_hz = speed_hz
+
+    def write_i2c_block_data(self, address, register, data):
+        self._charge([1 + len(data)])
+        self._send(register, bytearray(data))
+
+    def i2c_rdwr(self, *msgs):
+        # the messages are sent by a single system call
+        self._charge([len(msg) for msg in msgs])
+        for msg in msgs:
+            buf = bytearray(list(msg))
+            self._send(buf[0], buf[1:])
+
+    def _charge(self, lengths):
+        # each message has a start, address byte, payload and stop
+        cycles = sum(2 + 9 * (1 + n) for n in lengths)
+        self.charge(self.overhead + cycles / float(self.speed_hz), sum(lengths))
+
+    def _send(self, control, payload):
+        if control & 0x40:
+            self.controller.data(payload)
+        else:
+            self.controller.command(*payload)
+
+
+class spidev(bus):
+    """
+    A simulated SpiDev, for use with an :class:`oled.serial.spi` interface
+    along with its ``gpio`` attribute. Each transfer takes 8 clock cycles
+    per byte at ``max_speed_hz`` (as set by the interface), plus a fixed
+    ``overhead`` in seconds, and each change of the DC line takes
+    ``dc_overhead`` seconds.
+    """
+    def __init__(self, controller, overhead=30e-6, dc_overhead=5e-6, bcm_DC=24):
+        super(spidev, self).__init__(controller, overhead)
+        self.max_speed_hz = 8000000
+        self.gpio = gpio(self, dc_overhead, bcm_DC)
+        self._data = False
+
+    def open(self, port, device):
+        pass
+
+    def writebytes2(self, data):
+        self._transfer(bytearray(data))
+
+    def xfer2(self, data):
+        self._transfer(bytearray(data))
+        return [0] * len(data)
+
+    def _transfer(self, buf):
+        self.charge(self.overhead + 8 * len(buf) / float(self.max_speed_hz), len(buf))
+        if self._data:
+            self.controller.data(buf)
+        else:
+            self.controller.command(*buf)
+
+
+class gpio(object):
+    """
+    Simulated GPIO pins, as used by an SPI interface for its DC line.
+    """
+    BCM = 11
+    OUT = 0
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self, spi, dc_overhead, bcm_DC):
+        self._spi = spi
+        self._dc_overhead = dc_overhead
+        self._bcm_DC = bcm_DC
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction):
+        pass
+
+    def output(self, pin, value):
+        if pin == self._bcm_DC:
+            self._spi.charge(self._dc_overhead, transaction=False)
+            self._spi._data = value == self.HIGH
+
+    def cleanup(self):
+        pass
+
+
+class device(object):
+    """
+    Wraps a device whose serial interface runs over a simulated bus,
+    measuring the bus time taken by each frame. From this it predicts the
+    frame rate that the bus allows (``predicted_fps``), and how much of
+    the time the bus would have been busy (``utilization``).
+
+    If an emulator is given, it is shown what the panel would display
+    after each call. With ``throttle`` set, each call blocks until the
+    simulated bus would have finished, so the program runs no faster than
+    it would on the hardware.
+    """
+    def __init__(self, target, bus, emulator=None, throttle=False):
+        self._target = target
+        self.bus = bus
+        self._emulator = emulator
+        self.throttle = throttle
+        self.reset_counts()
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            self._update()
+            return result
+
+        return call
+
+    def reset_counts(self):
+        """
+        Starts counting frames and measuring bus time afresh.
+        """
+        self.bus.reset_counts()
+        self.frames = 0
+        self.frame_time = 0.0
+        self._started = clock()
+
+    def display(self, image):
+        """
+        Displays the image through the device driver, measuring the bus
+        time that the frame takes.
+        """
+        busy = self.bus.busy_time
+        self._target.display(image)
+        self.frames += 1
+        self.frame_time = self.bus.busy_time - busy
+        self._update()
+
+    @property
+    def predicted_fps(self):
+        """
+        The average number of frames per second which the bus can carry.
+        """
+        return self.frames / self.bus.busy_time if self.bus.busy_time else 0.0
+
+    @property
+    def utilization(self):
+        """
+        The proportion of the (wall-clock) time that the bus has been busy
+        for since counting started.
+        """
+        elapsed = max(clock(), self.bus.free_at) - self._started
+        return min(self.bus.busy_time / elapsed, 1.0) if elapsed > 0 else 0.0
+
+    def _update(self):
+        if self._emulator is not None:
+            image = self.bus.controller.image()
+            self._emulator.display(image.convert(self._emulator.mode))
+
+        if self.throttle:
+            delay = self.bus.free_at - clock()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def create(chip="ssd1306", transport="i2c", speed_hz=None, width=128, height=64,
+           emulator=None, throttle=False, **kwargs):
+    """
+    Creates an SSD1306 or SH1106 device (``chip``) attached to a virtual
+    controller over a simulated I2C or SPI bus (``transport``), running at
+    ``speed_hz`` (by default 400kHz for I2C, or 8MHz for SPI). Any other
+    arguments are passed on to the device class.
+    """
+    controller = getattr(oled.virtual, chip)(width, height)
+    if transport == "i2c":
+        sim = smbus(controller, speed_hz or 400000)
+        serial = oled.serial.i2c(bus=sim)
+    elif transport == "spi":
+        sim = spidev(controller)
+        serial = oled.serial.spi(spi=sim, gpio=sim.gpio, bus_speed_hz=speed_hz or 8000000)
+    else:
+        raise ValueError("Unsupported transport: {0}".format(transport))
+
+    target = getattr(oled.device, chip)(serial, width=width, height=height, **kwargs)
+    return device(target, sim, emulator, throttle)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Richard Hull
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Software models of the SSD1306 and SH1106 display controllers, which plug
+# in as the serial interface of a device:
+#
+#   from oled.virtual import ssd1306 as virtual_ssd1306
+#
+#   controller = virtual_ssd1306(width=128, height=64)
+#   device = ssd1306(controller)
+#   ...
+#   controller.image().save("screen.png")
+#   print(controller.data_bytes)
+#
+# Unlike the emulators, this exercises the whole of the driver: packing,
+# dirty-region tracking, addressing and so on. The command stream is parsed
+# (a command's parameters may arrive in a later call), the data is written
+# into a model of the display RAM, and the panel is rendered from it. The
+# COM pin configuration is assumed to match the panel.
+
+from PIL import Image
+
+
+class controller(object):
+    """
+    Base class for virtual display controllers, which keeps the display
+    RAM and the state common to both chips, and counts the bytes sent.
+    """
+    ram_width = 128
+    ram_pages = 8
+    # the columns of display RAM which are not connected to the panel
+    column_offset = 0
+    # the number of parameter bytes taken by each multi-byte command
+    _params = {0x81: 1, 0xA8: 1, 0xD3: 1, 0xD5: 1, 0xD9: 1, 0xDA: 1, 0xDB: 1}
+
+    def __init__(self, width=128, height=64):
+        assert(width + 2 * self.column_offset <= self.ram_width)
+        assert(height <= self.ram_pages * 8)
+        self.width = width
+        self.height = height
+        self.ram = bytearray(self.ram_width * self.ram_pages)
+        self.display_on = False
+        self.inverted = False
+        self.all_on = False
+        self.contrast = 0x7F
+        self.start_line = 0
+        self.display_offset = 0
+        self.segment_remap = False
+        self.com_scan_dec = False
+        self.multiplex = 63
+        self.page = 0
+        self.column = 0
+        self._pending = None
+        self._args = []
+        self.reset_counts()
+
+    def reset_counts(self):
+        """
+        Sets the counts of transactions and bytes received back to zero.
+        """
+        self.transactions = 0
+        self.command_bytes = 0
+        self.data_bytes = 0
+
+    def command(self, *cmd):
+        """
+        Receives a command or sequence of commands.
+        """
+        self.transactions += 1
+        self.command_bytes += len(cmd)
+        for byte in cmd:
+            if self._pending is not None:
+                self._args.append(byte)
+                if len(self._args) == self._params[self._pending]:
+                    op, args = self._pending, self._args
+                    self._pending, self._args = None, []
+                    self._execute(op, args)
+            elif byte in self._params:
+                self._pending = byte
+            else:
+                self._execute(byte, [])
+
+    def data(self, data):
+        """
+        Receives a sequence of data bytes, writing them to the display RAM.
+        """
+        self.transactions += 1
+        self.data_bytes += len(data)
+        for byte in bytearray(data):
+            self.ram[self.page * self.ram_width + self.column] = byte
+            self._advance()
+
+    def cleanup(self):
+        pass
+
+    def image(self):
+        """
+        Returns a 1-bit image of what the panel is showing.
+        """
+        image = Image.new("1", (self.width, self.height))
+        if not self.display_on:
+            return image
+        if self.all_on:
+            return Image.new("1", (self.width, self.height), 255)
+
+        columns = [self._column(x) for x in range(self.width)]
+        on, off = (0, 255) if self.inverted else (255, 0)
+        pixels = []
+        for y in range(self.height):
+            row = y if self.com_scan_dec else self.multiplex - y
+            row = (row + self.start_line + self.display_offset) % 64
+            base, bit = (row >> 3) * self.ram_width, 1 << (row & 7)
+            pixels.extend(on if self.ram[base + c] & bit else off for c in columns)
+
+        image.putdata(pixels)
+        return image
+
+    def _column(self, x):
+        """
+        The display RAM column shown at panel column ``x``.
+        """
+        if self.segment_remap:
+            return x + self.column_offset
+        return self.width - 1 - x + self.column_offset
+
+    def _execute(self, op, args):
+        if op <= 0x0F:
+            self.column = (self.column & 0xF0) | op
+        elif op <= 0x1F:
+            self.column = (self.column & 0x0F) | (op & 0x0F) << 4
+        elif 0x40 <= op <= 0x7F:
+            self.start_line = op & 0x3F
+        elif op == 0x81:
+            self.contrast = args[0]
+        elif op in (0xA0, 0xA1):
+            self.segment_remap = op == 0xA1
+        elif op in (0xA4, 0xA5):
+            self.all_on = op == 0xA5
+        elif op in (0xA6, 0xA7):
+            self.inverted = op == 0xA7
+        elif op == 0xA8:
+            self.multiplex = args[0] & 0x3F
+        elif op in (0xAE, 0xAF):
+            self.display_on = op == 0xAF
+        elif 0xB0 <= op <= 0xB7:
+            self.page = op & 0x07
+        elif 0xC0 <= op <= 0xCF:
+            self.com_scan_dec = op >= 0xC8
+        elif op == 0xD3:
+            self.display_offset = args[0] & 0x3F
+        # anything else (clock, charge pump, etc.) doesn't affect the image
+
+
+class ssd1306(controller):
+    """
+    A virtual SSD1306 controller, with horizontal, vertical and page
+    addressing modes and hardware scrolling. Scrolling advances by one
+    step each time :func:`tick` is called.
+    """
+    _params = dict(controller._params)
+    _params.update({0x20: 1, 0x21: 2, 0x22: 2, 0x23: 1, 0x8D: 1, 0xA3: 2, 0xD6: 1,
+                    0x26: 6, 0x27: 6, 0x29: 5, 0x2A: 5, 0x2C: 6, 0x2D: 6})
+
+    def __init__(self, width=128, height=64):
+        super(ssd1306, self).__init__(width, height)
+        # page addressing is the default after reset
+        self.addressing_mode = 2
+        self.columns = (0, 127)
+        self.pages = (0, 7)
+        self.scroll = None
+        self._scroll_setup = None
+
+    def tick(self, steps=1):
+        """
+        Advances an active scroll by the given number of steps, shifting the
+        contents of the display RAM as the hardware does.
+        """
+        if self.scroll is None:
+            return
+
+        op, args = self.scroll
+        start, end = args[1], args[3]
+        right = op in (0x26, 0x29)
+        for _ in range(steps):
+            for page in range(start, end + 1):
+                base = page * self.ram_width
+                row = self.ram[base:base + self.ram_width]
+                row = row[-1:] + row[:-1] if right else row[1:] + row[:1]
+                self.ram[base:base + self.ram_width] = row
+            if op in (0x29, 0x2A):
+                self.start_line = (self.start_line + args[4]) & 0x3F
+
+    def _advance(self):
+        if self.addressing_mode == 2:
+            self.column = (self.column + 1) % self.ram_width
+        elif self.addressing_mode == 0:
+            self.column += 1
+            if self.column > self.columns[1]:
+                self.column = self.columns[0]
+                self.page = self.page + 1 if self.page < self.pages[1] else self.pages[0]
+        else:
+            self.page += 1
+            if self.page > self.pages[1]:
+                self.page = self.pages[0]
+                self.column = self.column + 1 if self.column < self.columns[1] else self.columns[0]
+
+    def _execute(self, op, args):
+        if op == 0x20:
+            self.addressing_mode = args[0] & 0x03
+        elif op == 0x21:
+            self.columns = (args[0] & 0x7F, args[1] & 0x7F)
+            self.column = self.columns[0]
+        elif op == 0x22:
+            self.pages = (args[0] & 0x07, args[1] & 0x07)
+            self.page = self.pages[0]
+        elif op in (0x26, 0x27, 0x29, 0x2A):
+            self._scroll_setup = (op, args)
+        elif op == 0x2E:
+            self.scroll = None
+        elif op == 0x2F:
+            self.scroll = self._scroll_setup
+        else:
+            super(ssd1306, self)._execute(op, args)
+
+
+class sh1106(controller):
+    """
+    A virtual SH1106 controller. Its display RAM is 132 columns wide, with
+    the panel in the middle, and only page addressing is supported.
+    """
+    ram_width = 132
+    column_offset = 2
+    _params = dict(controller._params)
+    _params.update({0xAD: 1})
+
+    def _advance(self):
+        # the column address stops at the last column
+        self.column = min(self.column + 1, self.ram_width - 1)
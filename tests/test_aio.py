@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+import threading
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+import pytest
+from PIL import Image
+
+asyncio = pytest.importorskip("asyncio")
+aio = pytest.importorskip("oled.aio")
+
+import baseline_data  # noqa: E402
+
+
+class slow_device(object):
+    """
+    Stand-in device whose first display blocks until released.
+    """
+    mode = "1"
+    width = 32
+    height = 16
+
+    def __init__(self):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def display(self, image):
+        self.started.set()
+        self.release.wait(5)
+        self.calls.append(("display", image.getpixel((0, 0))))
+
+    def command(self, *cmd):
+        self.calls.append(("command",) + cmd)
+
+
+def setup_function(function):
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
+
+def teardown_function(function):
+    asyncio.get_event_loop().close()
+
+
+def run(future):
+    return asyncio.get_event_loop().run_until_complete(future)
+
+
+def frame(fill):
+    return Image.new("1", (32, 16), fill)
+
+
+def test_display_runs_off_the_event_loop():
+    device = slow_device()
+    wrapper = aio.device(device)
+    future = wrapper.display(frame(255))
+    assert device.started.wait(5)
+    assert not future.done()
+
+    device.release.set()
+    run(future)
+    assert device.calls == [("display", 255)]
+    assert (wrapper.sent, wrapper.dropped) == (1, 0)
+
+
+def test_frames_coalesce_while_in_flight():
+    device = slow_device()
+    wrapper = aio.device(device)
+    futures = [wrapper.display(frame(0))]
+    assert device.started.wait(5)
+    futures += [wrapper.display(frame(fill)) for fill in (255, 0, 255)]
+
+    device.release.set()
+    run(asyncio.gather(*futures))
+    assert device.calls == [("display", 0), ("display", 255)]
+    assert (wrapper.sent, wrapper.dropped) == (2, 2)
+
+
+def test_calls_are_kept_in_order():
+    device = slow_device()
+    wrapper = aio.device(device)
+    futures = [wrapper.display(frame(0))]
+    assert device.started.wait(5)
+    futures += [wrapper.display(frame(255)), wrapper.command(0xAF), wrapper.display(frame(0))]
+
+    device.release.set()
+    run(asyncio.gather(*futures))
+    # the command stops the frames either side of it being coalesced
+    assert device.calls == [("display", 0), ("display", 255), ("command", 0xAF), ("display", 0)]
+    assert wrapper.width == 32
+
+
+def test_keyword_arguments_are_passed_on():
+    device = Mock()
+    wrapper = aio.device(device)
+    run(wrapper.scroll("left", end_page=2))
+    device.scroll.assert_called_once_with("left", end_page=2)
+
+
+def test_errors_are_raised_from_the_future():
+    device = Mock(mode="1", width=32, height=16)
+    device.display.side_effect = IOError("bus error")
+    wrapper = aio.device(device)
+    with pytest.raises(IOError):
+        run(wrapper.display(frame(0)))
+    assert wrapper.sent == 0
+
+    device.display.side_effect = None
+    run(wrapper.display(frame(0)))
+    assert wrapper.sent == 1
+
+
+def test_canvas():
+    device = slow_device()
+    device.release.set()
+    wrapper = aio.device(device)
+    c = aio.canvas(wrapper)
+    draw = run(c.__aenter__())
+    draw.point((0, 0), fill="white")
+    assert run(c.__aexit__(None, None, None)) is None
+    assert device.calls == [("display", 255)]
+
+    c = aio.canvas(wrapper)
+    run(c.__aenter__())
+    assert run(c.__aexit__(ValueError, ValueError(), None)) is False
+    assert len(device.calls) == 1
+
+
+def test_capture_emulator(tmpdir):
+    template = str(tmpdir.join("oled_{0:06}.png"))
+    device = aio.capture(mode="1", transform="none", file_template=template)
+    c = aio.canvas(device)
+    baseline_data.primitives(device, run(c.__aenter__()))
+    run(c.__aexit__(None, None, None))
+    assert tmpdir.join("oled_000001.png").check()
+    assert device.sent == 1
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+import errno
+import threading
+import time
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+import pytest
+
+from oled.arbiter import arbiter
+from oled.serial import i2c
+
+
+class fake_bus(object):
+    """
+    Stand-in SMBus which records the transactions made on it, and blocks
+    while ``hold`` is cleared.
+    """
+    def __init__(self):
+        self.log = []
+        self.hold = threading.Event()
+        self.hold.set()
+        self.holding = threading.Event()
+
+    def read_byte_data(self, address, register):
+        self.holding.set()
+        self.hold.wait(5)
+        self.log.append(("read", address))
+        return 0x42
+
+    def i2c_rdwr(self, *msgs):
+        self.log.append(("rdwr", [(msg.addr, len(msg)) for msg in msgs]))
+
+    def close(self):
+        self.log.append("close")
+
+
+def queue_up(fn, *args):
+    """
+    Calls fn in a new thread, returning once it is waiting for the bus.
+    """
+    thread = threading.Thread(target=fn, args=args)
+    thread.start()
+    time.sleep(0.02)
+    return thread
+
+
+def hold_bus(bus, client):
+    bus.hold.clear()
+    thread = threading.Thread(target=client.read_byte_data, args=(0x01, 0))
+    thread.start()
+    assert bus.holding.wait(5)
+    return thread
+
+
+def test_client_passes_through():
+    bus = fake_bus()
+    shared = arbiter(bus)
+    sensor = shared.client("sensor")
+    assert sensor.read_byte_data(0x68, 0x3B) == 0x42
+    assert bus.log == [("read", 0x68)]
+    assert shared.statistics()["sensor"].transactions == 1
+
+    sensor.close()
+    assert bus.log == [("read", 0x68)]
+    shared.close()
+    assert bus.log[-1] == "close"
+
+
+def test_waiting_clients_served_by_priority():
+    bus = fake_bus()
+    shared = arbiter(bus)
+    holder = shared.client("holder")
+    low = shared.client("low", priority=10)
+    high = shared.client("high", priority=0)
+
+    threads = [hold_bus(bus, holder)]
+    threads.append(queue_up(low.read_byte_data, 0x3C, 0))
+    threads.append(queue_up(high.read_byte_data, 0x68, 0))
+    threads.append(queue_up(low.read_byte_data, 0x3D, 0))
+    bus.hold.set()
+    for thread in threads:
+        thread.join()
+
+    assert bus.log == [("read", 0x01), ("read", 0x68), ("read", 0x3C), ("read", 0x3D)]
+    stats = shared.statistics()
+    assert stats["low"].transactions == 2
+    assert stats["high"].max_wait > 0
+    assert "transactions=2" in repr(stats["low"])
+
+
+def test_latency_bound_overrides_priority():
+    bus = fake_bus()
+    shared = arbiter(bus)
+    holder = shared.client("holder")
+    low = shared.client("low", priority=10, max_wait=0.01)
+    high = shared.client("high", priority=0)
+
+    threads = [hold_bus(bus, holder)]
+    threads.append(queue_up(low.read_byte_data, 0x3C, 0))
+    threads.append(queue_up(high.read_byte_data, 0x68, 0))
+    bus.hold.set()
+    for thread in threads:
+        thread.join()
+
+    # the low priority client has waited past its bound, so goes first
+    assert bus.log == [("read", 0x01), ("read", 0x3C), ("read", 0x68)]
+
+
+def test_display_chunks_interleave_with_sensor_reads():
+    bus = fake_bus()
+    shared = arbiter(bus)
+    display = shared.client("oled", priority=10, chunk=1)
+    sensor = shared.client("imu", priority=0)
+
+    serial = i2c(bus=display, address=0x3C, max_message_size=257)
+    original = bus.i2c_rdwr
+
+    def i2c_rdwr(*msgs):
+        original(*msgs)
+        if len(bus.log) == 1:
+            # a sensor read arrives while the frame is being sent
+            queue_up(sensor.read_byte_data, 0x68, 0)
+
+    bus.i2c_rdwr = i2c_rdwr
+    serial.data(bytearray(1024))
+
+    assert bus.log[:3] == [("rdwr", [(0x3C, 257)]), ("read", 0x68), ("rdwr", [(0x3C, 257)])]
+    assert len(bus.log) == 5
+    assert shared.statistics()["oled"].transactions == 4
+
+
+def test_failed_chunk_is_not_resent_as_block_writes():
+    bus = Mock()
+    shared = arbiter(bus)
+    display = shared.client("oled", chunk=1)
+    serial = i2c(bus=display, address=0x3C, max_message_size=257)
+    assert serial.max_messages == 1
+
+    bus.i2c_rdwr.side_effect = [None, IOError(errno.EINVAL, "Invalid argument")]
+    with pytest.raises(IOError):
+        serial.data(bytearray(1024))
+    # the first chunk reached the display, so nothing can be retried
+    assert bus.i2c_rdwr.call_count == 2
+    bus.write_i2c_block_data.assert_not_called()
+    assert serial.bulk
+
+
+def test_unchunked_rdwr_is_one_transaction():
+    bus = Mock()
+    shared = arbiter(bus)
+    sensor = shared.client("sensor")
+    sensor.i2c_rdwr("write", "read")
+    bus.i2c_rdwr.assert_called_once_with("write", "read")
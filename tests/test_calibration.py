@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+import errno
+import json
+
+import pytest
+
+from oled import calibration
+from oled.device import ssd1306
+from oled.render import canvas
+from oled.serial import spi
+
+
+class spidev(object):
+    """
+    A mock spidev, which advances a simulated clock by the time each
+    transfer takes. The clock divider can't go faster than ``cap_hz``, and
+    transfers fail above ``fail_above_hz``.
+    """
+    def __init__(self, cap_hz=16000000, fail_above_hz=None, overhead=20e-6):
+        self.max_speed_hz = 0
+        self.now = 0.0
+        self.cap_hz = cap_hz
+        self.fail_above_hz = fail_above_hz
+        self.overhead = overhead
+        self.frames = []
+
+    def open(self, port, device):
+        pass
+
+    def writebytes2(self, data):
+        if self.fail_above_hz and self.max_speed_hz > self.fail_above_hz:
+            raise IOError(errno.EIO, "Remote I/O error")
+        self.now += self.overhead + 8 * len(data) / float(min(self.max_speed_hz, self.cap_hz))
+        self.frames.append(bytes(bytearray(data)))
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    bus = spidev()
+    monkeypatch.setattr(calibration, "clock", lambda: bus.now)
+    device = ssd1306(spi(spi=bus, gpio=Mock(), transfer_size=4096))
+    return bus, device
+
+
+def test_patterns():
+    frames = list(calibration.patterns(1024))
+    assert all(len(frame) == 1024 for frame in frames)
+    assert len(set(frames)) == len(frames)
+
+
+def test_fastest_rate_with_real_gain(fake):
+    bus, device = fake
+    report = calibration.calibrate(device)
+    # the clock is capped at 16MHz, so faster settings gain nothing
+    assert report.speed_hz == 16000000
+    assert bus.max_speed_hz == 16000000
+    assert [r.speed_hz for r in report.results] == list(calibration.speeds)
+    assert all(r.stable for r in report.results)
+    throughputs = [r.throughput for r in report.results]
+    assert throughputs == sorted(throughputs)
+
+
+def test_stops_at_first_failure(fake):
+    bus, device = fake
+    bus.fail_above_hz = 4000000
+    report = calibration.calibrate(device)
+    assert report.speed_hz == 4000000
+    assert bus.max_speed_hz == 4000000
+    assert report.results[-1] == calibration.result(8000000, False, 0.0)
+    assert len(report.results) == 5
+
+
+def test_validator_rejects_rate(fake):
+    bus, device = fake
+    seen = []
+
+    def validator(device, speed_hz):
+        seen.append(speed_hz)
+        return speed_hz < 2000000
+
+    report = calibration.calibrate(device, speeds=[8000000, 1000000, 2000000], validator=validator)
+    assert seen == [1000000, 2000000]
+    assert report.speed_hz == 1000000
+
+
+def test_nothing_stable_keeps_original_rate(fake):
+    bus, device = fake
+    report = calibration.calibrate(device, validator=lambda device, speed_hz: False)
+    assert report.speed_hz is None
+    assert len(report.results) == 1
+    assert bus.max_speed_hz == 8000000
+
+
+def test_screen_restored(fake):
+    bus, device = fake
+    with canvas(device) as draw:
+        draw.point((0, 0), fill="white")
+    screen = bytes(device._shadow)
+
+    calibration.calibrate(device, speeds=[1000000])
+    assert bus.frames[-1] == screen
+    assert bytes(device._shadow) == screen
+
+
+def test_settings_persisted(fake, tmpdir):
+    bus, device = fake
+    path = str(tmpdir.join("calibration.json"))
+    settings = calibration.settings(path)
+    assert settings.get("spi:0:0", 8000000) == 8000000
+
+    def approve(device, speed_hz):
+        return True
+
+    calibration.calibrate(device, speeds=[1000000, 2000000], validator=approve, settings=settings)
+    calibration.calibrate(device, speeds=[1000000], validator=approve, settings=settings, key="left")
+    assert calibration.settings(path).get("spi:0:0") == 2000000
+    with open(path) as fp:
+        assert json.load(fp) == {"spi:0:0": 2000000, "left": 1000000}
+
+
+def test_settings_keyed_by_chip_select(monkeypatch, tmpdir):
+    settings = calibration.settings(str(tmpdir.join("calibration.json")))
+    for chip_select, fail_above_hz in ((0, 2000000), (1, 4000000)):
+        bus = spidev(fail_above_hz=fail_above_hz)
+        monkeypatch.setattr(calibration, "clock", lambda: bus.now)
+        device = ssd1306(spi(spi=bus, gpio=Mock(), device=chip_select,
+                             bus_speed_hz=1000000, transfer_size=4096))
+        calibration.calibrate(device, validator=lambda device, speed_hz: True, settings=settings)
+
+    assert settings.load() == {"spi:0:0": 2000000, "spi:0:1": 4000000}
+
+
+def test_settings_need_a_validator(fake, tmpdir):
+    bus, device = fake
+    settings = calibration.settings(str(tmpdir.join("calibration.json")))
+    with pytest.raises(ValueError):
+        calibration.calibrate(device, settings=settings)
+    assert settings.load() == {}
+
+
+def test_settings_tolerates_corrupt_file(tmpdir):
+    path = tmpdir.join("calibration.json")
+    path.write("{not json")
+    assert calibration.settings(str(path)).get("spi:0:0", 123) == 123
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+from oled.diff import area, bounds, cost, plan, windows
+
+
+def frame(width, pages, changes=None):
+    buf = bytearray(width * pages)
+    for (column, page), value in (changes or {}).items():
+        buf[page * width + column] = value
+    return buf
+
+
+def test_area_and_cost():
+    assert area((2, 1, 10, 3)) == 16
+    assert cost([(0, 0, 4, 1), (0, 2, 4, 4)], 5) == 4 + 5 + 8 + 5
+    assert cost([(0, 0, 4, 3)], 5, multipage=False) == 12 + 15
+
+
+def test_bounds():
+    assert bounds([(3, 0, 5, 1), (1, 2, 2, 3), (7, 1, 9, 2)]) == (1, 0, 9, 3)
+
+
+def test_windows_unchanged():
+    assert windows(frame(16, 2), frame(16, 2), 16, 2, 4) == []
+
+
+def test_windows_merges_small_gaps():
+    new = frame(16, 2, {(1, 0): 1, (4, 0): 1, (14, 0): 1, (0, 1): 7})
+    assert windows(frame(16, 2), new, 16, 2, 4) == [
+        (1, 0, 5, 1), (14, 0, 15, 1), (0, 1, 1, 2)]
+
+
+def test_plan_without_shadow_is_full_frame():
+    assert plan(None, frame(16, 4), 16, 4, 10) == [(0, 0, 16, 4)]
+
+
+def test_plan_nothing_to_do():
+    assert plan(frame(16, 4), frame(16, 4), 16, 4, 10) == []
+
+
+def test_plan_keeps_cheap_windows():
+    new = frame(128, 8, {(0, 0): 1, (127, 7): 1})
+    assert plan(frame(128, 8), new, 128, 8, 10) == [(0, 0, 1, 1), (127, 7, 128, 8)]
+
+
+def test_plan_falls_back_to_bounding_box():
+    new = frame(16, 4, dict(((col, page), 1) for col in range(0, 16, 3) for page in range(4)))
+    assert plan(frame(16, 4), new, 16, 4, 2) == [(0, 0, 16, 4)]
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+try:
+    from unittest.mock import call, Mock
+except ImportError:
+    from mock import call, Mock
+
+import threading
+
+import pytest
+
+import oled.effects
+from oled.device import ssd1306
+from oled.effects import blink, effect, fade, scheduler
+
+serial = Mock()
+
+
+def setup_function(function):
+    serial.reset_mock()
+
+
+class manual(object):
+    """
+    Stand-in scheduler which only runs steps when told to.
+    """
+    def __init__(self):
+        self.pending = []
+
+    def schedule(self, delay, fn):
+        self.pending.append((delay, fn))
+
+    def run(self):
+        delays = []
+        while self.pending:
+            delay, fn = self.pending.pop(0)
+            delays.append(delay)
+            fn()
+        return delays
+
+
+def test_scheduler_runs_in_order():
+    sched = scheduler()
+    results = []
+    finished = threading.Event()
+    sched.schedule(0.02, lambda: results.append(2))
+    sched.schedule(0.03, finished.set)
+    sched.schedule(0.0, lambda: results.append(1))
+    assert finished.wait(2)
+    assert results == [1, 2]
+
+
+def test_effect_runs_steps_in_background():
+    fn = Mock()
+    e = effect([(0, lambda: fn(1)), (0.01, lambda: fn(2))], scheduler())
+    assert e.wait(2)
+    assert e.done
+    fn.assert_has_calls([call(1), call(2)])
+
+
+def test_fade():
+    device = Mock()
+    sched = manual()
+    e = fade(device, 255, 0, duration=1.0, steps=4, scheduler=sched)
+    assert sched.run() == [0, 0.25, 0.25, 0.25, 0.25]
+    assert e.done
+    device.contrast.assert_has_calls([call(255), call(191), call(128), call(64), call(0)])
+
+
+def test_blink():
+    device = Mock()
+    sched = manual()
+    blink(device, interval=0.1, count=2, scheduler=sched)
+    assert sched.run() == [0, 0.1, 0.1, 0.1]
+    assert device.mock_calls == [call.hide(), call.show(), call.hide(), call.show()]
+
+
+def test_blink_invert_cancelled():
+    device = Mock()
+    sched = manual()
+    e = blink(device, count=None, invert=True, scheduler=sched)
+    delay, fn = sched.pending.pop()
+    fn()
+    e.cancel()
+    assert sched.run() == [0.5]
+    # cancelled while inverted, so put back to normal
+    assert device.mock_calls == [call.invert(True), call.invert(False)]
+    assert e.done
+
+
+def test_blink_cancelled_while_on():
+    device = Mock()
+    sched = manual()
+    e = blink(device, count=None, scheduler=sched)
+    for n in range(2):
+        delay, fn = sched.pending.pop()
+        fn()
+    e.cancel()
+    e.cancel()
+    assert device.mock_calls == [call.hide(), call.show()]
+
+
+def test_failing_step_stops_effect_but_not_scheduler():
+    sched = scheduler()
+    fn = Mock(side_effect=IOError("Remote I/O error"))
+    failed = effect([(0, fn), (0, fn)], sched)
+    with pytest.raises(IOError):
+        failed.wait(2)
+    assert failed.done
+    assert isinstance(failed.error, IOError)
+    fn.assert_called_once()
+
+    sched.schedule(0, Mock(side_effect=ValueError()))
+    later = Mock()
+    assert effect([(0.01, later)], sched).wait(2)
+    later.assert_called_once()
+    assert sched._thread.is_alive()
+
+
+def test_device_contrast_and_invert():
+    device = ssd1306(serial)
+    serial.reset_mock()
+    device.contrast(0x40)
+    device.invert(True)
+    device.invert(False)
+    serial.command.assert_has_calls([call(0x81, 0x40), call(0xA7), call(0xA6)])
+
+
+def test_device_fade_replaces_running_effect(monkeypatch):
+    sched = manual()
+    monkeypatch.setattr(oled.effects, "default_scheduler", lambda: sched)
+    device = ssd1306(serial)
+    serial.reset_mock()
+    first = device.blink(interval=10, count=None)
+    second = device.fade(0, 255, duration=0.02, steps=2)
+    assert first.done
+    sched.run()
+    assert second.done
+    # the blink was cancelled before it hid the display
+    assert serial.command.call_args_list == [call(0x81, 0), call(0x81, 128), call(0x81, 255)]
+
+
+def test_device_cancel_blink_shows_display():
+    device = ssd1306(serial)
+    effect = device.blink(interval=10, count=None)
+    assert not effect.wait(0.1)
+    serial.reset_mock()
+    device.cancel_effect()
+    serial.command.assert_called_once_with(0xAF)
+
+
+def test_effect_runs_while_batch_is_open():
+    device = ssd1306(serial)
+    serial.reset_mock()
+    with device.batch():
+        device.invert(True)
+        # the fade's commands come from another thread, so aren't held up
+        assert device.fade(0, 255, duration=0.02, steps=2).wait(1)
+        serial.command.assert_has_calls([call(0x81, 0), call(0x81, 128), call(0x81, 255)])
+        assert call(0xA7) not in serial.command.call_args_list
+
+    assert serial.command.call_args_list[-1] == call(0xA7)
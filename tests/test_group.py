@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import threading
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+import pytest
+from PIL import Image
+
+from oled.group import bus_id, group
+from oled.device import ssd1306
+from oled.serial import i2c, i2c_bus, spi, tca9548a
+
+
+class fake_device(object):
+    """
+    Stand-in device which records the frames displayed, and how many
+    devices were busy at the time.
+    """
+    busy = []
+    lock = threading.Lock()
+
+    def __init__(self, bus, wait=None, signal=None):
+        self._serial_interface = Mock(bus_id=bus)
+        self.frames = []
+        self.overlap = []
+        self._wait = wait
+        self._signal = signal
+
+    def display(self, frame):
+        with self.lock:
+            self.busy.append(self)
+            self.overlap.append([d._serial_interface.bus_id for d in self.busy])
+        if self._signal:
+            self._signal.set()
+        if self._wait:
+            self.waited = self._wait.wait(5)
+        self.frames.append(frame)
+        with self.lock:
+            self.busy.remove(self)
+
+
+def test_bus_id():
+    bus = Mock()
+    assert i2c(bus=bus, address=0x3C).bus_id == i2c(bus=bus, address=0x3D).bus_id
+    assert i2c(bus=bus).bus_id != i2c(bus=Mock()).bus_id
+    assert spi(gpio=Mock(), spi=Mock(), port=0, device=1).bus_id == ("spi", 0)
+    device = Mock(spec=["display"])
+    assert bus_id(device) == ("device", id(device))
+
+
+def test_devices_on_different_buses_run_in_parallel():
+    first, second = threading.Event(), threading.Event()
+    # each device waits for the other to have started
+    a = fake_device("bus-1", wait=second, signal=first)
+    b = fake_device("bus-3", wait=first, signal=second)
+    displays = group([a, b])
+    displays.display_all(["frame-a", "frame-b"])
+    assert a.waited and b.waited
+    assert (a.frames, b.frames) == (["frame-a"], ["frame-b"])
+    displays.close()
+
+
+def test_devices_on_the_same_bus_are_serialized():
+    devices = [fake_device("bus-1"), fake_device("bus-1"), fake_device("spi")]
+    displays = group(devices)
+    for n in range(20):
+        displays.display_all([n, n, n])
+
+    for device in devices:
+        assert device.frames == list(range(20))
+        for busy in device.overlap:
+            assert busy.count(device._serial_interface.bus_id) == 1
+    displays.close()
+
+
+def test_explicit_buses_and_skipped_frames():
+    devices = [fake_device(None), fake_device(None)]
+    displays = group(devices, buses=["x", "x"])
+    assert len(displays) == 2
+    displays.display_all([None, "frame"])
+    assert devices[0].frames == []
+    assert devices[1].frames == ["frame"]
+    assert displays._workers == {}
+
+    with pytest.raises(AssertionError):
+        displays.display_all(["frame"])
+
+
+def test_errors_are_raised_once_all_are_done():
+    bad = fake_device("bus-1")
+    bad.display = Mock(side_effect=IOError("bus error"))
+    devices = [bad, fake_device("bus-1"), fake_device("bus-3")]
+    displays = group(devices)
+    with pytest.raises(IOError):
+        displays.display_all([1, 2, 3])
+    assert devices[1].frames == [2]
+    assert devices[2].frames == [3]
+    displays.close()
+
+
+def test_devices_sharing_an_i2c_bus_are_batched():
+    smbus = Mock()
+    bus = i2c_bus(bus=smbus)
+    devices = [ssd1306(i2c(bus=bus, address=addr), width=128, height=32) for addr in (0x3C, 0x3D)]
+    smbus.reset_mock()
+
+    frames = [Image.new("1", (128, 32), "white"), Image.new("1", (128, 32))]
+    frames[1].putpixel((0, 0), 1)
+    group(devices).display_all(frames)
+
+    # both panels' windows are sent with a single system call
+    smbus.i2c_rdwr.assert_called_once()
+    msgs = smbus.i2c_rdwr.call_args[0]
+    assert [(msg.addr, len(msg)) for msg in msgs] == [
+        (0x3C, 7), (0x3C, 513), (0x3D, 7), (0x3D, 2)]
+
+
+def test_devices_behind_a_mux_select_each_channel_once():
+    smbus = Mock()
+    mux = tca9548a(bus=smbus)
+    devices = [ssd1306(i2c(bus=mux.channel(n)), width=128, height=32) for n in range(4)]
+    displays = group(devices)
+    smbus.reset_mock()
+
+    for fill in ("white", "black"):
+        displays.display_all([Image.new("1", (128, 32), fill)] * 4)
+
+    # each batch starts with the channel left selected by the one before
+    selects = [c[0][1] for c in smbus.write_byte.call_args_list]
+    assert selects == [0x01, 0x02, 0x04, 0x01, 0x02, 0x08]
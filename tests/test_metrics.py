@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+import errno
+
+import pytest
+from PIL import Image
+
+import oled.metrics
+from oled.device import ssd1306
+from oled.group import group
+from oled.serial import i2c, i2c_bus, spi, tca9548a
+
+
+def test_disabled_by_default():
+    serial = i2c(bus=Mock())
+    assert serial.metrics is None
+    assert "command" not in vars(serial)
+    assert ssd1306(serial).serial_metrics() is None
+
+
+def test_i2c_calls_and_transactions():
+    smbus = Mock()
+    serial = i2c(bus=smbus, bulk=False)
+    serial.instrument()
+
+    serial.command(1, 2, 3)
+    serial.data(bytearray(100))
+    snapshot = serial.metrics.snapshot()
+    assert snapshot.calls["command"].count == 1
+    assert snapshot.calls["command"].bytes == 3
+    assert snapshot.calls["data"].bytes == 100
+    assert sum(snapshot.calls["data"].histogram) == 1
+    # the data is sent in 32-byte chunks
+    assert snapshot.transactions == 5
+    assert snapshot.transaction_errors == 0
+    assert smbus.write_i2c_block_data.call_count == 5
+
+    serial.cleanup()
+    assert serial.metrics.snapshot().transactions == 5
+    smbus.close.assert_called_once()
+
+
+def test_errors_are_counted():
+    smbus = Mock()
+    smbus.i2c_rdwr.side_effect = IOError(5, "Input/output error")
+    serial = i2c(bus=smbus)
+    serial.instrument()
+    with pytest.raises(IOError):
+        serial.data([1, 2, 3])
+
+    snapshot = serial.metrics.snapshot()
+    assert snapshot.calls["data"].errors == 1
+    assert snapshot.transaction_errors == 1
+    assert "1 errors" in repr(snapshot)
+
+
+def test_spi():
+    spidev, gpio = Mock(), Mock()
+    serial = spi(spi=spidev, gpio=gpio, transfer_size=64)
+    serial.instrument()
+    serial.command(0xAF)
+    serial.data(bytearray(100))
+    serial._spi.max_speed_hz = 1000
+    assert spidev.max_speed_hz == 1000
+
+    snapshot = serial.metrics.snapshot()
+    assert snapshot.calls["command"].count == 1
+    assert snapshot.calls["data"].bytes == 100
+    assert snapshot.transactions == 3
+
+
+def test_device_snapshot_and_reset():
+    serial = i2c(bus=Mock())
+    serial.instrument()
+    device = ssd1306(serial)
+    snapshot = device.serial_metrics()
+    assert isinstance(snapshot, oled.metrics.snapshot)
+    assert snapshot.calls["data"].bytes == 1024
+
+    serial.metrics.reset()
+    assert device.serial_metrics().calls == {}
+
+
+def test_disable_restores_methods():
+    smbus = Mock()
+    serial = i2c(bus=smbus)
+    serial.instrument()
+    serial.instrument(False)
+    assert serial.metrics is None
+    assert vars(serial).get("command") is None
+    assert serial._bus is smbus
+
+    serial.command(1)
+    smbus.i2c_rdwr.assert_called_once()
+
+
+def test_shared_bus_counts_writes_when_sent():
+    smbus = Mock()
+    bus = i2c_bus(bus=smbus)
+    serials = [i2c(bus=bus, address=addr) for addr in (0x3C, 0x3D)]
+    for serial in serials:
+        serial.instrument()
+
+    with bus.batch():
+        for serial in serials:
+            serial.command(0xAF)
+            serial.data([1, 2])
+        assert serials[0].metrics.snapshot().transactions == 0
+
+    # both interfaces' writes went in a single system call
+    smbus.i2c_rdwr.assert_called_once()
+    for serial in serials:
+        assert serial.metrics.snapshot().transactions == 1
+        assert serial.metrics.snapshot().calls["data"].bytes == 2
+
+    serials[0].instrument(False)
+    serials[1].command(0xAE)
+    assert serials[1].metrics.snapshot().transactions == 2
+
+
+def test_mux_counts_writes_when_sent():
+    smbus = Mock()
+    mux = tca9548a(bus=smbus)
+    serial = i2c(bus=mux.channel(1), bulk=False)
+    serial.instrument()
+    with mux.batch():
+        serial.data(bytearray(40))
+        assert serial.metrics.snapshot().transactions == 0
+    assert serial.metrics.snapshot().transactions == 2
+    assert smbus.write_i2c_block_data.call_count == 2
+
+
+def test_instrumented_devices_on_a_shared_bus():
+    smbus = Mock()
+    bus = i2c_bus(bus=smbus)
+    serials = [i2c(bus=bus, address=addr) for addr in (0x3C, 0x3D)]
+    for serial in serials:
+        serial.instrument()
+    devices = [ssd1306(serial, width=128, height=32) for serial in serials]
+
+    # still batched together by a group
+    smbus.reset_mock()
+    group(devices).display_all([Image.new("1", (128, 32), "white")] * 2)
+    smbus.i2c_rdwr.assert_called_once()
+
+    # and still invalidated when a batch fails
+    smbus.i2c_rdwr.side_effect = IOError(errno.EREMOTEIO, "Remote I/O error")
+    with pytest.raises(IOError):
+        with bus.batch():
+            devices[0].display(Image.new("1", (128, 32)))
+    assert devices[0]._shadow is None
+    smbus.reset_mock(side_effect=True)
+
+
+def test_histogram_buckets():
+    recorder = oled.metrics.metrics()
+    call = recorder.wrap_call("data", lambda buf: None, lambda args: len(args[0]))
+    call(b"abc")
+    histogram = recorder.snapshot().calls["data"].histogram
+    assert len(histogram) == oled.metrics.buckets
+    assert sum(histogram) == 1
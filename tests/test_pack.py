@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import random
+
+import pytest
+from PIL import Image, ImageDraw
+
+import oled.pack
+from oled.mixin import capabilities
+from oled.pack import backends, pack_python
+
+import baseline_data
+
+
+def random_image(width, height, seed=None):
+    rnd = random.Random(seed)
+    image = Image.new("1", (width, height))
+    image.putdata([rnd.choice((0, 255)) for _ in range(width * height)])
+    return image
+
+
+@pytest.mark.parametrize("name", list(backends))
+@pytest.mark.parametrize("size", [(8, 8), (128, 64), (128, 32), (96, 16), (64, 48), (24, 120)])
+@pytest.mark.parametrize("mirror", [False, True])
+def test_backends_match_reference(name, size, mirror):
+    image = random_image(*size, seed=size[0] * 1000 + size[1])
+    expected = pack_python(image, mirror)
+    assert len(expected) == size[0] * size[1] // 8
+    assert backends[name](image, mirror) == expected
+
+
+@pytest.mark.parametrize("size", [(8, 8), (128, 64), (96, 16), (24, 120)])
+@pytest.mark.parametrize("mirror", [False, True])
+def test_unpack_reverses_pack(size, mirror):
+    image = random_image(*size, seed=size[0] + size[1])
+    unpacked = oled.pack.unpack(pack_python(image, mirror), *size, mirror=mirror)
+    assert unpacked.mode == "1"
+    assert unpacked.tobytes() == image.tobytes()
+
+
+def test_reference_bit_order():
+    image = Image.new("1", (16, 16))
+    image.putpixel((0, 0), 1)
+    image.putpixel((1, 7), 1)
+    image.putpixel((15, 8), 1)
+    buf = pack_python(image)
+    assert buf[0] == 0x01
+    assert buf[1] == 0x80
+    assert buf[31] == 0x01
+    assert sum(bytearray(buf)) == 0x82
+
+
+def test_mirror_reverses_columns_within_pages():
+    image = random_image(32, 16, seed=7)
+    plain = bytearray(pack_python(image))
+    mirrored = bytearray(pack_python(image, mirror=True))
+    assert mirrored[:32] == plain[:32][::-1]
+    assert mirrored[32:] == plain[32:][::-1]
+
+
+@pytest.mark.parametrize("name", list(backends))
+def test_backends_demo_image(name):
+    device = capabilities()
+    device.capabilities(128, 64, mode="1")
+    image = Image.new(device.mode, (device.width, device.height))
+    baseline_data.primitives(device, ImageDraw.Draw(image))
+    assert backends[name](image, True) == pack_python(image, True)
+
+
+def test_select():
+    original = oled.pack.backend
+    try:
+        oled.pack.select("python")
+        assert oled.pack.backend == "python"
+        image = random_image(16, 8, seed=1)
+        assert oled.pack.pack(image) == pack_python(image)
+    finally:
+        oled.pack.select(original)
+
+
+@pytest.mark.parametrize("timings,expected", [
+    ({"numpy": 90e-6, "pil": 67e-6}, "pil"),
+    ({"numpy": 20e-6, "pil": 67e-6}, "numpy")])
+def test_select_default_prefers_fastest(monkeypatch, timings, expected):
+    monkeypatch.setitem(backends, "numpy", lambda image, mirror: None)
+    monkeypatch.setattr(oled.pack, "_timing", lambda fn, image: timings[
+        next(name for name in timings if backends[name] is fn)])
+    original = oled.pack.backend
+    try:
+        oled.pack.select()
+        assert oled.pack.backend == expected
+    finally:
+        oled.pack.select(original)
+
+
+def test_fastest_times_real_backends():
+    assert oled.pack.fastest((128, 32)) in backends
+    assert oled.pack.fastest((128, 32)) != "python"
+
+
+def test_select_unknown():
+    with pytest.raises(ValueError):
+        oled.pack.select("fortran")
+
+
+@pytest.mark.parametrize("dtype", ["bool", "uint8"])
+@pytest.mark.parametrize("mirror", [False, True])
+def test_pack_array_matches_reference(dtype, mirror):
+    numpy = pytest.importorskip("numpy")
+    image = random_image(128, 32, seed=11)
+    array = numpy.array(image.convert("L"), dtype=numpy.uint8)
+    if dtype == "bool":
+        array = array != 0
+    assert oled.pack.pack_array(array, mirror) == pack_python(image, mirror)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+import io
+import time
+
+try:
+    from unittest.mock import call, Mock
+except ImportError:
+    from mock import call, Mock
+
+import pytest
+from PIL import Image
+
+from oled.device import ssd1306
+from oled.emulator import capture
+from oled.record import COMMAND, DATA, read, recorder, replay, started
+from oled.serial import i2c
+
+
+class log(io.BytesIO):
+    """
+    A BytesIO whose contents survive being closed.
+    """
+    def close(self):
+        if not self.closed:
+            self.contents = self.getvalue()
+        io.BytesIO.close(self)
+
+
+def test_records_and_passes_on_calls():
+    serial = Mock()
+    fp = log()
+    rec = recorder(serial, fp)
+    rec.command(0xAE, 0xA6)
+    rec.data(memoryview(b"\x01\x02\x03"))
+    rec.cleanup()
+
+    serial.command.assert_called_once_with(0xAE, 0xA6)
+    serial.data.assert_called_once()
+    serial.cleanup.assert_called_once()
+
+    records = list(read(io.BytesIO(fp.contents)))
+    assert [(kind, list(payload)) for t, kind, payload in records] == [
+        (COMMAND, [0xAE, 0xA6]), (DATA, [1, 2, 3])]
+    assert 0 <= records[0][0] <= records[1][0]
+
+
+def test_record_to_file(tmpdir):
+    filename = str(tmpdir.join("display.log"))
+    rec = recorder(None, filename)
+    device = ssd1306(rec)
+    device.display(Image.new("1", (128, 64), "white"))
+    rec.cleanup()
+    # anything sent after the log is closed is not recorded
+    device.hide()
+
+    records = list(read(filename))
+    assert sum(len(p) for t, kind, p in records if kind == DATA) == 2048
+    assert records[0][1] == COMMAND
+
+
+def test_recorder_passes_through_attributes():
+    serial = i2c(bus=Mock(), bulk=False)
+    rec = recorder(serial, log())
+    assert rec.bus_id == serial.bus_id
+    assert rec.max_command_length == 32
+    assert recorder(None, log()).max_command_length == 32
+
+
+def test_replay_as_fast_as_possible():
+    fp = log()
+    rec = recorder(None, fp)
+    rec.command(0xAF)
+    rec.data(b"\xFF" * 10)
+    rec.cleanup()
+
+    target = Mock(spec=["command", "data"])
+    sleep = Mock()
+    assert replay(io.BytesIO(fp.contents), target, speed=None, sleep=sleep) == 2
+    assert target.mock_calls == [call.command(0xAF), call.data(bytearray(b"\xFF" * 10))]
+    sleep.assert_not_called()
+
+
+def test_replay_keeps_timing():
+    from oled.record import MAGIC, _header, _started
+    records = [_header.pack(COMMAND, 0.0, 1), b"\xAF", _header.pack(COMMAND, 2.0, 1), b"\xAE"]
+    fp = io.BytesIO(MAGIC + _started.pack(0.0) + b"".join(records))
+    sleep = Mock()
+    replay(fp, Mock(), speed=4, sleep=sleep)
+    assert sleep.call_count == 1
+    assert 0.4 < sleep.call_args[0][0] <= 0.5
+
+
+def test_read_truncated_and_invalid_logs():
+    fp = log()
+    rec = recorder(None, fp)
+    rec.data(b"\x01\x02\x03")
+    rec.data(b"\x04\x05\x06")
+    rec.cleanup()
+    assert len(list(read(io.BytesIO(fp.contents[:-1])))) == 1
+
+    with pytest.raises(ValueError):
+        list(read(io.BytesIO(b"not a log")))
+
+
+def test_log_records_when_it_started():
+    fp = log()
+    before = time.time()
+    recorder(None, fp).cleanup()
+    assert before <= started(io.BytesIO(fp.contents)) <= time.time()
+
+
+def test_replay_to_device_invalidates_it():
+    fp = log()
+    rec = recorder(None, fp)
+    ssd1306(rec).display(Image.new("1", (128, 64), "white"))
+    rec.cleanup()
+
+    serial = Mock()
+    device = ssd1306(serial)
+    blank = Image.new("1", (128, 64))
+    replay(io.BytesIO(fp.contents), device, speed=None)
+    # the display RAM now holds the replayed frame, so a blank one is sent
+    serial.reset_mock()
+    device.display(blank)
+    assert device.frames_skipped == 0
+    serial.data.assert_called()
+
+
+def test_replay_to_emulator(tmpdir):
+    fp = log()
+    rec = recorder(None, fp)
+    ssd1306(rec).display(Image.new("1", (128, 64), "white"))
+    rec.cleanup()
+
+    template = str(tmpdir.join("oled_{0:06}.png"))
+    emulator = capture(mode="1", transform="none", file_template=template)
+    assert replay(io.BytesIO(fp.contents), emulator, speed=None) > 0
+    # the frame was displayed on the emulator, once it was all sent
+    image = Image.open(tmpdir.join("oled_{0:06}.png".format(emulator._count)).strpath)
+    assert image.convert("1").getextrema() == (255, 255)
+
+
+def test_replay_to_something_else():
+    fp = log()
+    recorder(None, fp).cleanup()
+    with pytest.raises(ValueError):
+        replay(io.BytesIO(fp.contents), object())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+import pytest
+from PIL import Image, ImageChops
+
+from oled import render
+from oled.render import canvas, frame_loop, persistent_canvas
+
+
+def mock_device(width=16, height=8):
+    return Mock(mode="1", width=width, height=height)
+
+
+def displayed(device):
+    return [args[0][0] for args in device.display.call_args_list]
+
+
+def test_canvas_displays_image():
+    device = mock_device()
+    with canvas(device) as draw:
+        draw.point((1, 1), fill="white")
+    image = displayed(device)[0]
+    assert image.getpixel((1, 1)) == 255
+
+
+def test_persistent_canvas_reuses_images_and_draw_objects():
+    device = mock_device()
+    frame = persistent_canvas(device)
+    draws = []
+    for n in range(4):
+        with frame as draw:
+            draws.append(draw)
+
+    assert draws[0] is draws[2] and draws[1] is draws[3]
+    assert draws[0] is not draws[1]
+    images = displayed(device)
+    assert images[0] is images[2] and images[1] is images[3]
+    assert images[0] is not images[1]
+
+
+def test_persistent_canvas_clears_back_buffer():
+    device = mock_device()
+    frame = persistent_canvas(device)
+    for x in range(3):
+        with frame as draw:
+            draw.point((x, 0), fill="white")
+
+    image = displayed(device)[-1]
+    assert image.getbbox() == (2, 0, 3, 1)
+    # the previous frame is left as it was displayed
+    assert frame.front is image
+    assert frame.image.getbbox() == (1, 0, 2, 1)
+
+
+def test_persistent_canvas_keeps_previous_contents():
+    device = mock_device()
+    frame = persistent_canvas(device, keep=True)
+    for x in range(3):
+        with frame as draw:
+            draw.point((x, 0), fill="white")
+
+    expected = Image.new("1", (16, 8))
+    expected.paste(255, (0, 0, 3, 1))
+    assert ImageChops.difference(displayed(device)[-1], expected).getbbox() is None
+
+
+def test_persistent_canvas_not_displayed_on_error():
+    device = mock_device()
+    frame = persistent_canvas(device)
+    with pytest.raises(ValueError):
+        with frame:
+            raise ValueError()
+
+    device.display.assert_not_called()
+    with frame:
+        pass
+    assert displayed(device) == [frame.front]
+
+
+class fake_time(object):
+    """
+    A simulated clock, where drawing and displaying a frame take a set
+    amount of time.
+    """
+    def __init__(self, monkeypatch, render_cost=0.0, transfer_cost=0.0):
+        self.now = 100.0
+        self.render_cost = render_cost
+        self.transfer_cost = transfer_cost
+        self.times = []
+        monkeypatch.setattr(render, "clock", lambda: self.now)
+
+    def sleep(self, delay):
+        self.now += delay
+
+    def render(self, draw, t):
+        self.times.append(t)
+        self.now += self.render_cost
+
+    def display(self, image):
+        self.now += self.transfer_cost
+
+
+def test_frame_loop_paces_without_drift(monkeypatch):
+    timer = fake_time(monkeypatch, render_cost=0.003, transfer_cost=0.011)
+    device = mock_device()
+    device.display.side_effect = timer.display
+    loop = frame_loop(device, timer.render, fps=25, sleep=timer.sleep)
+
+    loop.run(frames=50)
+    assert timer.times == pytest.approx([n * 0.04 for n in range(50)])
+    assert timer.now == pytest.approx(100.0 + 49 * 0.04 + 0.014)
+    assert loop.frames == 50
+    assert loop.frames_dropped == 0
+    assert loop.fps == pytest.approx(25)
+    assert loop.render_time == pytest.approx(0.003)
+    assert loop.transfer_time == pytest.approx(0.011)
+
+
+def test_frame_loop_drops_overrun_frames(monkeypatch):
+    timer = fake_time(monkeypatch)
+    device = mock_device()
+
+    def display(image):
+        # one slow transfer, taking two and a half frames
+        timer.now += 0.25 if len(timer.times) == 3 else 0.0
+
+    device.display.side_effect = display
+    loop = frame_loop(device, timer.render, fps=10, adaptive=False, sleep=timer.sleep)
+    loop.run(frames=6)
+    # the transfer finishes at 0.45: the frame due at 0.3 is dropped, and
+    # the one due at 0.4 is shown late, keeping to the timetable after that
+    assert timer.times == pytest.approx([0, 0.1, 0.2, 0.4, 0.5, 0.6])
+    assert timer.now == pytest.approx(100.6)
+    assert loop.frames_dropped == 1
+
+
+def test_frame_loop_adapts_to_transfer_time(monkeypatch):
+    timer = fake_time(monkeypatch, transfer_cost=0.05)
+    device = mock_device()
+    device.display.side_effect = timer.display
+    loop = frame_loop(device, timer.render, fps=30, sleep=timer.sleep)
+
+    loop.run(frames=20)
+    assert loop.interval == pytest.approx(0.05)
+    assert loop.fps == pytest.approx(20)
+    assert loop.frames_dropped == 0
+
+    # once transfers speed up, the rate recovers towards the target
+    timer.transfer_cost = 0.0
+    loop.run(frames=40)
+    assert loop.interval == pytest.approx(1 / 30.0)
+
+
+def test_frame_loop_smooths_after_zero_transfer_time(monkeypatch):
+    timer = fake_time(monkeypatch)
+    device = mock_device()
+    device.display.side_effect = timer.display
+    loop = frame_loop(device, timer.render, fps=30, sleep=timer.sleep)
+
+    # unchanged frames take no time to send
+    loop.run(frames=3)
+    assert loop.transfer_time == 0.0
+    timer.transfer_cost = 0.05
+    loop.run(frames=1)
+    assert loop.transfer_time == pytest.approx(0.01)
+    assert loop.interval == pytest.approx(1 / 30.0)
+
+
+def test_frame_loop_stop(monkeypatch):
+    timer = fake_time(monkeypatch)
+    device = mock_device()
+    loop = frame_loop(device, lambda draw, t: loop.stop() if t > 0.5 else None,
+                      fps=10, sleep=timer.sleep)
+    loop.run()
+    assert loop.frames == 7
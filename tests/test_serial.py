@@ -5,8 +5,14 @@ try:
 except ImportError:
     from mock import patch, call, Mock
 
+import errno
+
+import pytest
 import smbus2
-from oled.serial import i2c, spi
+from PIL import Image
+
+from oled.device import ssd1306
+from oled.serial import i2c, i2c_bus, spi, tca9548a
 
 smbus = Mock()
 spidev = Mock()
@@ -14,7 +20,7 @@ gpio = Mock()
 
 
 def setup_function(function):
-    smbus.reset_mock()
+    smbus.reset_mock(side_effect=True)
     spidev.reset_mock()
     gpio.reset_mock()
     gpio.BCM = 1
@@ -45,32 +51,364 @@ def test_i2c_init_bus_provided():
 
 def test_i2c_command():
     cmds = [3, 1, 4, 2]
-    serial = i2c(bus=smbus, address=0x83)
+    serial = i2c(bus=smbus, address=0x83, bulk=False)
     serial.command(*cmds)
     smbus.write_i2c_block_data.assert_called_once_with(0x83, 0x00, cmds)
 
 
 def test_i2c_data():
     data = list(fib(10))
-    serial = i2c(bus=smbus, address=0x21)
+    serial = i2c(bus=smbus, address=0x21, bulk=False)
     serial.data(data)
     smbus.write_i2c_block_data.assert_called_once_with(0x21, 0x40, data)
 
 
 def test_i2c_data_chunked():
     data = list(fib(100))
-    serial = i2c(bus=smbus, address=0x66)
+    serial = i2c(bus=smbus, address=0x66, bulk=False)
     serial.data(data)
     calls = [call(0x66, 0x40, data[i:i + 32]) for i in range(0, 100, 32)]
     smbus.write_i2c_block_data.assert_has_calls(calls)
 
 
+def test_i2c_data_memoryview():
+    serial = i2c(bus=smbus, address=0x3C, bulk=False)
+    data = bytearray(range(40))
+    serial.data(memoryview(data))
+    smbus.write_i2c_block_data.assert_has_calls([
+        call(0x3C, 0x40, list(range(32))), call(0x3C, 0x40, list(range(32, 40)))])
+    for c in smbus.write_i2c_block_data.call_args_list:
+        assert all(isinstance(b, int) for b in c[0][2])
+
+
+def written(mock):
+    return [(msg.addr, list(msg)) for c in mock.call_args_list for msg in c[0]]
+
+
+def test_i2c_bulk_command():
+    cmds = list(range(40))
+    serial = i2c(bus=smbus, address=0x83)
+    assert serial.max_command_length == 4095
+    serial.command(*cmds)
+    assert written(smbus.i2c_rdwr) == [(0x83, [0x00] + cmds)]
+    smbus.write_i2c_block_data.assert_not_called()
+
+
+def test_i2c_bulk_data():
+    data = bytearray(range(256)) * 4
+    serial = i2c(bus=smbus, address=0x21)
+    serial.data(data)
+    smbus.i2c_rdwr.assert_called_once()
+    assert written(smbus.i2c_rdwr) == [(0x21, [0x40] + list(data))]
+
+
+def test_i2c_bulk_data_max_message_size():
+    data = list(range(20))
+    serial = i2c(bus=smbus, address=0x21, max_message_size=8)
+    serial.data(data)
+    smbus.i2c_rdwr.assert_called_once()
+    assert written(smbus.i2c_rdwr) == [
+        (0x21, [0x40] + data[0:7]),
+        (0x21, [0x40] + data[7:14]),
+        (0x21, [0x40] + data[14:20])]
+
+
+def test_i2c_bulk_data_message_limit():
+    data = list(range(100))
+    serial = i2c(bus=smbus, address=0x21, max_message_size=2)
+    serial.data(data)
+    assert [len(c[0]) for c in smbus.i2c_rdwr.call_args_list] == [42, 42, 16]
+    assert written(smbus.i2c_rdwr) == [(0x21, [0x40, n]) for n in data]
+
+
+def test_i2c_bulk_fallback():
+    data = list(range(40))
+    smbus.i2c_rdwr.side_effect = IOError(errno.EOPNOTSUPP, "Operation not supported")
+    serial = i2c(bus=smbus, address=0x66)
+    serial.data(data)
+    assert not serial.bulk
+    assert serial.max_command_length == 32
+    smbus.write_i2c_block_data.assert_has_calls([
+        call(0x66, 0x40, data[0:32]),
+        call(0x66, 0x40, data[32:40])])
+
+    smbus.i2c_rdwr.reset_mock()
+    serial.command(1, 2)
+    smbus.i2c_rdwr.assert_not_called()
+    smbus.write_i2c_block_data.assert_called_with(0x66, 0x00, [1, 2])
+
+
+def test_i2c_bulk_fallback_splits_long_command():
+    def block_write(address, register, data):
+        if len(data) > 32:
+            raise ValueError("Data length cannot exceed 32 bytes")
+
+    smbus.i2c_rdwr.side_effect = IOError(errno.EOPNOTSUPP, "Operation not supported")
+    smbus.write_i2c_block_data.side_effect = block_write
+    serial = i2c(bus=smbus, address=0x3C)
+    cmd = list(range(40))
+    # sized for bulk mode, until the adapter turns out not to support it
+    assert len(cmd) <= serial.max_command_length
+    serial.command(*cmd)
+    assert not serial.bulk
+    assert smbus.write_i2c_block_data.call_args_list == [
+        call(0x3C, 0x00, cmd[0:32]),
+        call(0x3C, 0x00, cmd[32:40])]
+
+
+def test_i2c_bulk_error_propagates():
+    smbus.i2c_rdwr.side_effect = IOError(errno.EREMOTEIO, "Remote I/O error")
+    serial = i2c(bus=smbus, address=0x66)
+    with pytest.raises(IOError):
+        serial.data([1, 2, 3])
+    assert serial.bulk
+    smbus.write_i2c_block_data.assert_not_called()
+
+
 def test_i2c_cleanup():
     serial = i2c(bus=smbus, address=0x9F)
     serial.cleanup()
     smbus.close.assert_called_once()
 
 
+def test_i2c_bus_unbatched():
+    bus = i2c_bus(bus=smbus)
+    serial = i2c(bus=bus, address=0x3C)
+    serial.data([1, 2, 3])
+    assert written(smbus.i2c_rdwr) == [(0x3C, [0x40, 1, 2, 3])]
+
+    smbus.i2c_rdwr.reset_mock()
+    serial = i2c(bus=bus, address=0x3D, bulk=False)
+    serial.command(4, 5)
+    smbus.write_i2c_block_data.assert_called_once_with(0x3D, 0x00, [4, 5])
+    smbus.i2c_rdwr.assert_not_called()
+
+
+def test_i2c_bus_batches_writes_to_several_addresses():
+    bus = i2c_bus(bus=smbus)
+    left = i2c(bus=bus, address=0x3C)
+    right = i2c(bus=bus, address=0x3D, bulk=False)
+    assert left.bus_id == right.bus_id
+
+    with bus.batch():
+        left.command(0x21, 0, 127)
+        left.data([1, 2])
+        with bus.batch():
+            right.command(0xAF)
+        smbus.i2c_rdwr.assert_not_called()
+    smbus.write_i2c_block_data.assert_not_called()
+
+    smbus.i2c_rdwr.assert_called_once()
+    assert written(smbus.i2c_rdwr) == [
+        (0x3C, [0x00, 0x21, 0, 127]),
+        (0x3C, [0x40, 1, 2]),
+        (0x3D, [0x00, 0xAF])]
+
+
+def test_i2c_bus_batch_message_limit():
+    bus = i2c_bus(bus=smbus)
+    serial = i2c(bus=bus, address=0x3C)
+    with bus.batch():
+        for n in range(50):
+            serial.command(n)
+    assert [len(c[0]) for c in smbus.i2c_rdwr.call_args_list] == [42, 8]
+
+
+def test_i2c_bus_batch_falls_back_to_block_writes():
+    bus = i2c_bus(bus=smbus)
+    left = i2c(bus=bus, address=0x3C)
+    right = i2c(bus=bus, address=0x3D)
+    smbus.i2c_rdwr.side_effect = IOError(errno.EOPNOTSUPP, "Operation not supported")
+    with bus.batch():
+        left.command(0xAF)
+        right.data(list(range(40)))
+
+    smbus.i2c_rdwr.assert_called_once()
+    smbus.write_i2c_block_data.assert_has_calls([
+        call(0x3C, 0x00, [0xAF]),
+        call(0x3D, 0x40, list(range(32))),
+        call(0x3D, 0x40, list(range(32, 40)))])
+    assert not bus.bulk
+
+    # and from then on, without trying combined messages first
+    smbus.reset_mock(side_effect=True)
+    with bus.batch():
+        left.command(0xAE)
+    smbus.i2c_rdwr.assert_not_called()
+    smbus.write_i2c_block_data.assert_called_once_with(0x3C, 0x00, [0xAE])
+
+
+def test_i2c_bus_failed_flush_invalidates_devices():
+    bus = i2c_bus(bus=smbus)
+    devices = [ssd1306(i2c(bus=bus, address=address)) for address in (0x3C, 0x3D)]
+    frame = Image.new("1", (128, 64), "white")
+
+    smbus.i2c_rdwr.side_effect = IOError(errno.EREMOTEIO, "Remote I/O error")
+    with pytest.raises(IOError):
+        with bus.batch():
+            for device in devices:
+                device.display(frame)
+
+    # nothing reached the panels, so retrying has to send the frames again
+    smbus.reset_mock(side_effect=True)
+    for device in devices:
+        device.display(frame)
+        assert device.frames_skipped == 0
+    # a window command and the frame's data for each
+    assert sum(len(call[0]) for call in smbus.i2c_rdwr.call_args_list) == 4
+
+
+def test_i2c_bus_effect_runs_while_batch_is_open():
+    bus = i2c_bus(bus=smbus)
+    device = ssd1306(i2c(bus=bus, address=0x3C))
+    smbus.reset_mock()
+    with bus.batch():
+        device.invert(True)
+        # the fade's commands come from another thread, so aren't held up
+        assert device.fade(0, 255, duration=0.02, steps=2).wait(1)
+        assert written(smbus.i2c_rdwr) == [
+            (0x3C, [0x00, 0x81, 0]), (0x3C, [0x00, 0x81, 128]), (0x3C, [0x00, 0x81, 255])]
+
+    assert written(smbus.i2c_rdwr)[-1] == (0x3C, [0x00, 0xA7])
+
+
+def test_i2c_bus_closed_by_last_user():
+    bus = i2c_bus(bus=smbus)
+    serials = [i2c(bus=bus, address=addr) for addr in (0x3C, 0x3D)]
+    serials[0].cleanup()
+    smbus.close.assert_not_called()
+    serials[1].cleanup()
+    smbus.close.assert_called_once()
+
+
+def bus_log(mock):
+    log = []
+    for name, args, kwargs in mock.mock_calls:
+        if name == "write_byte":
+            log.append(("select", args[1]))
+        elif name == "i2c_rdwr":
+            log.extend(("write", msg.addr, list(msg)[:2]) for msg in args)
+        elif name == "write_i2c_block_data":
+            log.append(("block", args[0], [args[1]] + args[2][:1]))
+        elif name == "read_byte_data":
+            log.append(("read", args[0]))
+    return log
+
+
+def test_mux_selects_channel_only_when_changed():
+    mux = tca9548a(bus=smbus, address=0x70)
+    panels = [i2c(bus=mux.channel(n), address=0x3C) for n in (0, 5)]
+    assert panels[0].bus_id == panels[1].bus_id == mux.bus_id
+
+    panels[0].command(0xAF)
+    panels[0].data([1, 2])
+    panels[1].command(0xAE)
+    panels[1].command(0xA6)
+    panels[0].command(0xA7)
+    assert bus_log(smbus) == [
+        ("select", 0x01), ("write", 0x3C, [0x00, 0xAF]), ("write", 0x3C, [0x40, 1]),
+        ("select", 0x20), ("write", 0x3C, [0x00, 0xAE]), ("write", 0x3C, [0x00, 0xA6]),
+        ("select", 0x01), ("write", 0x3C, [0x00, 0xA7])]
+
+    smbus.reset_mock()
+    mux.invalidate()
+    panels[0].command(0xA6)
+    assert bus_log(smbus) == [("select", 0x01), ("write", 0x3C, [0x00, 0xA6])]
+
+
+def test_mux_batch_groups_writes_by_channel():
+    mux = tca9548a(bus=smbus)
+    panels = [i2c(bus=mux.channel(n), address=0x3C, bulk=(n != 2)) for n in range(3)]
+    panels[1].command(0xAF)
+    smbus.reset_mock()
+
+    with mux.batch():
+        for n in range(3):
+            for panel in panels:
+                panel.data([n])
+        smbus.write_byte.assert_not_called()
+
+    # starting with the channel which is already selected
+    assert bus_log(smbus) == [
+        ("write", 0x3C, [0x40, n]) for n in range(3)] + [
+        ("select", 0x01)] + [("write", 0x3C, [0x40, n]) for n in range(3)] + [
+        ("select", 0x04)] + [("block", 0x3C, [0x40, n]) for n in range(3)]
+
+
+def test_mux_reads_flush_queued_writes():
+    mux = tca9548a(bus=smbus)
+    panel = i2c(bus=mux.channel(0), address=0x3C)
+    sensor = mux.channel(7)
+    with mux.batch():
+        panel.command(0xAF)
+        sensor.read_byte_data(0x68, 0x3B)
+        read = smbus2.i2c_msg.read(0x68, 2)
+        sensor.i2c_rdwr(smbus2.i2c_msg.write(0x68, [0x3B]), read)
+        panel.command(0xAE)
+
+    assert bus_log(smbus) == [
+        ("select", 0x01), ("write", 0x3C, [0x00, 0xAF]),
+        ("select", 0x80), ("read", 0x68), ("write", 0x68, [0x3B]), ("write", 0x68, [0, 0]),
+        ("select", 0x01), ("write", 0x3C, [0x00, 0xAE])]
+
+
+def test_mux_batch_falls_back_to_block_writes():
+    mux = tca9548a(bus=smbus)
+    panel = i2c(bus=mux.channel(2), address=0x3C)
+    smbus.i2c_rdwr.side_effect = IOError(errno.EINVAL, "Invalid argument")
+    with mux.batch():
+        panel.data([1, 2])
+    assert bus_log(smbus) == [
+        ("select", 0x04), ("write", 0x3C, [0x40, 1]), ("block", 0x3C, [0x40, 1])]
+
+
+@pytest.mark.parametrize("failing", ["write_byte", "i2c_rdwr"])
+def test_mux_failed_flush_invalidates_devices(failing):
+    mux = tca9548a(bus=smbus)
+    devices = [ssd1306(i2c(bus=mux.channel(n))) for n in range(2)]
+    frame = Image.new("1", (128, 64), "white")
+
+    getattr(smbus, failing).side_effect = IOError(errno.EREMOTEIO, "Remote I/O error")
+    with pytest.raises(IOError):
+        with mux.batch():
+            for device in devices:
+                device.display(frame)
+    assert mux.selected is None
+
+    smbus.reset_mock(side_effect=True)
+    for device in devices:
+        device.display(frame)
+        assert device.frames_skipped == 0
+    assert bus_log(smbus) == [
+        ("select", 0x01), ("write", 0x3C, [0x00, 33]), ("write", 0x3C, [0x40, 0xFF]),
+        ("select", 0x02), ("write", 0x3C, [0x00, 33]), ("write", 0x3C, [0x40, 0xFF])]
+
+
+def test_mux_effect_runs_while_batch_is_open():
+    mux = tca9548a(bus=smbus)
+    device = ssd1306(i2c(bus=mux.channel(0)))
+    other = i2c(bus=mux.channel(1))
+    smbus.reset_mock()
+    with mux.batch():
+        other.command(0xAF)
+        # the fade's commands come from another thread, so aren't held up
+        assert device.fade(0, 255, duration=0.02, steps=2).wait(1)
+        assert bus_log(smbus) == [
+            ("write", 0x3C, [0x00, 0x81]), ("write", 0x3C, [0x00, 0x81]),
+            ("write", 0x3C, [0x00, 0x81])]
+
+    assert bus_log(smbus)[-2:] == [("select", 0x02), ("write", 0x3C, [0x00, 0xAF])]
+
+
+def test_mux_closed_by_last_user():
+    mux = tca9548a(bus=smbus)
+    serials = [i2c(bus=mux.channel(n)) for n in range(2)]
+    serials[0].cleanup()
+    smbus.close.assert_not_called()
+    serials[1].cleanup()
+    smbus.close.assert_called_once()
+
+
 def verify_spi_init(port, device, bus_speed=8000000, dc=24, rst=25):
     spidev.open.assert_called_once_with(port, device)
     assert spidev.max_speed_hz == bus_speed
@@ -84,22 +422,68 @@ def test_spi_init():
     gpio.output.assert_called_once_with(11, gpio.HIGH)
 
 
+def test_spi_bus_speed():
+    serial = spi(gpio=gpio, spi=spidev, port=0, device=0)
+    assert serial.bus_speed_hz == 8000000
+    serial.bus_speed_hz = 16000000
+    assert spidev.max_speed_hz == 16000000
+
+
 def test_spi_command():
     cmds = [3, 1, 4, 2]
     serial = spi(gpio=gpio, spi=spidev, port=9, device=1)
     serial.command(*cmds)
     verify_spi_init(9, 1)
     gpio.output.assert_has_calls([call(25, gpio.HIGH), call(24, gpio.LOW)])
-    spidev.xfer2.assert_called_once_with(cmds)
+    spidev.writebytes2.assert_called_once_with(bytearray(cmds))
 
 
 def test_spi_data():
-    data = list(fib(100))
+    data = bytearray(range(100))
     serial = spi(gpio=gpio, spi=spidev, port=9, device=1)
     serial.data(data)
     verify_spi_init(9, 1)
     gpio.output.assert_has_calls([call(25, gpio.HIGH), call(24, gpio.HIGH)])
-    spidev.xfer2.assert_called_once_with(data)
+    spidev.writebytes2.assert_called_once_with(data)
+    spidev.xfer2.assert_not_called()
+
+
+def test_spi_data_zero_copy():
+    data = bytearray(range(100))
+    serial = spi(gpio=gpio, spi=spidev, port=9, device=1)
+    serial.data(data)
+    buf = spidev.writebytes2.call_args[0][0]
+    data[0] = 0xFF
+    assert buf[0] == 0xFF
+
+
+def test_spi_data_chunked():
+    data = bytes(bytearray(range(256))) * 4
+    serial = spi(gpio=gpio, spi=spidev, port=9, device=1, transfer_size=300)
+    serial.data(memoryview(data)[10:])
+    assert [bytes(c[0][0]) for c in spidev.writebytes2.call_args_list] == [
+        data[10:310], data[310:610], data[610:910], data[910:]]
+
+
+def test_spi_dc_line_cached():
+    serial = spi(gpio=gpio, spi=spidev, port=9, device=1)
+    gpio.reset_mock()
+    serial.command(1)
+    serial.command(2)
+    serial.data([3, 4])
+    serial.data([5])
+    serial.command(6)
+    assert gpio.output.call_args_list == [
+        call(24, gpio.LOW), call(24, gpio.HIGH), call(24, gpio.LOW)]
+
+
+def test_spi_without_writebytes2():
+    legacy = Mock(spec=["open", "xfer2", "close"])
+    serial = spi(gpio=gpio, spi=legacy, port=9, device=1, transfer_size=4)
+    serial.command(3, 1, 4)
+    serial.data(bytearray(range(10)))
+    assert legacy.xfer2.call_args_list == [
+        call([3, 1, 4]), call([0, 1, 2, 3]), call([4, 5, 6, 7]), call([8, 9])]
 
 
 def test_spi_cleanup():
@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 
 try:
-    from unittest.mock import Mock
+    from unittest.mock import call, Mock
 except ImportError:
-    from mock import Mock
+    from mock import call, Mock
+
+import pytest
+from PIL import Image
 
 from oled.device import sh1106
 from oled.render import canvas
@@ -15,12 +18,13 @@ serial = Mock()
 
 def test_display():
     device = sh1106(serial)
+    device.invalidate()
     serial.reset_mock()
 
     recordings = []
 
     def data(data):
-        recordings.append({'data': data})
+        recordings.append({'data': list(data)})
 
     def command(*cmd):
         recordings.append({'command': list(cmd)})
@@ -37,3 +41,115 @@ def test_display():
 
     print(recordings)
     assert recordings == baseline_data.demo_sh1106
+
+
+def test_display_reuses_buffer_per_page():
+    device = sh1106(serial, width=128, height=32)
+    serial.reset_mock()
+    serial.command = Mock()
+    serial.data = Mock()
+
+    for fill in ("white", "black"):
+        device.invalidate()
+        with canvas(device) as draw:
+            draw.rectangle(device.bounding_box, fill=fill)
+
+        assert serial.command.call_count == 4
+        assert serial.data.call_count == 4
+        expected = [0xFF if fill == "white" else 0x00] * 128
+        for page, args in enumerate(serial.command.call_args_list):
+            assert args[0] == (0xB0 + page, 0x02, 0x10)
+        for args in serial.data.call_args_list:
+            assert list(args[0][0]) == expected
+
+        serial.command.reset_mock()
+        serial.data.reset_mock()
+
+
+def test_display_sends_only_changed_window():
+    device = sh1106(serial)
+    serial.command = Mock()
+    serial.data = Mock()
+
+    with canvas(device) as draw:
+        draw.point((5, 9), fill="white")
+        draw.line((100, 60, 103, 60), fill="white")
+
+    # columns are offset by 2 within the SH1106 RAM
+    assert serial.command.call_args_list == [call(0xB1, 0x07, 0x10), call(0xB7, 0x06, 0x16)]
+    assert [bytes(args[0][0]) for args in serial.data.call_args_list] == [b"\x02", b"\x10" * 4]
+
+    serial.command.reset_mock()
+    with canvas(device) as draw:
+        draw.point((5, 9), fill="white")
+        draw.line((100, 60, 103, 60), fill="white")
+
+    serial.command.assert_not_called()
+
+
+def test_display_region():
+    device = sh1106(serial)
+    serial.command = Mock()
+    serial.data = Mock()
+
+    device.display_region(Image.new("1", (20, 5), "white"), (8, 30))
+
+    serial.command.assert_has_calls([call(0xB3, 0x0A, 0x10), call(0xB4, 0x0A, 0x10)])
+    # rows 30-34 fall in pages 3 & 4, leaving the other rows untouched
+    data = [bytearray(args[0][0]) for args in serial.data.call_args_list]
+    assert data == [bytearray([0xC0] * 20), bytearray([0x07] * 20)]
+
+
+def test_display_region_merges_with_existing_content():
+    device = sh1106(serial)
+    with canvas(device) as draw:
+        draw.rectangle(device.bounding_box, fill="white")
+
+    serial.command = Mock()
+    serial.data = Mock()
+    device.display_region(Image.new("1", (1, 2)), (0, 9, 1, 11))
+    assert bytearray(serial.data.call_args[0][0]) == bytearray([0xF9])
+
+    device.invalidate()
+    device.display_region(Image.new("1", (8, 8), "white"), (0, 0))
+    # with no shadow of the display RAM, the whole frame is sent
+    assert sum(len(args[0][0]) for args in serial.data.call_args_list[1:]) == 1024
+
+
+def test_display_numpy_array():
+    numpy = pytest.importorskip("numpy")
+    device = sh1106(serial, width=128, height=32)
+    device.invalidate()
+    serial.data = Mock()
+
+    array = numpy.zeros((32, 128), dtype=bool)
+    array[8:16, :] = True
+    device.display(array)
+
+    data = [bytearray(args[0][0]) for args in serial.data.call_args_list]
+    assert data == [bytearray(128), bytearray([0xFF] * 128), bytearray(128), bytearray(128)]
+
+
+def test_display_raw():
+    device = sh1106(serial, width=128, height=32)
+    serial.data = Mock()
+
+    buf = bytearray(512)
+    buf[130] = 0x81
+    device.display_raw(buf)
+    # only the changed byte is sent, straight from the packed frame
+    assert serial.data.call_args_list == [call(bytearray([0x81]))]
+
+    with pytest.raises(AssertionError):
+        device.display_raw(bytearray(511))
+
+
+def test_display_raw_unchanged_frame_skipped():
+    device = sh1106(serial, width=128, height=32)
+    serial.command = Mock()
+    serial.data = Mock()
+
+    device.display_raw(bytes(bytearray(512)))
+    serial.command.assert_not_called()
+    serial.data.assert_not_called()
+    assert device.frames_skipped == 1
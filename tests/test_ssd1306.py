@@ -5,7 +5,11 @@ try:
 except ImportError:
     from mock import call, Mock
 
+import pytest
+from PIL import Image
+
 from oled.device import ssd1306
+from oled.serial import i2c
 from oled.render import canvas
 import baseline_data
 
@@ -30,7 +34,7 @@ def test_init():
 
     # Next 1024 are all data: zero's to clear the RAM
     # (1024 = 128 * 64 / 8)
-    serial.data.assert_called_once_with([0] * 1024)
+    serial.data.assert_called_once_with(bytes(bytearray(1024)))
 
 
 def test_hide():
@@ -49,6 +53,7 @@ def test_show():
 
 def test_display():
     device = ssd1306(serial)
+    device.invalidate()
     serial.reset_mock()
 
     # Use the same drawing primitives as the demo
@@ -59,4 +64,350 @@ def test_display():
     serial.command.assert_called_once_with(33, 0, 127, 34, 0, 7)
 
     # Next 1024 bytes are data representing the drawn image
-    serial.data.assert_called_once_with(baseline_data.demo_ssd1306)
+    serial.data.assert_called_once_with(bytes(bytearray(baseline_data.demo_ssd1306)))
+
+
+def test_display_sends_only_changed_window():
+    device = ssd1306(serial)
+    serial.reset_mock()
+
+    with canvas(device) as draw:
+        draw.point((0, 0), fill="white")
+        draw.point((100, 57), fill="white")
+
+    # columns are mirrored, so x=0 is held in the rightmost column
+    serial.command.assert_has_calls([
+        call(33, 127, 127, 34, 0, 0),
+        call(33, 27, 27, 34, 7, 7)
+    ])
+    serial.data.assert_has_calls([call(b"\x01"), call(b"\x02")])
+    assert serial.command.call_count == 2
+
+
+def test_display_unchanged_frame_sends_nothing():
+    device = ssd1306(serial)
+    with canvas(device) as draw:
+        baseline_data.primitives(device, draw)
+
+    serial.reset_mock()
+    with canvas(device) as draw:
+        baseline_data.primitives(device, draw)
+
+    serial.command.assert_not_called()
+    serial.data.assert_not_called()
+    assert device.frames_skipped == 1
+
+    device.invalidate()
+    with canvas(device) as draw:
+        baseline_data.primitives(device, draw)
+    serial.data.assert_called_once()
+    assert device.frames_skipped == 1
+
+
+def test_display_unchanged_frame_stops_scroll():
+    device = ssd1306(serial)
+    device.scroll()
+    serial.reset_mock()
+
+    device.display(Image.new("1", (128, 64)))
+    # the scrolled pages are restored, but the frame itself isn't resent
+    serial.command.assert_has_calls([call(0x2E), call(33, 0, 127, 34, 0, 7)])
+    assert serial.command.call_count == 2
+    assert device.frames_skipped == 1
+
+
+def test_display_falls_back_to_full_frame():
+    device = ssd1306(serial)
+    serial.reset_mock()
+
+    with canvas(device) as draw:
+        for x in list(range(0, device.width, 12)) + [device.width - 1]:
+            for y in range(0, device.height, 8):
+                draw.point((x, y), fill="white")
+
+    serial.command.assert_called_once_with(33, 0, 127, 34, 0, 7)
+    assert len(serial.data.call_args[0][0]) == 1024
+
+
+def test_display_region():
+    device = ssd1306(serial)
+    serial.command = Mock()
+    serial.data = Mock()
+
+    device.display_region(Image.new("1", (20, 5), "white"), (8, 30))
+
+    serial.command.assert_called_once_with(33, 100, 119, 34, 3, 4)
+    # rows 30-34 fall in pages 3 & 4, leaving the other rows untouched
+    data = bytearray(serial.data.call_args[0][0])
+    assert data == bytearray([0xC0] * 20 + [0x07] * 20)
+
+
+def test_display_numpy_array():
+    numpy = pytest.importorskip("numpy")
+    device = ssd1306(serial)
+    serial.command = Mock()
+    serial.data = Mock()
+
+    array = numpy.zeros((64, 128), dtype=numpy.uint8)
+    array[0:3, 0:2] = 255
+    device.display(array)
+
+    # the columns are mirrored, so the left edge is at the far end
+    serial.command.assert_called_once_with(33, 126, 127, 34, 0, 0)
+    assert bytearray(serial.data.call_args[0][0]) == bytearray([0x07, 0x07])
+
+
+def test_display_raw_double_buffered():
+    device = ssd1306(serial, width=128, height=32, double_buffer=True)
+    serial.reset_mock()
+
+    frame = bytes(bytearray([0xAA]) * 512)
+    device.display_raw(frame)
+    serial.command.assert_has_calls([call(33, 0, 127, 34, 0, 3), call(0x40)])
+    assert bytes(serial.data.call_args[0][0]) == frame
+
+
+def test_display_region_merges_with_existing_content():
+    device = ssd1306(serial)
+    with canvas(device) as draw:
+        draw.rectangle(device.bounding_box, fill="white")
+
+    serial.command = Mock()
+    serial.data = Mock()
+    device.display_region(Image.new("1", (1, 2)), (0, 9, 1, 11))
+    assert bytearray(serial.data.call_args[0][0]) == bytearray([0xF9])
+
+    device.invalidate()
+    device.display_region(Image.new("1", (8, 8), "white"), (0, 0))
+    # with no shadow of the display RAM, the whole frame is sent
+    assert sum(len(args[0][0]) for args in serial.data.call_args_list[1:]) == 1024
+
+
+def test_scroll():
+    device = ssd1306(serial)
+    serial.reset_mock()
+
+    device.scroll()
+    # the columns are mirrored, so scrolling left is a right scroll in RAM
+    serial.command.assert_called_once_with(0x26, 0, 0, 7, 7, 0, 0xFF, 0x2F)
+
+    serial.reset_mock()
+    device.scroll("right", start_page=2, end_page=3, interval=25)
+    # stops the previous scroll first, restoring the RAM that it shifted
+    assert serial.command.call_args_list[0] == call(0x2E)
+    assert serial.command.call_args_list[-1] == call(0x27, 0, 2, 6, 3, 0, 0xFF, 0x2F)
+
+
+def test_scroll_vertical():
+    device = ssd1306(serial)
+    serial.reset_mock()
+
+    device.scroll("left", interval=5, vertical_offset=1)
+    serial.command.assert_called_once_with(0xA3, 0, 64, 0x29, 0, 0, 0, 7, 1, 0x2F)
+
+
+def test_scroll_unsupported():
+    device = ssd1306(serial)
+    with pytest.raises(ValueError):
+        device.scroll(interval=7)
+    with pytest.raises(ValueError):
+        device.scroll("up")
+
+
+def test_stop_scroll_restores_display_ram():
+    device = ssd1306(serial)
+    with canvas(device) as draw:
+        draw.rectangle((0, 16, 127, 23), fill="white")
+
+    device.scroll(start_page=2, end_page=2)
+    serial.reset_mock()
+    device.stop_scroll()
+    serial.command.assert_has_calls([call(0x2E), call(33, 0, 127, 34, 2, 2)])
+    serial.data.assert_called_once_with(b"\xff" * 128)
+
+    serial.reset_mock()
+    device.stop_scroll()
+    serial.command.assert_called_once_with(0x2E)
+    serial.data.assert_not_called()
+
+
+def test_display_stops_scroll():
+    device = ssd1306(serial)
+    device.scroll(vertical_offset=3)
+    serial.reset_mock()
+
+    with canvas(device) as draw:
+        draw.point((0, 0), fill="white")
+
+    serial.command.assert_has_calls([
+        call(0x2E, 0x40),
+        call(33, 0, 127, 34, 0, 7),
+        call(33, 127, 127, 34, 0, 0)
+    ])
+
+
+def test_init_128x32_double_buffered():
+    ssd1306(serial, width=128, height=32, double_buffer=True)
+    serial.command.assert_has_calls([
+        call(174, 213, 128, 168, 31, 211, 0, 64, 141, 20, 32, 0, 160,
+             200, 218, 2, 129, 207, 217, 241, 219, 64, 164, 166),
+        # clear the hidden half of the display RAM, then flip to it
+        call(33, 0, 127, 34, 4, 7),
+        call(0x60),
+        call(175)
+    ])
+    serial.data.assert_called_once_with(bytes(bytearray(512)))
+
+
+def test_double_buffer_requires_spare_rows():
+    with pytest.raises(AssertionError):
+        ssd1306(serial, double_buffer=True)
+
+
+def test_double_buffer_flips_between_halves():
+    device = ssd1306(serial, width=128, height=32, double_buffer=True)
+    serial.reset_mock()
+
+    alert = Image.new("1", (128, 32), "white")
+    device.display(alert)
+    serial.command.assert_has_calls([call(33, 0, 127, 34, 0, 3), call(0x40)])
+
+    # switching between two frames already in the display RAM is just a flip
+    for frame, start_line in ((Image.new("1", (128, 32)), 0x60), (alert, 0x40)):
+        serial.reset_mock()
+        device.display(frame)
+        serial.command.assert_called_once_with(start_line)
+        serial.data.assert_not_called()
+
+    serial.reset_mock()
+    device.display(alert)
+    serial.command.assert_not_called()
+    assert device.frames_skipped == 1
+
+    device.flip()
+    serial.command.assert_called_once_with(0x60)
+
+
+def test_double_buffer_flip_needs_a_hidden_frame():
+    device = ssd1306(serial, width=128, height=32, double_buffer=True)
+    # the other half of the display RAM has never been written
+    with pytest.raises(AssertionError):
+        device.flip()
+
+    device.display(Image.new("1", (128, 32), "white"))
+    device.invalidate()
+    with pytest.raises(AssertionError):
+        device.flip()
+
+
+def test_double_buffer_failed_write_keeps_front_half():
+    device = ssd1306(serial, width=128, height=32, double_buffer=True)
+    device.display(Image.new("1", (128, 32), "white"))
+    frame = Image.new("1", (128, 32))
+    frame.putpixel((0, 0), 255)
+
+    serial.reset_mock()
+    serial.data.side_effect = IOError("Remote I/O error")
+    with pytest.raises(IOError):
+        device.display(frame)
+    # nothing was flipped, and the rows being shown were left alone
+    serial.command.assert_called_once_with(33, 127, 127, 34, 4, 4)
+    assert device._page_offset == device._front == 0
+
+    # the hidden half is no longer known, so it is written in full
+    serial.reset_mock(side_effect=True)
+    device.display(frame)
+    serial.command.assert_has_calls([call(33, 0, 127, 34, 4, 7), call(0x60)])
+    with pytest.raises(AssertionError):
+        device.flip()
+
+
+def test_double_buffer_flip_stops_scroll():
+    device = ssd1306(serial, width=128, height=32, double_buffer=True)
+    device.display(Image.new("1", (128, 32), "white"))
+    device.scroll()
+    serial.reset_mock()
+
+    device.flip()
+    assert serial.command.call_args_list[0] == call(0x2E)
+    assert serial.command.call_args_list[-1] == call(0x60)
+
+
+def test_double_buffer_display_region():
+    device = ssd1306(serial, width=128, height=32, double_buffer=True)
+    with canvas(device) as draw:
+        draw.point((0, 0), fill="white")
+
+    serial.reset_mock()
+    device.display_region(Image.new("1", (1, 1), "white"), (1, 0))
+    # the hidden half is brought up to date with both points before flipping
+    serial.command.assert_has_calls([call(33, 126, 127, 34, 4, 4), call(0x60)])
+    serial.data.assert_called_once_with(b"\x01\x01")
+
+    # redrawing the same point changes nothing, so is skipped
+    serial.reset_mock()
+    skipped = device.frames_skipped
+    device.display_region(Image.new("1", (1, 1), "white"), (1, 0))
+    serial.command.assert_not_called()
+    serial.data.assert_not_called()
+    assert device.frames_skipped == skipped + 1
+
+
+def test_double_buffer_scroll():
+    device = ssd1306(serial, width=128, height=32, double_buffer=True)
+    serial.reset_mock()
+    device.scroll(start_page=1, end_page=2)
+    serial.command.assert_called_once_with(0x26, 0, 5, 7, 6, 0, 0xFF, 0x2F)
+    with pytest.raises(ValueError):
+        device.scroll(vertical_offset=1)
+
+
+def test_batch_coalesces_commands():
+    device = ssd1306(serial)
+    serial.reset_mock()
+
+    with device.batch():
+        device.contrast(0x20)
+        with device.batch():
+            device.invert(True)
+        device.hide()
+        serial.command.assert_not_called()
+
+    serial.command.assert_called_once_with(0x81, 0x20, 0xA7, 0xAE)
+
+
+def test_batch_sends_commands_ahead_of_data():
+    device = ssd1306(serial)
+    serial.reset_mock()
+    recordings = []
+    serial.command.side_effect = lambda *cmd: recordings.append(cmd)
+    serial.data.side_effect = lambda data: recordings.append(bytes(data))
+
+    with device.batch():
+        device.contrast(0x20)
+        with canvas(device) as draw:
+            draw.point((0, 0), fill="white")
+        device.invert(True)
+        device.flush()
+        device.show()
+
+    assert recordings == [(0x81, 0x20, 33, 127, 127, 34, 0, 0), b"\x01", (0xA7,), (0xAF,)]
+
+
+def test_commands_split_to_serial_interface_limit():
+    smbus = Mock()
+    device = ssd1306(i2c(bus=smbus, bulk=False))
+    smbus.reset_mock()
+
+    device.command(*range(40))
+    with device.batch():
+        for n in range(70):
+            device.command(n)
+
+    smbus.write_i2c_block_data.assert_has_calls([
+        call(0x3C, 0x00, list(range(32))),
+        call(0x3C, 0x00, list(range(32, 40))),
+        call(0x3C, 0x00, list(range(32))),
+        call(0x3C, 0x00, list(range(32, 64))),
+        call(0x3C, 0x00, list(range(64, 70)))
+    ])
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+import threading
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+import pytest
+from PIL import Image
+
+from oled.render import canvas
+from oled.threaded import threaded
+
+
+class slow_device(object):
+    """
+    Stand-in device whose display blocks until released.
+    """
+    mode = "1"
+    width = 32
+    height = 16
+
+    def __init__(self):
+        self.frames = []
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def display(self, image):
+        self.started.set()
+        self.release.wait(5)
+        self.frames.append(image)
+
+    def display_raw(self, buf):
+        self.frames.append(buf)
+
+    def contrast(self, level):
+        self.calls.append(("contrast", level, len(self.frames)))
+
+
+def test_display_returns_immediately():
+    device = slow_device()
+    wrapper = threaded(device)
+    with canvas(wrapper) as draw:
+        draw.point((1, 1), fill="white")
+
+    assert device.started.wait(5)
+    assert device.frames == []
+    device.release.set()
+    wrapper.flush()
+    assert len(device.frames) == 1
+    assert device.frames[0].getpixel((1, 1)) == 255
+    assert (wrapper.sent, wrapper.dropped) == (1, 0)
+    wrapper.close()
+
+
+def test_latest_frame_wins():
+    device = slow_device()
+    wrapper = threaded(device)
+    first = Image.new("1", (32, 16))
+    wrapper.display(first)
+    assert device.started.wait(5)
+
+    # the first frame is being sent, so only the last of these survives
+    frames = [Image.new("1", (32, 16), n) for n in (0, 255, 0, 255)]
+    for frame in frames:
+        wrapper.display(frame)
+
+    device.release.set()
+    wrapper.flush()
+    assert len(device.frames) == 2
+    assert device.frames[1].getpixel((0, 0)) == 255
+    assert (wrapper.sent, wrapper.dropped) == (2, 3)
+    wrapper.close()
+
+
+def test_frame_is_copied():
+    device = slow_device()
+    device.release.set()
+    wrapper = threaded(device)
+    image = Image.new("1", (32, 16))
+    wrapper.display(image)
+    image.putpixel((0, 0), 255)
+    wrapper.flush()
+    assert device.frames[0].getpixel((0, 0)) == 0
+
+    buf = bytearray(64)
+    wrapper.display_raw(buf)
+    buf[0] = 1
+    wrapper.flush()
+    assert device.frames[1] == bytearray(64)
+    wrapper.close()
+
+
+def test_other_calls_wait_for_pending_frame():
+    device = slow_device()
+    wrapper = threaded(device)
+    wrapper.display(Image.new("1", (32, 16)))
+    assert device.started.wait(5)
+    threading.Timer(0.05, device.release.set).start()
+
+    wrapper.contrast(0x30)
+    assert device.calls == [("contrast", 0x30, 1)]
+    assert wrapper.width == 32
+    wrapper.close()
+
+
+def test_errors_are_raised_on_next_call():
+    device = Mock(mode="1", width=32, height=16)
+    device.display.side_effect = IOError("bus error")
+    wrapper = threaded(device)
+    wrapper.display(Image.new("1", (32, 16)))
+    with pytest.raises(IOError):
+        wrapper.flush()
+
+    wrapper.flush()
+    assert wrapper.sent == 0
+    wrapper.close()
+
+
+def test_close_sends_pending_frame():
+    device = slow_device()
+    wrapper = threaded(device)
+    wrapper.display(Image.new("1", (32, 16)))
+    assert device.started.wait(5)
+    wrapper.display(Image.new("1", (32, 16), 255))
+    device.release.set()
+    wrapper.close()
+
+    assert len(device.frames) == 2
+    assert not wrapper._thread.is_alive()
+    with pytest.raises(AssertionError):
+        wrapper.display(Image.new("1", (32, 16)))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+
+from oled import timing
+from oled.render import canvas
+import baseline_data
+
+
+def full_frame(device):
+    device.invalidate()
+    device.display(Image.new("1", (device.width, device.height), "white"))
+    return device.frame_time
+
+
+@pytest.mark.parametrize("transport", ["i2c", "spi"])
+@pytest.mark.parametrize("chip", ["ssd1306", "sh1106"])
+def test_controller_shows_frame(chip, transport):
+    device = timing.create(chip, transport)
+    with canvas(device) as draw:
+        baseline_data.primitives(device, draw)
+
+    expected = Image.new("1", (device.width, device.height))
+    baseline_data.primitives(device, ImageDraw.Draw(expected))
+    assert ImageChops.difference(device.bus.controller.image(), expected).getbbox() is None
+
+
+def test_i2c_timing_scales_with_clock():
+    slow = full_frame(timing.create(speed_hz=100000))
+    fast = full_frame(timing.create(speed_hz=400000))
+    # 1024 bytes at 9 clock cycles each dominate the frame time
+    assert 1024 * 9 / 100000.0 < slow < 1.1 * 1024 * 9 / 100000.0
+    assert 3.5 < slow / fast < 4.0
+
+
+def test_i2c_transaction_overhead():
+    bus = timing.smbus(Mock(), speed_hz=100000, overhead=0.001)
+    bus.write_i2c_block_data(0x3C, 0x00, [1, 2, 3])
+    # start + (address, control and 3 payload bytes) + stop
+    assert bus.busy_time == pytest.approx(0.001 + (2 + 9 * 5) / 100000.0)
+    assert bus.transactions == 1
+    bus.controller.command.assert_called_once_with(1, 2, 3)
+
+    bus.i2c_rdwr(b"\x40\x01", b"\x40\x02\x03")
+    assert bus.transactions == 2
+    assert bus.bytes == 4 + 2 + 3
+    assert bus.controller.data.call_count == 2
+
+
+def test_spi_timing_and_dc_toggles():
+    device = timing.create(transport="spi", speed_hz=8000000)
+    device.reset_counts()
+    frame_time = full_frame(device)
+    assert frame_time > 1024 * 8 / 8000000.0
+    assert frame_time < full_frame(timing.create(speed_hz=1000000))
+
+    bus = timing.spidev(Mock(), overhead=0, dc_overhead=0.5)
+    bus.gpio.output(25, bus.gpio.HIGH)
+    assert bus.busy_time == 0
+    bus.gpio.output(24, bus.gpio.HIGH)
+    bus.writebytes2(b"\x01\x02")
+    assert bus.busy_time == pytest.approx(0.5 + 16 / 8000000.0)
+    bus.controller.data.assert_called_once_with(bytearray(b"\x01\x02"))
+
+
+def test_predicted_fps_and_utilization():
+    device = timing.create(speed_hz=100000)
+    device.reset_counts()
+    assert device.predicted_fps == 0
+    for n in range(3):
+        full_frame(device)
+    assert device.frames == 3
+    assert device.predicted_fps == pytest.approx(3 / device.bus.busy_time)
+    assert 0 < device.utilization <= 1
+
+
+def test_throttle_waits_for_bus(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(timing.time, "sleep", sleeps.append)
+    device = timing.create(speed_hz=100000, throttle=True)
+    full_frame(device)
+    assert sleeps and max(sleeps) <= device.frame_time + 0.05
+
+
+def test_emulator_is_shown_panel_contents():
+    emulator = Mock(mode="RGB")
+    device = timing.create(emulator=emulator)
+    device.display(Image.new("1", (128, 64), "white"))
+    image = emulator.display.call_args[0][0]
+    assert image.mode == "RGB"
+    assert image.getpixel((5, 5)) == (255, 255, 255)
+
+
+def test_unsupported_transport():
+    with pytest.raises(ValueError):
+        timing.create(transport="parallel")
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+
+import oled.device
+import oled.virtual
+from oled.render import canvas
+
+import baseline_data
+
+chips = [(oled.device.ssd1306, oled.virtual.ssd1306),
+         (oled.device.sh1106, oled.virtual.sh1106)]
+
+
+def same(a, b):
+    return ImageChops.difference(a.convert("L"), b.convert("L")).getbbox() is None
+
+
+def demo_image(device):
+    image = Image.new("1", (device.width, device.height))
+    baseline_data.primitives(device, ImageDraw.Draw(image))
+    return image
+
+
+@pytest.mark.parametrize("driver,virtual", chips)
+@pytest.mark.parametrize("size", [(128, 64), (128, 32)])
+def test_screen_matches_image(driver, virtual, size):
+    controller = virtual(*size)
+    device = driver(controller, *size)
+    assert controller.display_on
+    assert same(controller.image(), Image.new("1", size))
+
+    image = demo_image(device)
+    device.display(image)
+    assert same(controller.image(), image)
+
+    # only the changes are sent for the next frame
+    controller.reset_counts()
+    image.putpixel((5, 5), 255)
+    device.display(image)
+    assert same(controller.image(), image)
+    assert 0 < controller.data_bytes <= 8
+
+    controller.reset_counts()
+    device.display(image)
+    assert controller.data_bytes == 0
+
+
+@pytest.mark.parametrize("driver,virtual", chips)
+def test_display_region(driver, virtual):
+    controller = virtual()
+    device = driver(controller)
+    image = demo_image(device)
+    device.display(image)
+
+    patch = Image.new("1", (20, 5), "white")
+    device.display_region(patch, (8, 30))
+    image.paste(patch, (8, 30))
+    assert same(controller.image(), image)
+
+
+@pytest.mark.parametrize("driver,virtual", chips)
+def test_failed_frame_is_resent_in_full(driver, virtual):
+    controller = virtual()
+    device = driver(controller)
+    blank = Image.new("1", (128, 64))
+    image = demo_image(device)
+    receive = controller.data
+
+    def data(buf):
+        # the transfer fails part way through
+        receive(buf[:len(buf) // 2])
+        raise IOError("Remote I/O error")
+
+    controller.data = data
+    with pytest.raises(IOError):
+        device.display(image)
+    controller.data = receive
+
+    device.display(blank)
+    assert same(controller.image(), blank)
+    device.display(image)
+    assert same(controller.image(), image)
+
+
+def test_invert_and_hide():
+    controller = oled.virtual.ssd1306()
+    device = oled.device.ssd1306(controller)
+    device.invert(True)
+    assert same(controller.image(), Image.new("1", (128, 64), "white"))
+    device.hide()
+    assert same(controller.image(), Image.new("1", (128, 64)))
+    device.contrast(0x20)
+    assert controller.contrast == 0x20
+
+
+def test_double_buffering():
+    controller = oled.virtual.ssd1306(128, 32)
+    device = oled.device.ssd1306(controller, 128, 32, double_buffer=True)
+    frames = [demo_image(device), Image.new("1", (128, 32), "white")]
+    for frame in frames + frames:
+        device.display(frame)
+        assert same(controller.image(), frame)
+
+    device.flip()
+    assert same(controller.image(), frames[0])
+
+
+def test_scroll_and_stop_scroll():
+    controller = oled.virtual.ssd1306()
+    device = oled.device.ssd1306(controller)
+    image = Image.new("1", (128, 64))
+    image.putpixel((10, 3), 255)
+    image.putpixel((10, 40), 255)
+    device.display(image)
+
+    device.scroll("left", start_page=0, end_page=0)
+    controller.tick(3)
+    scrolled = controller.image()
+    assert scrolled.getpixel((7, 3)) == 255
+    assert scrolled.getpixel((10, 40)) == 255
+
+    device.stop_scroll()
+    assert same(controller.image(), image)
+
+    device.scroll("right", vertical_offset=1)
+    controller.tick(2)
+    scrolled = controller.image()
+    assert scrolled.getpixel((12, 1)) == 255
+    device.stop_scroll()
+    assert same(controller.image(), image)
+
+
+def test_parameters_split_across_calls():
+    controller = oled.virtual.ssd1306()
+    controller.command(0x20, 0x00, 0x21)
+    controller.command(4, 5, 0x22, 1)
+    controller.command(2)
+    controller.data(bytearray([1, 2, 3, 4, 5]))
+    assert controller.addressing_mode == 0
+    ram = controller.ram
+    # the fifth byte wraps back around to the start of the window
+    assert list(ram[128 + 4:128 + 6]) == [5, 2]
+    assert list(ram[256 + 4:256 + 6]) == [3, 4]
+    assert controller.transactions == 4
+    assert (controller.command_bytes, controller.data_bytes) == (8, 5)
+
+
+def test_canvas_on_sh1106_column_offset():
+    controller = oled.virtual.sh1106()
+    device = oled.device.sh1106(controller)
+    with canvas(device) as draw:
+        draw.point((0, 0), fill="white")
+    assert controller.ram[2] == 0x01
+    assert controller.image().getpixel((0, 0)) == 255